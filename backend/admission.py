@@ -0,0 +1,272 @@
+"""
+Admission control and per-access-code rate limiting
+Generation requests take one of a fixed number of in-flight slots shared by
+every worker, and each access code draws from its own token bucket. Both
+live in SQLite so the limits hold across gunicorn processes; requests over
+either limit get a fast 429 with Retry-After instead of queueing until the
+worker timeout.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from flask import jsonify
+from config import Config
+from local_store import get_connection, immediate_transaction, pid_alive
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_DB = 'admission.db'
+
+
+def _code_id(code):
+    """Buckets are keyed by a hash so access codes are never written to disk"""
+    return hashlib.sha256(code.encode('utf-8')).hexdigest()[:32]
+
+
+_schema_ready = False
+
+
+def _conn():
+    global _schema_ready
+    conn = get_connection(ADMISSION_DB)
+    if not _schema_ready:
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS admission_slots ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, pid INTEGER NOT NULL, acquired_at REAL NOT NULL)'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS rate_buckets ('
+            'code_id TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)'
+        )
+        _schema_ready = True
+    return conn
+
+
+class AdmissionController:
+    """
+    Bounded number of generation requests in flight across all workers
+
+    Args:
+        max_in_flight: Slots shared by every process on the instance
+        retry_after: Seconds suggested to rejected clients
+        slot_ttl_seconds: Age after which a slot is reclaimed even if its
+            owner never released it
+    """
+
+    def __init__(self, enabled=True, max_in_flight=8, retry_after=3, slot_ttl_seconds=300):
+        self.enabled = enabled
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self.slot_ttl_seconds = slot_ttl_seconds
+        self._lock = threading.Lock()
+        self._stats = {'admitted': 0, 'rejected': 0, 'reclaimed': 0}
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _reclaim(self, conn, now):
+        """Drop slots held by dead workers or older than the TTL"""
+        removed = conn.execute(
+            'DELETE FROM admission_slots WHERE acquired_at < ?', (now - self.slot_ttl_seconds,)
+        ).rowcount
+        for (pid,) in conn.execute('SELECT DISTINCT pid FROM admission_slots').fetchall():
+            if pid != os.getpid() and not pid_alive(pid):
+                removed += conn.execute('DELETE FROM admission_slots WHERE pid = ?', (pid,)).rowcount
+        if removed:
+            self._count('reclaimed', removed)
+
+    def acquire(self, count=1):
+        """
+        Take count slots, for a request that keeps that many upstream calls in flight
+
+        Returns:
+            int or None: Slot id to pass to release() (with the same count), or
+            None when full. Storage errors admit the request (id 0) rather than failing it.
+        """
+        if not self.enabled:
+            return 0
+        now = time.time()
+        try:
+            conn = _conn()
+            with immediate_transaction(conn):
+                in_flight = conn.execute('SELECT COUNT(*) FROM admission_slots').fetchone()[0]
+                if in_flight + count > self.max_in_flight:
+                    self._reclaim(conn, now)
+                    in_flight = conn.execute('SELECT COUNT(*) FROM admission_slots').fetchone()[0]
+                if in_flight + count > self.max_in_flight:
+                    self._count('rejected')
+                    return None
+                # Ids are consecutive: the write lock is held and the key is AUTOINCREMENT
+                slot_id = None
+                for _ in range(count):
+                    last_id = conn.execute(
+                        'INSERT INTO admission_slots (pid, acquired_at) VALUES (?, ?)', (os.getpid(), now)
+                    ).lastrowid
+                    slot_id = slot_id or last_id
+        except sqlite3.Error as e:
+            logger.warning('Admission slot acquire failed, admitting: %s', e)
+            return 0
+        self._count('admitted')
+        return slot_id
+
+    def release(self, slot_id, count=1):
+        if not slot_id:
+            return
+        try:
+            _conn().execute('DELETE FROM admission_slots WHERE id >= ? AND id < ?', (slot_id, slot_id + count))
+        except sqlite3.Error as e:
+            logger.warning('Admission slot release failed: %s', e)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['enabled'] = self.enabled
+        stats['max_in_flight'] = self.max_in_flight
+        try:
+            stats['in_flight'] = _conn().execute('SELECT COUNT(*) FROM admission_slots').fetchone()[0]
+        except sqlite3.Error:
+            stats['in_flight'] = None
+        return stats
+
+
+class RateLimiter:
+    """
+    Token bucket per access code, refilled continuously
+
+    Args:
+        quotas: {access code: (requests per minute, burst size)}
+    """
+
+    def __init__(self, quotas, enabled=True):
+        self.enabled = enabled
+        self.quotas = quotas
+        self._lock = threading.Lock()
+        self._stats = {'allowed': 0, 'limited': 0}
+
+    def consume(self, code, cost=1):
+        """
+        Take cost tokens from the code's bucket
+
+        Returns:
+            float: 0 when allowed, otherwise seconds until enough tokens refill
+        """
+        quota = self.quotas.get(code)
+        if not self.enabled or quota is None:
+            return 0
+        per_minute, burst = quota
+        rate = per_minute / 60.0
+        now = time.time()
+        try:
+            conn = _conn()
+            with immediate_transaction(conn):
+                row = conn.execute(
+                    'SELECT tokens, updated_at FROM rate_buckets WHERE code_id = ?', (_code_id(code),)
+                ).fetchone()
+                tokens = burst if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate)
+                allowed = tokens >= cost
+                if allowed:
+                    tokens -= cost
+                conn.execute(
+                    'INSERT OR REPLACE INTO rate_buckets (code_id, tokens, updated_at) VALUES (?, ?, ?)',
+                    (_code_id(code), tokens, now)
+                )
+        except sqlite3.Error as e:
+            logger.warning('Rate limit check failed, allowing: %s', e)
+            return 0
+
+        with self._lock:
+            self._stats['allowed' if allowed else 'limited'] += 1
+        if allowed:
+            return 0
+        if rate <= 0 or cost > burst:
+            return 60.0
+        return (cost - tokens) / rate
+
+    def refund(self, code, cost=1):
+        """Give back tokens taken for a request that was then rejected without doing any work"""
+        quota = self.quotas.get(code)
+        if not self.enabled or quota is None:
+            return
+        per_minute, burst = quota
+        now = time.time()
+        try:
+            conn = _conn()
+            with immediate_transaction(conn):
+                row = conn.execute(
+                    'SELECT tokens, updated_at FROM rate_buckets WHERE code_id = ?', (_code_id(code),)
+                ).fetchone()
+                if row is not None:
+                    tokens = min(burst, row[0] + max(0.0, now - row[1]) * per_minute / 60.0 + cost)
+                    conn.execute(
+                        'UPDATE rate_buckets SET tokens = ?, updated_at = ? WHERE code_id = ?',
+                        (tokens, now, _code_id(code))
+                    )
+        except sqlite3.Error as e:
+            logger.warning('Rate limit refund failed: %s', e)
+
+    def consume_fan_out(self, code, calls):
+        """
+        Charge a request that fans out into several upstream calls (batches,
+        calendars, chunked documents). require_auth already took one token;
+        each extra call costs one more, capped so that a whole request never
+        costs more than a full bucket and any request size can eventually run.
+        A rejected request also gets its require_auth token back.
+
+        Returns:
+            float: 0 when allowed, otherwise seconds until enough tokens refill
+        """
+        quota = self.quotas.get(code)
+        if not self.enabled or quota is None or calls <= 1:
+            return 0
+        extra = min(calls - 1, max(0, int(quota[1]) - 1))
+        if extra <= 0:
+            return 0
+        wait = self.consume(code, extra)
+        if wait:
+            self.refund(code)
+        return wait
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['enabled'] = self.enabled
+        stats['access_codes'] = len(self.quotas)
+        return stats
+
+
+def too_many_requests(error, message, retry_after):
+    """429 response in the API's error format with a Retry-After header"""
+    response = jsonify({
+        'success': False,
+        'error': error,
+        'message': message
+    })
+    response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+    return response, 429
+
+
+def fan_out_rejection(code, calls, message):
+    """
+    Charge a request that is about to make `calls` upstream calls (see RateLimiter.consume_fan_out)
+
+    Returns:
+        429 response tuple, or None when the request may go ahead
+    """
+    wait = rate_limiter.consume_fan_out(code, calls)
+    if not wait:
+        return None
+    return too_many_requests('Rate limit exceeded', message, wait)
+
+
+admission = AdmissionController(
+    enabled=Config.ADMISSION_ENABLED,
+    max_in_flight=Config.ADMISSION_MAX_IN_FLIGHT,
+    retry_after=Config.ADMISSION_RETRY_AFTER,
+    slot_ttl_seconds=Config.ADMISSION_SLOT_TTL_SECONDS
+)
+
+rate_limiter = RateLimiter(Config.ACCESS_CODES, enabled=Config.RATE_LIMIT_ENABLED)
@@ -1,6 +1,14 @@
 """
 RockMa AI Persona - Brand Voice and System Prompts
 Based on PRD requirements for "Mama's Love" persona
+
+Prompts are laid out for OpenAI's prompt-prefix cache: the system message is
+static (persona, inventory, platform/audience guidelines, then the route's
+task instructions) and everything that varies per request goes in the user
+message after it
+
+These functions build the prompt text from the definitions below; request
+handlers read the precompiled copies in prompt_registry instead
 """
 
 # Product Inventory (from PRD v3.1)
@@ -45,6 +53,64 @@ BRAND_VOICE = {
     "target_audience": "Women (ages 25-50), often mothers, who are health-conscious and value organic, clean products, wellness, and inspirational messaging. Research-oriented, valuing brands that offer transparency, effectiveness and ethical practices."
 }
 
+# Platform-specific guidelines
+PLATFORM_GUIDELINES = {
+    "TikTok": {
+        "format": "Short, punchy, engaging. Use hooks that grab attention in first 3 seconds. Include trending elements when appropriate.",
+        "length": "Very concise (1-2 sentences for hook, 2-4 sentences for body)",
+        "tone": "Energetic, authentic, relatable"
+    },
+    "Instagram": {
+        "format": "Visual-first thinking. Include emojis strategically. Hashtags are important (5-10). Story-style captions work well.",
+        "length": "Medium length (2-3 sentences for hook, 3-5 sentences for body)",
+        "tone": "Inspirational, aspirational, community-focused"
+    },
+    "LinkedIn": {
+        "format": "Professional storytelling. Business value and insights. Personal narrative with business lessons. Strong opening hook.",
+        "length": "Medium to long form (2-3 sentences for hook, 4-6 sentences for body)",
+        "tone": "Professional, authentic, thought-leadership"
+    },
+    "Facebook Ad": {
+        "format": "Clear value proposition. Strong call-to-action. Benefit-focused. Professional but warm.",
+        "length": "Concise but complete (1-2 sentences for hook, 3-4 sentences for body)",
+        "tone": "Trustworthy, professional, value-driven"
+    },
+    "Email": {
+        "format": "Personal, conversational. Can be longer form. Clear structure with greeting and sign-off.",
+        "length": "Longer form (2-3 sentences for hook, 4-6 sentences for body)",
+        "tone": "Personal, warm, relationship-building"
+    },
+    "YouTube": {
+        "format": "Engaging hook, clear structure. Can include questions to encourage engagement. Longer form content.",
+        "length": "Longer form (2-3 sentences for hook, 5-8 sentences for body)",
+        "tone": "Educational, engaging, community-focused"
+    }
+}
+
+# Audience-specific guidelines
+AUDIENCE_GUIDELINES = {
+    "Core Moms 25-50": {
+        "focus": "Emphasize family, health, wellness, time-saving, quality, trust",
+        "language": "Relatable, warm, understanding of busy mom life",
+        "values": "Clean ingredients, safety, family wellness, ethical production"
+    },
+    "Gen-Z": {
+        "focus": "Authenticity, sustainability, social impact, trends, values",
+        "language": "Casual, direct, trend-aware, values-driven",
+        "values": "Sustainability, ethical practices, transparency, social responsibility"
+    },
+    "Wellness Enthusiasts": {
+        "focus": "Health benefits, ingredients, science-backed, holistic wellness",
+        "language": "Educational, detailed, health-focused, ingredient-aware",
+        "values": "Clean ingredients, organic certification, health benefits, natural solutions"
+    },
+    "B2B": {
+        "focus": "Partnership opportunities, wholesale, business value, professional relationships",
+        "language": "Professional, value-focused, partnership-oriented",
+        "values": "Quality, reliability, business growth, partnership potential"
+    }
+}
+
 def get_base_system_prompt():
     """
     Returns the base system prompt for RockMa AI Persona
@@ -76,6 +142,34 @@ PRODUCT INVENTORY:
 
 Your role is to create content that feels authentic, warm, and inspiring - like a caring note from a mother. Always emphasize the brand's commitment to clean, organic, ethically-made products and the personal, family-owned nature of the business."""
 
+def get_guidelines_prompt():
+    """Returns the platform and audience guidelines as a static reference block"""
+    platform_lines = "\n".join(
+        f"- {platform}: Format: {rules['format']} Length: {rules['length']}. Tone: {rules['tone']}."
+        for platform, rules in PLATFORM_GUIDELINES.items()
+    )
+    audience_lines = "\n".join(
+        f"- {audience}: Focus: {rules['focus']}. Language: {rules['language']}. Values: {rules['values']}."
+        for audience, rules in AUDIENCE_GUIDELINES.items()
+    )
+    return f"""PLATFORM GUIDELINES:
+{platform_lines}
+
+AUDIENCE GUIDELINES:
+{audience_lines}"""
+
+def build_system_prompt(task_instructions=""):
+    """
+    Returns the system message for one kind of request
+    Every route shares the same leading persona + guidelines block, so the
+    cached prefix is reused across endpoints; the route's static task
+    instructions follow it. Never put per-request values in here.
+    """
+    prompt = f"{get_base_system_prompt()}\n\n{get_guidelines_prompt()}"
+    if task_instructions:
+        prompt += f"\n\n{task_instructions}"
+    return prompt
+
 def get_product_list():
     """Returns a flat list of all products"""
     products = []
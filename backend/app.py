@@ -1,9 +1,34 @@
-from flask import Flask, jsonify
+# First, so the startup import timing covers every other import
+from startup import startup_timer, warm_up
+import os
+import time
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
 from config import Config
+from response_cache import response_cache
+from single_flight import single_flight
+from json_repair import repair_stats
+from upstream import upstream
+from admission import admission, rate_limiter
+from hedging import hedger
+from near_duplicate import near_duplicate_cache
+from jobs import job_queue, owner_id
+from content_library import content_library
+from usage_ledger import usage_ledger, GROUP_COLUMNS
+from model_routing import model_router
+from prompt_registry import prompt_registry
+import server_timing
+from fast_json import FastJSONProvider
+from compression import compress_response
+from middleware.auth_middleware import require_stats_access
+from metrics import (
+    prompt_cache_stats, registry, HTTP_REQUESTS, HTTP_ERRORS, HTTP_DURATION, HTTP_IN_FLIGHT
+)
 
 # Initialize the Flask app
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+app.config['MAX_CONTENT_LENGTH'] = Config.MAX_REQUEST_BYTES
 
 # CORS configuration - allow Vercel deployments and localhost
 # List all allowed origins explicitly
@@ -20,12 +45,124 @@ CORS(app,
      origins=allowed_origins,
      resources={
          r"/api/*": {
-             "methods": ["GET", "POST", "OPTIONS"],
+             "methods": ["GET", "POST", "PATCH", "DELETE", "OPTIONS"],
              "allow_headers": ["Content-Type", "Authorization"],
+             "expose_headers": ["Server-Timing"],
              "supports_credentials": False
          }
      })
 
+# Export the existing per-worker counters alongside the request metrics
+def _labelled(stats, label, names):
+    return {((label, name),): stats[name] for name in names}
+
+registry.add_collector(
+    'rockma_response_cache_events_total', 'Response cache lookups and writes', 'counter',
+    lambda: _labelled(response_cache.stats(), 'event', ('memory_hits', 'disk_hits', 'misses', 'writes', 'errors'))
+)
+registry.add_collector(
+    'rockma_near_duplicate_events_total', 'Near-duplicate competitor text lookups and writes', 'counter',
+    lambda: _labelled(near_duplicate_cache.stats(), 'event', ('hits', 'misses', 'writes', 'errors'))
+)
+registry.add_collector(
+    'rockma_single_flight_events_total', 'Upstream calls made vs. coalesced', 'counter',
+    lambda: _labelled(single_flight.stats(), 'event', ('upstream_calls', 'coalesced_local', 'coalesced_remote', 'errors'))
+)
+registry.add_collector(
+    'rockma_upstream_attempts_total', 'OpenAI call attempts, retries and failed attempts', 'counter',
+    lambda: _labelled(upstream.stats(), 'event', ('attempts', 'retries', 'failures'))
+)
+registry.add_collector(
+    'rockma_upstream_breaker_open', '1 while this worker\'s circuit breaker is not closed', 'gauge',
+    lambda: {(): int(upstream.breaker.snapshot()['state'] != 'closed')}
+)
+registry.add_collector(
+    'rockma_admission_events_total', 'Generation requests admitted, shed and rate limited', 'counter',
+    lambda: {
+        **_labelled(admission.stats(), 'event', ('admitted', 'rejected', 'reclaimed')),
+        (('event', 'rate_limited'),): rate_limiter.stats()['limited']
+    }
+)
+registry.add_collector(
+    'rockma_hedge_events_total', 'Hedgeable calls, hedges fired, hedges that won and budget denials', 'counter',
+    lambda: _labelled(hedger.stats(), 'event', ('requests', 'hedges_fired', 'hedge_wins', 'budget_denied'))
+)
+registry.add_collector(
+    'rockma_job_events_total', 'Background jobs submitted, finished, requeued and reclaimed', 'counter',
+    lambda: _labelled(job_queue.stats(), 'event', ('submitted', 'succeeded', 'failed', 'requeued', 'reclaimed'))
+)
+registry.add_collector(
+    'rockma_jobs', 'Background jobs waiting or running on the instance', 'gauge',
+    lambda: _labelled(job_queue.stats(), 'status', ('queued', 'running'))
+)
+registry.add_collector(
+    'rockma_json_parse_outcomes_total', 'How model JSON responses were parsed', 'counter',
+    lambda: _labelled(repair_stats(), 'outcome', ('clean', 'repaired', 'salvaged', 'failed'))
+)
+
+# Request metrics (see metrics.py); recorded when the response is closed so
+# streamed bodies are timed to their last byte
+@app.before_request
+def start_request_metrics():
+    registry.ensure_flusher()
+    job_queue.ensure_started()
+    prompt_registry.maybe_refresh()
+    g.metrics_start = time.perf_counter()
+    g.metrics_blueprint = request.blueprint or 'app'
+    registry.inc(HTTP_IN_FLIGHT, {'blueprint': g.metrics_blueprint})
+
+@app.after_request
+def record_request_metrics(response):
+    if 'metrics_start' not in g:
+        return response
+    start = g.metrics_start
+    blueprint = g.metrics_blueprint
+    endpoint = request.endpoint or 'unmatched'
+    method = request.method
+    status = response.status_code
+    g.metrics_recorded = True
+
+    def record():
+        registry.inc(HTTP_IN_FLIGHT, {'blueprint': blueprint}, -1)
+        registry.inc(HTTP_REQUESTS, {
+            'blueprint': blueprint, 'endpoint': endpoint, 'method': method, 'status': str(status)
+        })
+        if status >= 400:
+            registry.inc(HTTP_ERRORS, {'status': str(status)})
+        registry.observe(HTTP_DURATION, time.perf_counter() - start, {
+            'blueprint': blueprint, 'endpoint': endpoint
+        })
+
+    response.call_on_close(record)
+    return response
+
+@app.teardown_request
+def release_request_metrics(error=None):
+    # after_request is skipped when a request fails outright; don't leak the gauge
+    if 'metrics_start' in g and 'metrics_recorded' not in g:
+        registry.inc(HTTP_IN_FLIGHT, {'blueprint': g.metrics_blueprint}, -1)
+
+# Server-Timing phase breakdown (see server_timing.py)
+@app.before_request
+def start_server_timing():
+    if Config.SERVER_TIMING_ENABLED:
+        server_timing.start()
+
+@app.after_request
+def add_server_timing(response):
+    if not Config.SERVER_TIMING_ENABLED:
+        return response
+    # Let allowed frontends read the header through the Resource Timing API
+    origin = request.headers.get('Origin')
+    if origin in allowed_origins:
+        response.headers['Timing-Allow-Origin'] = origin
+    return server_timing.finish(response, request.endpoint or 'unmatched', response.status_code)
+
+# Registered after add_server_timing so it runs first and its phase makes the header
+@app.after_request
+def compress(response):
+    return compress_response(response, request)
+
 # Error handling middleware
 @app.errorhandler(400)
 def bad_request(error):
@@ -35,6 +172,13 @@ def bad_request(error):
 def not_found(error):
     return jsonify({"error": "Not found", "message": "The requested resource was not found"}), 404
 
+@app.errorhandler(413)
+def payload_too_large(error):
+    return jsonify({
+        "error": "Payload too large",
+        "message": f"Request bodies are limited to {Config.MAX_REQUEST_BYTES} bytes"
+    }), 413
+
 @app.errorhandler(500)
 def internal_error(error):
     return jsonify({"error": "Internal server error", "message": "An unexpected error occurred"}), 500
@@ -50,9 +194,76 @@ def test_api():
 # Health check route
 @app.route("/api/health", methods=['GET'])
 def health_check():
+    # Stays 200 while the breaker is open so the platform doesn't restart a healthy instance
+    breaker = upstream.breaker.snapshot()
     return jsonify({
-        "status": "healthy",
-        "service": "RockMa Creator AI API"
+        "status": "healthy" if breaker['state'] == 'closed' else "degraded",
+        "service": "RockMa Creator AI API",
+        "upstream": breaker,
+        "startup": startup_timer.stats()
+    })
+
+# Cache, coalescing, pool and JSON-repair statistics (per worker counters, shared disk tier size)
+@app.route("/api/cache/stats", methods=['GET'])
+@require_stats_access
+def cache_stats():
+    return jsonify({
+        "pid": os.getpid(),
+        "cache": response_cache.stats(),
+        "near_duplicate": near_duplicate_cache.stats(),
+        "single_flight": single_flight.stats(),
+        "inspiration_pool": inspiration_pool.stats(),
+        "json_repair": repair_stats(),
+        "upstream": upstream.stats(),
+        "admission": admission.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "hedging": hedger.stats(),
+        "prompt_cache": prompt_cache_stats.stats(),
+        "prompt_registry": prompt_registry.stats(),
+        "jobs": job_queue.stats(),
+        "library": content_library.stats(),
+        "usage": usage_ledger.stats(),
+        "routing": model_router.stats()
+    })
+
+# Prometheus metrics, merged across every worker on the instance
+@app.route("/api/metrics", methods=['GET'])
+def metrics():
+    if not Config.METRICS_ENABLED:
+        return jsonify({"error": "Not found", "message": "The requested resource was not found"}), 404
+    if Config.METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {Config.METRICS_TOKEN}":
+        return jsonify({"error": "Unauthorized", "message": "Valid metrics token required"}), 401
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+# Token usage and estimated cost from the ledger shared by every worker
+@app.route("/api/usage", methods=['GET'])
+@require_stats_access
+def usage():
+    """
+    GET /api/usage[?groupBy=endpoint,model][&days=1]
+    groupBy: any of endpoint, pillar, owner (hashed access code), model, day, hour
+    Returns: { groupBy, since, rows: [{ ...group, calls, promptTokens, cachedTokens,
+        completionTokens, avgLatencyMs, costUsd }], spendTodayUsd }
+    Access codes only see their own rows; METRICS_TOKEN sees every owner
+    """
+    group_by = [name.strip() for name in request.args.get('groupBy', 'endpoint').split(',') if name.strip()]
+    unknown = [name for name in group_by if name not in GROUP_COLUMNS]
+    try:
+        days = float(request.args.get('days', 1))
+    except ValueError:
+        days = None
+    if unknown or days is None or days <= 0:
+        return jsonify({
+            'success': False,
+            'error': f'groupBy must be a list of: {", ".join(GROUP_COLUMNS)}, and days a positive number'
+        }), 400
+    since = time.time() - days * 86400
+    return jsonify({
+        'success': True,
+        'groupBy': group_by,
+        'since': since,
+        'rows': usage_ledger.summary(group_by, since=since, owner=owner_id(g.access_code) if g.access_code else None),
+        'spendTodayUsd': round(usage_ledger.spend_today(), 6)
     })
 
 # Root route
@@ -65,17 +276,30 @@ def root():
         "endpoints": {
             "health": "/api/health",
             "test": "/api/test",
+            "cache_stats": "/api/cache/stats",
+            "metrics": "/api/metrics",
+            "usage": "/api/usage",
+            "catalog": "/api/catalog",
             "auth": {
                 "validate": "/api/auth/validate"
             },
             "daily_inspiration": {
-                "generate": "/api/daily-inspiration/generate"
+                "generate": "/api/daily-inspiration/generate",
+                "calendar": "/api/daily-inspiration/calendar"
             },
             "adapt_competitor": {
                 "rewrite": "/api/adapt-competitor/rewrite"
             },
             "platform_translator": {
-                "translate": "/api/platform-translator/translate"
+                "translate": "/api/platform-translator/translate",
+                "translate_batch": "/api/platform-translator/translate-batch"
+            },
+            "jobs": {
+                "status": "/api/jobs/<job_id>"
+            },
+            "library": {
+                "list": "/api/library",
+                "search": "/api/library/search"
             }
         },
         "documentation": "See /api/health for service status"
@@ -83,19 +307,32 @@ def root():
 
 # Import route modules
 from routes.auth import auth_bp
-from routes.daily_inspiration import daily_inspiration_bp
+from routes.daily_inspiration import daily_inspiration_bp, inspiration_pool
 from routes.adapt_competitor import adapt_competitor_bp
 from routes.platform_translator import platform_translator_bp
+from routes.jobs import jobs_bp
+from routes.catalog import catalog_bp
+from routes.library import library_bp
 
 # Register blueprints
 # Auth blueprint (no authentication required for validation endpoint)
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
+app.register_blueprint(catalog_bp, url_prefix='/api/catalog')
 
 # Protected blueprints (authentication required via @require_auth decorator)
 app.register_blueprint(daily_inspiration_bp, url_prefix='/api/daily-inspiration')
 app.register_blueprint(adapt_competitor_bp, url_prefix='/api/adapt-competitor')
 app.register_blueprint(platform_translator_bp, url_prefix='/api/platform-translator')
+app.register_blueprint(jobs_bp, url_prefix='/api/jobs')
+app.register_blueprint(library_bp, url_prefix='/api/library')
+
+# Every route has registered its task prompts by now; compile them all once
+prompt_registry.refresh()
+
+# With gunicorn --preload this is measured once, in the master
+startup_timer.record('import', time.monotonic() - startup_timer.started)
 
 # This runs the app
 if __name__ == "__main__":
+    warm_up()
     app.run(debug=Config.DEBUG, port=5000)
\ No newline at end of file
@@ -0,0 +1,194 @@
+"""
+ASGI entry point for the async serving mode
+
+Generation endpoints run natively on the event loop with the AsyncOpenAI
+client, so a single process can hold dozens of in-flight generations.
+Everything else (health, auth, streaming, batch, CORS preflight) is handed
+to the regular Flask app through asgiref's WSGI adapter, on a dedicated
+thread pool (ASGI_FLASK_THREADS) so those requests run side by side.
+
+Run with:
+    gunicorn --bind 0.0.0.0:$PORT --workers 2 -k uvicorn.workers.UvicornWorker asgi:application
+"""
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from app import app
+from config import Config
+from streaming import wants_stream
+from upstream import clients
+from startup import awarm_up
+from routes.platform_translator import translate_content_async
+from routes.adapt_competitor import rewrite_content_async
+from routes.daily_inspiration import generate_ideas_async
+
+# POST paths served by async views; anything else falls through to Flask
+ASYNC_VIEWS = {
+    '/api/platform-translator/translate': translate_content_async,
+    '/api/adapt-competitor/rewrite': rewrite_content_async,
+    '/api/daily-inspiration/generate': generate_ideas_async,
+}
+
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    """
+    WsgiToAsgi running the WSGI app on its own thread pool. asgiref's adapter
+    is thread_sensitive, i.e. every delegated request would take turns on one
+    shared thread, so a single SSE stream or batch would block all the others.
+    """
+
+    def __init__(self, wsgi_application, max_workers):
+        super().__init__(wsgi_application)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='asgi-flask')
+
+    async def __call__(self, scope, receive, send):
+        await PooledWsgiToAsgiInstance(self.wsgi_application, self.executor)(scope, receive, send)
+
+
+def closing_wsgi_app(wsgi_application):
+    """
+    Close the response iterable once it's sent, as WSGI servers must (asgiref
+    doesn't): that's what releases a streamed response's admission slot
+    """
+    def closing(environ, start_response):
+        iterable = wsgi_application(environ, start_response)
+        try:
+            yield from iterable
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+    return closing
+
+
+class PooledWsgiToAsgiInstance(WsgiToAsgiInstance):
+    _run_wsgi_app = WsgiToAsgiInstance.__dict__['run_wsgi_app'].func
+
+    def __init__(self, wsgi_application, executor):
+        super().__init__(closing_wsgi_app(wsgi_application))
+        self.executor = executor
+
+    async def run_wsgi_app(self, body):
+        await sync_to_async(self._run_wsgi_app, thread_sensitive=False, executor=self.executor)(body)
+
+
+flask_asgi = PooledWsgiToAsgi(app, Config.ASGI_FLASK_THREADS)
+
+
+def build_environ(scope, body):
+    """Translate an ASGI HTTP scope plus its body into a WSGI environ"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin1')
+        if name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        elif name == 'content-type':
+            key = 'CONTENT_TYPE'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        value = raw_value.decode('latin1')
+        if key in environ:
+            value = f"{environ[key]},{value}"
+        environ[key] = value
+    return environ
+
+
+async def read_body(receive):
+    """
+    Collect the request body from the ASGI receive channel, stopping one byte
+    past MAX_REQUEST_BYTES so an oversized body is never buffered whole (the
+    request then fails Flask's MAX_CONTENT_LENGTH check with 413)
+    """
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return body
+        body += message.get('body', b'')
+        if len(body) > Config.MAX_REQUEST_BYTES:
+            return body[:Config.MAX_REQUEST_BYTES + 1]
+        if not message.get('more_body', False):
+            return body
+
+
+async def send_response(send, response):
+    """Send a buffered Flask response over ASGI"""
+    body = response.get_data()
+    headers = [
+        (name.lower().encode('latin1'), value.encode('latin1'))
+        for name, value in response.headers.items()
+    ]
+    await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+    response.close()
+
+
+async def handle_lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # uvicorn only accepts connections once startup completes
+            await awarm_up()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await clients.aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """ASGI application: async views for generation, Flask for the rest"""
+    if scope['type'] == 'lifespan':
+        return await handle_lifespan(receive, send)
+
+    view = None
+    if scope['type'] == 'http' and scope['method'] == 'POST':
+        view = ASYNC_VIEWS.get(scope['path'])
+    if view is None:
+        return await flask_asgi(scope, receive, send)
+
+    body = await read_body(receive)
+
+    async def replay_body():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    environ = build_environ(scope, body)
+
+    # SSE streams are driven by a sync generator, so they stay on the WSGI path
+    if wants_stream(app.request_class(environ)):
+        return await flask_asgi(scope, replay_body, send)
+
+    with app.request_context(environ):
+        # Same pipeline as Flask's full_dispatch_request, with an awaited view
+        try:
+            try:
+                rv = app.preprocess_request()
+                if rv is None:
+                    rv = await view()
+            except Exception as e:
+                rv = app.handle_user_exception(e)
+            response = app.finalize_request(rv)
+        except Exception as e:
+            response = app.handle_exception(e)
+
+        await send_response(send, response)
@@ -0,0 +1,401 @@
+"""
+Offline benchmark for the RockMa Creator AI API
+Starts the OpenAI stub, boots the app under gunicorn (or uvicorn for the
+ASGI mode) pointed at it, drives every blueprint at a fixed concurrency and
+reports requests/sec, latency percentiles and per-worker memory
+
+Usage (from backend/):
+    python bench/run_bench.py --workers 2 --threads 1 --concurrency 8 --requests 80
+    python bench/run_bench.py --server uvicorn --concurrency 40 --json results.json
+    python bench/run_bench.py --baseline results.json   # fail on regressions
+"""
+import argparse
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from stub_openai import add_stub_arguments, settings_from_args, start_stub  # noqa: E402
+
+ACCESS_CODE = 'BENCH-ACCESS'
+
+
+JOB_POLL_INTERVAL = 0.2
+
+
+def _translate_body(i):
+    return {'sourceText': f'Our lip balm keeps lips soft all winter. (run {i})', 'platform': 'Instagram', 'audience': 'Gen-Z'}
+
+
+def _calendar_body(i):
+    # A different week per request, so no calendar resumes from an earlier run
+    start = date(2026, 1, 5) + timedelta(weeks=i)
+    return {'startDate': start.isoformat(), 'endDate': (start + timedelta(days=6)).isoformat()}
+
+
+def _job_round_trip(base_url, i):
+    """
+    Submit a rewrite with ?async=1, then poll its job until it finishes
+    (?wait= long-polls where the server allows it, plain polling otherwise)
+
+    Returns:
+        tuple: (status of the final poll, seconds to the 202, total seconds)
+    """
+    start = time.perf_counter()
+    status, job = fetch_json(base_url, 'POST', '/api/adapt-competitor/rewrite?async=1', {
+        'competitorText': f'Our balm is made with beeswax and keeps your lips soft. (job {i})'
+    })
+    first_byte = time.perf_counter() - start
+    if status != 202:
+        return status, first_byte, time.perf_counter() - start
+    poll_path = f"{job['statusUrl']}?wait=20"
+    while True:
+        poll_started = time.perf_counter()
+        status, job = fetch_json(base_url, 'GET', poll_path, None)
+        if status != 200 or job['status'] in ('succeeded', 'failed'):
+            break
+        if time.perf_counter() - start > 300:
+            status = 0
+            break
+        time.sleep(max(0.0, JOB_POLL_INTERVAL - (time.perf_counter() - poll_started)))
+    if status == 200 and job.get('resultStatus', 200) >= 300:
+        status = job['resultStatus']
+    return status, first_byte, time.perf_counter() - start
+
+
+# name -> (method, path, body factory taking the request number), or a callable
+# taking (base_url, request number) for multi-step flows, returning what send() returns
+# Bodies are unique per request so the caches and single-flight don't hide upstream cost
+SCENARIOS = {
+    'auth': ('POST', '/api/auth/validate', lambda i: None),
+    'daily_inspiration': ('POST', '/api/daily-inspiration/generate', lambda i: {'seasonality': 'none', 'pillar': 'support'}),
+    'adapt_competitor': ('POST', '/api/adapt-competitor/rewrite', lambda i: {
+        'competitorText': f'Our balm is made with beeswax and keeps your lips soft. (run {i})'
+    }),
+    'platform_translator': ('POST', '/api/platform-translator/translate', _translate_body),
+    'platform_translator_stream': ('POST', '/api/platform-translator/translate?stream=1', _translate_body),
+    'platform_translator_batch': ('POST', '/api/platform-translator/translate-batch', lambda i: {
+        'sourceText': f'New tallow balm drop this Friday. (run {i})',
+        'targets': [
+            {'platform': 'TikTok', 'audience': 'Gen-Z'},
+            {'platform': 'Instagram', 'audience': 'Core Moms 25-50'},
+            {'platform': 'LinkedIn', 'audience': 'B2B'}
+        ]
+    }),
+    'calendar': ('POST', '/api/daily-inspiration/calendar', _calendar_body),
+    'jobs': _job_round_trip,
+    # Reads of the drafts autosaved by the scenarios above
+    'library': ('GET', '/api/library?limit=20', lambda i: None),
+    'library_search': ('GET', '/api/library/search?q=lip%20balm&limit=20', lambda i: None),
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_command(args, port):
+    bind = f"127.0.0.1:{port}"
+    if args.server == 'uvicorn':
+        return [sys.executable, '-m', 'uvicorn', 'asgi:application', '--host', '127.0.0.1', '--port', str(port),
+                '--workers', str(args.workers), '--log-level', 'warning']
+    command = [sys.executable, '-m', 'gunicorn', 'app:app', '-b', bind, '--workers', str(args.workers),
+               '--threads', str(args.threads), '--timeout', str(args.timeout), '--log-level', 'warning']
+    if args.worker_class:
+        command += ['--worker-class', args.worker_class]
+    return command
+
+
+def wait_until_healthy(base_url, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            urllib.request.urlopen(f"{base_url}/api/health", timeout=2).read()
+            return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    raise RuntimeError('Server did not become healthy in time')
+
+
+def process_tree(root_pid):
+    """Root pid plus its direct children (gunicorn/uvicorn workers), Linux /proc only"""
+    pids = [root_pid]
+    if not os.path.isdir('/proc'):
+        return pids
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == root_pid:
+            pids.append(int(entry))
+    return pids
+
+
+def memory_kb(pid):
+    """Current and peak resident set size in KB, or (None, None) where /proc is unavailable"""
+    current = peak = None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    current = int(line.split()[1])
+                elif line.startswith('VmHWM:'):
+                    peak = int(line.split()[1])
+    except OSError:
+        pass
+    return current, peak
+
+
+def send(base_url, method, path, body):
+    """
+    Issue one request and read the whole body
+
+    Returns:
+        tuple: (status, seconds to first body byte, total seconds)
+    """
+    data = json.dumps(body).encode('utf-8') if body is not None else b''
+    req = urllib.request.Request(f"{base_url}{path}", data=data, method=method, headers={
+        'Authorization': f"Bearer {ACCESS_CODE}",
+        'Content-Type': 'application/json'
+    })
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=300) as response:
+            response.read(1)
+            first_byte = time.perf_counter() - start
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        first_byte = time.perf_counter() - start
+        e.read()
+        status = e.code
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        first_byte = time.perf_counter() - start
+        status = 0
+    return status, first_byte, time.perf_counter() - start
+
+
+def fetch_json(base_url, method, path, body):
+    """
+    Issue one request and parse its JSON body
+
+    Returns:
+        tuple: (status, payload dict - empty when the body isn't JSON)
+    """
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    req = urllib.request.Request(f"{base_url}{path}", data=data, method=method, headers={
+        'Authorization': f"Bearer {ACCESS_CODE}",
+        'Content-Type': 'application/json'
+    })
+    try:
+        with urllib.request.urlopen(req, timeout=300) as response:
+            status, raw = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        status, raw = e.code, e.read()
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        return 0, {}
+    try:
+        return status, json.loads(raw)
+    except ValueError:
+        return status, {}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_scenario(base_url, name, requests, concurrency):
+    scenario = SCENARIOS[name]
+
+    def run_one(i):
+        if callable(scenario):
+            return scenario(base_url, i)
+        method, path, make_body = scenario
+        return send(base_url, method, path, make_body(i))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(run_one, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(r[2] for r in results)
+    first_bytes = sorted(r[1] for r in results)
+    errors = sum(1 for r in results if not 200 <= r[0] < 300)
+    return {
+        'requests': requests,
+        'errors': errors,
+        'rps': round(requests / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'ttfb_p50_ms': round(percentile(first_bytes, 0.50) * 1000, 1),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Flag scenarios whose throughput dropped or p95 rose by more than tolerance
+
+    Returns:
+        list: Human-readable regression descriptions
+    """
+    regressions = []
+    for name, current in results['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        if before['rps'] and current['rps'] < before['rps'] * (1 - tolerance):
+            regressions.append(f"{name}: rps {before['rps']} -> {current['rps']}")
+        if before['p95_ms'] and current['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']}ms -> {current['p95_ms']}ms")
+    return regressions
+
+
+def print_report(results):
+    config = results['config']
+    print(f"\n{config['server']} workers={config['workers']} threads={config['threads']} "
+          f"concurrency={config['concurrency']} stub latency={config['stub']['latency']}s "
+          f"token_rate={config['stub']['token_rate']}/s")
+    header = f"{'scenario':<28}{'req':>6}{'err':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ttfb ms':>10}"
+    print(header)
+    print('-' * len(header))
+    for name, r in results['scenarios'].items():
+        print(f"{name:<28}{r['requests']:>6}{r['errors']:>6}{r['rps']:>9}{r['p50_ms']:>10}"
+              f"{r['p95_ms']:>10}{r['p99_ms']:>10}{r['ttfb_p50_ms']:>10}")
+    print('\nmemory (KB)      current     peak')
+    for pid, mem in results['memory'].items():
+        print(f"  {pid:<12}{str(mem['rss_kb']):>10}{str(mem['peak_kb']):>10}  {mem['role']}")
+    print(f"\nstub: {results['stub']['requests']} upstream requests, {results['stub']['errors']} injected errors")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmark against a local OpenAI stub')
+    parser.add_argument('--server', choices=('gunicorn', 'uvicorn'), default='gunicorn')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=1, help='gunicorn --threads')
+    parser.add_argument('--worker-class', default='', help='gunicorn --worker-class (e.g. gthread)')
+    parser.add_argument('--timeout', type=int, default=120, help='gunicorn --timeout')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=40, help='Requests per scenario')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma-separated subset to run')
+    parser.add_argument('--max-in-flight', type=int, default=64,
+                        help='ADMISSION_MAX_IN_FLIGHT for the server (default 64; lower it to test shedding)')
+    parser.add_argument('--with-cache', action='store_true', help='Keep the response cache and inspiration pool on')
+    parser.add_argument('--json', dest='json_path', help='Write results to this file')
+    parser.add_argument('--baseline', help='Compare against an earlier --json file and exit 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Allowed regression fraction (default 0.15)')
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+
+    stub, stub_url = start_stub(settings=settings_from_args(args))
+    data_dir = tempfile.mkdtemp(prefix='rockma-bench-')
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY='bench',
+        OPENAI_BASE_URL=stub_url,
+        ACCESS_CODE=ACCESS_CODE,
+        DATA_DIR=data_dir,
+        FLASK_ENV='production',
+        SERVER_TIMING_LOG='false',
+        RATE_LIMIT_ENABLED='false',
+        ADMISSION_MAX_IN_FLIGHT=str(args.max_in_flight),
+    )
+    if not args.with_cache:
+        env.update(RESPONSE_CACHE_ENABLED='false', INSPIRATION_POOL_ENABLED='false', NEAR_DUP_ENABLED='false')
+
+    server = subprocess.Popen(server_command(args, port), cwd=BACKEND_DIR, env=env, start_new_session=True)
+    try:
+        wait_until_healthy(base_url, server)
+        results = {
+            'config': {
+                'server': args.server,
+                'workers': args.workers,
+                'threads': args.threads,
+                'worker_class': args.worker_class or None,
+                'concurrency': args.concurrency,
+                'requests': args.requests,
+                'with_cache': args.with_cache,
+                'max_in_flight': args.max_in_flight,
+                'stub': {
+                    'latency': args.latency,
+                    'jitter': args.jitter,
+                    'token_rate': args.token_rate,
+                    'error_rate': args.error_rate,
+                    'slow_rate': args.slow_rate,
+                    'slow_latency': args.slow_latency
+                }
+            },
+            'scenarios': {},
+            'memory': {}
+        }
+        for name in names:
+            print(f"running {name} ...", file=sys.stderr)
+            results['scenarios'][name] = run_scenario(base_url, name, args.requests, args.concurrency)
+
+        for pid in process_tree(server.pid):
+            rss, peak = memory_kb(pid)
+            results['memory'][str(pid)] = {
+                'role': 'master' if pid == server.pid and args.workers > 1 else 'worker',
+                'rss_kb': rss,
+                'peak_kb': peak
+            }
+        results['stub'] = {'requests': stub.settings.requests, 'errors': stub.settings.errors}
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        try:
+            server.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            os.killpg(server.pid, signal.SIGKILL)
+        stub.shutdown()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    print_report(results)
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print('\nRegressions vs baseline:')
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print('\nNo regressions vs baseline')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+"""
+Local stand-in for the OpenAI chat completions API
+Simulates latency, jitter, token rate, errors and streaming so the service
+can be benchmarked without paying for real completions
+
+Usage:
+    python bench/stub_openai.py --port 9900 --latency 0.8 --jitter 0.2 --token-rate 60
+    OPENAI_BASE_URL=http://127.0.0.1:9900/v1 gunicorn app:app
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+IDEAS = [
+    {
+        "hook": "You know that feeling when your skin finally drinks up moisture?",
+        "caption": "Made with love and the cleanest organic ingredients, because your family deserves the best.",
+        "hashtags": "#CleanBeauty #OrganicSkincare #MomOwned #RockMa #SelfCare"
+    },
+    {
+        "hook": "Three ingredients. Zero compromises.",
+        "caption": "Every jar is made in the USA by a mom who reads every label twice.",
+        "hashtags": "#RockMa #MadeInUSA #LeapingBunny #CleanLiving #Nurture"
+    },
+    {
+        "hook": "This is what Mama's Love looks like in a tin.",
+        "caption": "USDA Organic, Leaping Bunny certified and made to be shared with the people you love.",
+        "hashtags": "#MamasLove #USDAOrganic #RockMa #Joy #Community"
+    }
+]
+
+PROSE = (
+    "Made with love by a mom who cares about every ingredient. Our clean, organic balm nourishes "
+    "your skin the way nature intended, ethically and sustainably made right here in the USA. "
+    "Because the people you love deserve products you can trust. #RockMa #CleanBeauty #MomOwned"
+)
+
+
+class StubSettings:
+    """
+    Args:
+        latency: Seconds before the first token (time to first byte)
+        jitter: Uniform +/- seconds added to latency
+        token_rate: Completion tokens per second after the first one (0 = instant)
+        error_rate: Fraction of requests answered with error_status
+        error_status: HTTP status used for injected errors (500 or 429)
+        slow_rate: Fraction of requests that take slow_latency instead (tail latency)
+        slow_latency: Seconds to first token for those slow requests
+
+    Prompt caching is simulated like OpenAI's: prompts of 1024+ tokens report
+    the longest previously seen prefix (in 128-token steps) as cached_tokens
+    """
+
+    def __init__(self, latency=0.8, jitter=0.2, token_rate=60.0, error_rate=0.0, error_status=500,
+                 slow_rate=0.0, slow_latency=10.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.token_rate = token_rate
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.requests = 0
+        self.errors = 0
+        self._seen_prefixes = set()
+        self._lock = threading.Lock()
+
+    def count(self, error):
+        with self._lock:
+            self.requests += 1
+            if error:
+                self.errors += 1
+
+    def cached_tokens(self, prompt):
+        """Tokens of prompt covered by an earlier request's prefix; remembers this prompt's prefixes"""
+        prompt_tokens = len(prompt) // 4
+        if prompt_tokens < 1024:
+            return 0
+        boundaries = range(1024, prompt_tokens + 1, 128)
+        cached = 0
+        with self._lock:
+            for boundary in boundaries:
+                prefix = prompt[:boundary * 4]
+                if prefix in self._seen_prefixes:
+                    cached = boundary
+                else:
+                    self._seen_prefixes.add(prefix)
+        return cached
+
+    def first_token_delay(self):
+        if random.random() < self.slow_rate:
+            return self.slow_latency
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    def token_delay(self):
+        return 1.0 / self.token_rate if self.token_rate > 0 else 0.0
+
+
+def completion_text(body):
+    """Ideas JSON for the daily-inspiration prompt, brand prose for everything else"""
+    # Task instructions live in the system message, so look at the whole conversation
+    prompt = '\n'.join(m.get('content') or '' for m in body.get('messages', []))
+    response_format = body.get('response_format') or {}
+    if response_format.get('type') in ('json_object', 'json_schema'):
+        return json.dumps({"ideas": IDEAS})
+    if 'JSON array' in prompt:
+        return json.dumps(IDEAS, indent=2)
+    return PROSE
+
+
+def tokenize(text):
+    """Split text into roughly token-sized pieces (~4 characters each)"""
+    return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+
+def usage_for(body, tokens, settings):
+    prompt = ''.join(m.get('content') or '' for m in body.get('messages', []))
+    prompt_tokens = len(prompt) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": len(tokens),
+        "total_tokens": prompt_tokens + len(tokens),
+        "prompt_tokens_details": {"cached_tokens": settings.cached_tokens(prompt)}
+    }
+
+
+def make_handler(settings):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, status, payload):
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip('/') == '/stats':
+                self._send_json(200, {'requests': settings.requests, 'errors': settings.errors})
+            else:
+                self._send_json(404, {'error': {'message': 'Not found'}})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b'{}')
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                self._send_json(404, {'error': {'message': f'Unknown path {self.path}'}})
+                return
+
+            time.sleep(settings.first_token_delay())
+            if random.random() < settings.error_rate:
+                settings.count(error=True)
+                self._send_json(settings.error_status, {
+                    'error': {'message': 'Injected stub error', 'type': 'server_error', 'code': None}
+                })
+                return
+            settings.count(error=False)
+
+            tokens = tokenize(completion_text(body))
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+            if body.get('stream'):
+                self._stream(body, completion_id, tokens)
+            else:
+                time.sleep(settings.token_delay() * max(0, len(tokens) - 1))
+                self._send_json(200, {
+                    'id': completion_id,
+                    'object': 'chat.completion',
+                    'created': int(time.time()),
+                    'model': body.get('model', 'gpt-4o-mini'),
+                    'choices': [{
+                        'index': 0,
+                        'message': {'role': 'assistant', 'content': ''.join(tokens)},
+                        'finish_reason': 'stop'
+                    }],
+                    'usage': usage_for(body, tokens, settings)
+                })
+
+        def _stream(self, body, completion_id, tokens):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            base = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': body.get('model', 'gpt-4o-mini')
+            }
+            delay = settings.token_delay()
+            try:
+                for i, token in enumerate(tokens):
+                    if i and delay:
+                        time.sleep(delay)
+                    chunk = dict(base, choices=[{'index': 0, 'delta': {'content': token}, 'finish_reason': None}])
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+                final = dict(base, choices=[{'index': 0, 'delta': {}, 'finish_reason': 'stop'}])
+                if (body.get('stream_options') or {}).get('include_usage'):
+                    final['usage'] = usage_for(body, tokens, settings)
+                self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode('utf-8'))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            self.close_connection = True
+
+    return StubHandler
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 512
+
+    def handle_error(self, request, client_address):
+        # Cancelled/hedged clients hang up mid-response; that's expected here
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+def start_stub(port=0, settings=None):
+    """
+    Start the stub in a background thread
+
+    Returns:
+        tuple: (server, base_url) - call server.shutdown() to stop it
+    """
+    settings = settings or StubSettings()
+    server = StubServer(('127.0.0.1', port), make_handler(settings))
+    server.settings = settings
+    threading.Thread(target=server.serve_forever, name='openai-stub', daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def add_stub_arguments(parser):
+    parser.add_argument('--latency', type=float, default=0.8, help='Seconds to first token (default 0.8)')
+    parser.add_argument('--jitter', type=float, default=0.2, help='Uniform +/- seconds on latency (default 0.2)')
+    parser.add_argument('--token-rate', type=float, default=60.0, help='Completion tokens/sec, 0 = instant (default 60)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that fail (default 0)')
+    parser.add_argument('--error-status', type=int, default=500, help='Status for injected errors (default 500)')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='Fraction of requests hit by tail latency (default 0)')
+    parser.add_argument('--slow-latency', type=float, default=10.0, help='Seconds to first token for slow requests (default 10)')
+
+
+def settings_from_args(args):
+    return StubSettings(
+        latency=args.latency,
+        jitter=args.jitter,
+        token_rate=args.token_rate,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local OpenAI chat completions stub')
+    parser.add_argument('--port', type=int, default=9900)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    server = StubServer(('127.0.0.1', args.port), make_handler(settings_from_args(args)))
+    print(f"OpenAI stub listening on http://127.0.0.1:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
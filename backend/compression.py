@@ -0,0 +1,107 @@
+"""
+gzip / brotli compression for API responses
+Buffered JSON and text responses above a size threshold are compressed for
+clients that accept it, brotli first when the brotli package is installed.
+Streamed responses (SSE, NDJSON batches and calendars) are left alone so
+each line still reaches the client as soon as it's written.
+"""
+import gzip
+from config import Config
+from server_timing import phase
+
+try:
+    import brotli
+except ImportError:  # Optional - gzip only
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/x-ndjson',
+    'text/plain',
+    'text/html',
+    'text/css',
+    'application/javascript',
+}
+
+
+def accepted_encodings(header):
+    """
+    Parse Accept-Encoding
+
+    Returns:
+        dict: { coding: q } for codings with q > 0
+    """
+    accepted = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return {coding: q for coding, q in accepted.items() if q > 0}
+
+
+def choose_encoding(header):
+    """Best coding we can produce for an Accept-Encoding header, or None"""
+    accepted = accepted_encodings(header)
+    candidates = (['br'] if brotli is not None else []) + ['gzip']
+    best = None
+    for coding in candidates:
+        q = accepted.get(coding, accepted.get('*', 0))
+        if q > 0 and (best is None or q > best[1]):
+            best = (coding, q)
+    return best[0] if best else None
+
+
+def compress(data, coding):
+    if coding == 'br':
+        return brotli.compress(data, quality=Config.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=Config.COMPRESSION_GZIP_LEVEL)
+
+
+def compress_response(response, request):
+    """
+    Compress a finished response in place when it's worth it
+
+    Args:
+        response: Flask response (left untouched if streamed or already encoded)
+        request: The request it answers
+
+    Returns:
+        The response
+    """
+    if not Config.COMPRESSION_ENABLED:
+        return response
+    if response.is_streamed or response.direct_passthrough:
+        return response
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return response
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES or 'Content-Encoding' in response.headers:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    coding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if coding is None:
+        return response
+    data = response.get_data()
+    if len(data) < Config.COMPRESSION_MIN_BYTES:
+        return response
+
+    with phase('compress'):
+        compressed = compress(data, coding)
+    if len(compressed) >= len(data):
+        return response
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = coding
+    # Another representation of the same resource: keep the ETag, but only weakly
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
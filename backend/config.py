@@ -4,11 +4,95 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def env_flag(name, default):
+    """Read a boolean environment variable ('true'/'1'/'yes' are truthy)"""
+    return os.getenv(name, str(default)).strip().lower() in ('true', '1', 'yes')
+
+
+def parse_access_codes(primary_code, extra_codes, default_per_minute, default_burst):
+    """
+    Build the access code -> quota map
+
+    Args:
+        primary_code: ACCESS_CODE (gets the default quota)
+        extra_codes: ACCESS_CODES, comma-separated 'CODE' or 'CODE:per_minute:burst'
+        default_per_minute: Requests per minute for codes without their own quota
+        default_burst: Bucket size for codes without their own quota
+
+    Returns:
+        dict: {code: (per_minute, burst)}
+    """
+    codes = {}
+    if primary_code:
+        codes[primary_code] = (default_per_minute, default_burst)
+    for entry in extra_codes.split(','):
+        parts = [part.strip() for part in entry.split(':')]
+        if not parts[0]:
+            continue
+        per_minute = float(parts[1]) if len(parts) > 1 and parts[1] else default_per_minute
+        burst = float(parts[2]) if len(parts) > 2 and parts[2] else default_burst
+        codes[parts[0]] = (per_minute, burst)
+    return codes
+
+
+def parse_model_routes(value):
+    """
+    Parse MODEL_ROUTES, comma-separated 'route:model' pairs where route is a
+    blueprint name such as daily_inspiration
+
+    Returns:
+        dict: {route: model}
+    """
+    routes = {}
+    for entry in value.split(','):
+        route, _, model = (part.strip() for part in entry.partition(':'))
+        if route and model:
+            routes[route] = model
+    return routes
+
+
 class Config:
     """Configuration class for the Flask application"""
     
     # AI API Configuration
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
+    # Point the OpenAI clients elsewhere (e.g. the benchmark stub in bench/); empty = api.openai.com
+    OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', '') or None
+    
+    # Upstream Connection Pool, Timeouts and Retries (see upstream.py)
+    UPSTREAM_MAX_CONNECTIONS = int(os.getenv('UPSTREAM_MAX_CONNECTIONS', '20'))
+    UPSTREAM_MAX_KEEPALIVE = int(os.getenv('UPSTREAM_MAX_KEEPALIVE', '10'))
+    UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv('UPSTREAM_KEEPALIVE_EXPIRY', '30'))
+    UPSTREAM_CONNECT_TIMEOUT = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', '5'))
+    UPSTREAM_READ_TIMEOUT = float(os.getenv('UPSTREAM_READ_TIMEOUT', '60'))
+    UPSTREAM_MAX_RETRIES = int(os.getenv('UPSTREAM_MAX_RETRIES', '2'))
+    UPSTREAM_BACKOFF_BASE = float(os.getenv('UPSTREAM_BACKOFF_BASE', '0.5'))
+    UPSTREAM_BACKOFF_MAX = float(os.getenv('UPSTREAM_BACKOFF_MAX', '8'))
+    # Keep below gunicorn's --timeout (120s in render.yaml)
+    UPSTREAM_BUDGET_SECONDS = float(os.getenv('UPSTREAM_BUDGET_SECONDS', '100'))
+    
+    # Circuit Breaker (per worker; fails fast with 503 while OpenAI is degraded)
+    BREAKER_ENABLED = env_flag('BREAKER_ENABLED', True)
+    BREAKER_WINDOW_SECONDS = float(os.getenv('BREAKER_WINDOW_SECONDS', '30'))
+    BREAKER_MIN_REQUESTS = int(os.getenv('BREAKER_MIN_REQUESTS', '10'))
+    BREAKER_ERROR_THRESHOLD = float(os.getenv('BREAKER_ERROR_THRESHOLD', '0.5'))
+    BREAKER_COOLDOWN_SECONDS = float(os.getenv('BREAKER_COOLDOWN_SECONDS', '30'))
+    
+    # Hedged Requests (second identical call when the first is slower than recent pN latency)
+    # Comma-separated blueprint names; off by default since a hedge can double token spend
+    HEDGE_BLUEPRINTS = {
+        name.strip() for name in os.getenv('HEDGE_BLUEPRINTS', '').split(',') if name.strip()
+    }
+    HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', '0.9'))
+    HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', '1'))
+    HEDGE_MAX_DELAY = float(os.getenv('HEDGE_MAX_DELAY', '15'))
+    HEDGE_MIN_SAMPLES = int(os.getenv('HEDGE_MIN_SAMPLES', '20'))
+    # Long-run hedges per request, plus a small burst allowance
+    HEDGE_MAX_RATIO = float(os.getenv('HEDGE_MAX_RATIO', '0.1'))
+    HEDGE_BURST = float(os.getenv('HEDGE_BURST', '2'))
     
     # Flask Configuration
     FLASK_ENV = os.getenv('FLASK_ENV', 'development')
@@ -16,16 +100,168 @@ class Config:
     
     # API Configuration
     API_BASE_URL = os.getenv('API_BASE_URL', 'http://localhost:5000')
+    # Largest request body accepted (bytes); bigger bodies get 413 before they are parsed
+    MAX_REQUEST_BYTES = int(os.getenv('MAX_REQUEST_BYTES', '262144'))
     
     # Authentication Configuration
     ACCESS_CODE = os.getenv('ACCESS_CODE', '')
     
+    # Per-access-code token buckets (shared by all workers through SQLite)
+    RATE_LIMIT_ENABLED = env_flag('RATE_LIMIT_ENABLED', True)
+    # Defaults suit the single ACCESS_CODE a whole team shares; give individual
+    # ACCESS_CODES their own, smaller quotas. A fan-out request (batch, calendar,
+    # long document) costs one token per upstream call, at most RATE_LIMIT_BURST
+    RATE_LIMIT_PER_MINUTE = float(os.getenv('RATE_LIMIT_PER_MINUTE', '60'))
+    RATE_LIMIT_BURST = float(os.getenv('RATE_LIMIT_BURST', '30'))
+    
+    # Additional access codes, each optionally with its own quota: CODE[:per_minute[:burst]],...
+    ACCESS_CODES = parse_access_codes(
+        ACCESS_CODE, os.getenv('ACCESS_CODES', ''), RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST
+    )
+    
+    # Admission Control (generation requests in flight across all workers; excess get 429)
+    ADMISSION_ENABLED = env_flag('ADMISSION_ENABLED', True)
+    ADMISSION_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', '8'))
+    ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', '3'))
+    # Slots older than this are treated as leaked (worker killed mid-request)
+    ADMISSION_SLOT_TTL_SECONDS = int(os.getenv('ADMISSION_SLOT_TTL_SECONDS', '300'))
+    
+    # Background Jobs (?async=1 on generation endpoints, polled via GET /api/jobs/<id>)
+    JOBS_ENABLED = env_flag('JOBS_ENABLED', True)
+    # Worker threads per gunicorn process
+    JOBS_WORKERS = int(os.getenv('JOBS_WORKERS', '2'))
+    JOBS_MAX_ATTEMPTS = int(os.getenv('JOBS_MAX_ATTEMPTS', '3'))
+    JOBS_LEASE_SECONDS = int(os.getenv('JOBS_LEASE_SECONDS', '600'))
+    JOBS_RESULT_TTL_SECONDS = int(os.getenv('JOBS_RESULT_TTL_SECONDS', '86400'))
+    JOBS_POLL_INTERVAL = float(os.getenv('JOBS_POLL_INTERVAL', '0.5'))
+    # Upper bound for ?wait= long-polls; keep well under gunicorn's --timeout
+    JOBS_MAX_WAIT_SECONDS = float(os.getenv('JOBS_MAX_WAIT_SECONDS', '25'))
+    # Cap under single-threaded (gunicorn sync) workers, where a long-poll blocks the whole worker
+    JOBS_SYNC_MAX_WAIT_SECONDS = float(os.getenv('JOBS_SYNC_MAX_WAIT_SECONDS', '0'))
+    
+    # Local Storage Configuration (SQLite files shared by all workers)
+    DATA_DIR = os.getenv('DATA_DIR', os.path.join(BASE_DIR, 'data'))
+    
+    # Response Cache Configuration
+    RESPONSE_CACHE_ENABLED = env_flag('RESPONSE_CACHE_ENABLED', True)
+    RESPONSE_CACHE_TTL_SECONDS = int(os.getenv('RESPONSE_CACHE_TTL_SECONDS', '86400'))
+    RESPONSE_CACHE_MEMORY_ENTRIES = int(os.getenv('RESPONSE_CACHE_MEMORY_ENTRIES', '512'))
+    RESPONSE_CACHE_DISK_ENTRIES = int(os.getenv('RESPONSE_CACHE_DISK_ENTRIES', '20000'))
+    
+    # Near-duplicate Cache (MinHash/LSH over competitor text for adapt_competitor)
+    NEAR_DUP_ENABLED = env_flag('NEAR_DUP_ENABLED', True)
+    # Estimated Jaccard similarity of word 3-shingles needed to reuse an adaptation
+    NEAR_DUP_THRESHOLD = float(os.getenv('NEAR_DUP_THRESHOLD', '0.85'))
+    NEAR_DUP_MAX_ENTRIES = int(os.getenv('NEAR_DUP_MAX_ENTRIES', '5000'))
+    NEAR_DUP_TTL_SECONDS = int(os.getenv('NEAR_DUP_TTL_SECONDS', '604800'))
+    
+    # Single-flight Configuration (coalesce identical in-flight generations)
+    # Comma-separated blueprint names; daily_inspiration is left out so clicks stay varied
+    SINGLE_FLIGHT_BLUEPRINTS = {
+        name.strip() for name in os.getenv('SINGLE_FLIGHT_BLUEPRINTS', 'platform_translator,adapt_competitor').split(',')
+        if name.strip()
+    }
+    SINGLE_FLIGHT_CROSS_PROCESS = env_flag('SINGLE_FLIGHT_CROSS_PROCESS', True)
+    SINGLE_FLIGHT_LEASE_SECONDS = int(os.getenv('SINGLE_FLIGHT_LEASE_SECONDS', '120'))
+    SINGLE_FLIGHT_POLL_INTERVAL = float(os.getenv('SINGLE_FLIGHT_POLL_INTERVAL', '0.1'))
+    
+    # Daily Inspiration Pre-generation Pool
+    INSPIRATION_POOL_ENABLED = env_flag('INSPIRATION_POOL_ENABLED', False)
+    INSPIRATION_POOL_DEPTH = int(os.getenv('INSPIRATION_POOL_DEPTH', '2'))
+    INSPIRATION_POOL_MAX_SETS = int(os.getenv('INSPIRATION_POOL_MAX_SETS', '4'))
+    INSPIRATION_POOL_MAX_AGE_SECONDS = int(os.getenv('INSPIRATION_POOL_MAX_AGE_SECONDS', '21600'))
+    INSPIRATION_POOL_ACTIVE_WINDOW_SECONDS = int(os.getenv('INSPIRATION_POOL_ACTIVE_WINDOW_SECONDS', '86400'))
+    INSPIRATION_POOL_WARM_INTERVAL_SECONDS = int(os.getenv('INSPIRATION_POOL_WARM_INTERVAL_SECONDS', '300'))
+    INSPIRATION_POOL_WORKERS = int(os.getenv('INSPIRATION_POOL_WORKERS', '2'))
+    
+    # Prompt Registry (precompiled prompt templates, see prompt_registry.py)
+    # Seconds between checks for changed prompt definitions; 0 = compile once at startup
+    PROMPT_REGISTRY_CHECK_SECONDS = int(os.getenv('PROMPT_REGISTRY_CHECK_SECONDS', '60'))
+    
+    # Cold Start (see startup.py and gunicorn.conf.py)
+    # Warm each worker up (prompts, OpenAI client, first connection) before it takes traffic
+    WARMUP_ENABLED = env_flag('WARMUP_ENABLED', True)
+    WARMUP_CONNECT = env_flag('WARMUP_CONNECT', True)
+    # Import the app once in the gunicorn master and fork the workers from it
+    GUNICORN_PRELOAD = env_flag('GUNICORN_PRELOAD', False)
+    
+    # Async Serving (asgi.py): threads per worker for routes handed to the Flask app
+    ASGI_FLASK_THREADS = int(os.getenv('ASGI_FLASK_THREADS', '16'))
+    
+    # Response Compression (gzip, plus brotli when the brotli package is installed)
+    COMPRESSION_ENABLED = env_flag('COMPRESSION_ENABLED', True)
+    COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', '512'))
+    COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '6'))
+    COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '4'))
+    
+    # Catalog Caching (/api/catalog; clients revalidate with the ETag after max-age)
+    CATALOG_MAX_AGE_SECONDS = int(os.getenv('CATALOG_MAX_AGE_SECONDS', '3600'))
+    CATALOG_STALE_SECONDS = int(os.getenv('CATALOG_STALE_SECONDS', '86400'))
+    
+    # Platform Constraints (trim overlong sections and fix hashtags locally after generation)
+    PLATFORM_CONSTRAINTS_ENABLED = env_flag('PLATFORM_CONSTRAINTS_ENABLED', True)
+    
+    # Content Library (drafts and favorites in SQLite + FTS5 under DATA_DIR)
+    LIBRARY_ENABLED = env_flag('LIBRARY_ENABLED', True)
+    # Save every generation automatically
+    LIBRARY_AUTOSAVE = env_flag('LIBRARY_AUTOSAVE', True)
+    LIBRARY_MAX_PAGE_SIZE = int(os.getenv('LIBRARY_MAX_PAGE_SIZE', '100'))
+    
+    # Usage Ledger (tokens, latency and estimated cost per endpoint / pillar / access code)
+    USAGE_LEDGER_ENABLED = env_flag('USAGE_LEDGER_ENABLED', True)
+    USAGE_FLUSH_SECONDS = float(os.getenv('USAGE_FLUSH_SECONDS', '5'))
+    USAGE_RETENTION_DAYS = int(os.getenv('USAGE_RETENTION_DAYS', '90'))
+    # Estimated USD per UTC day; 0 = no budget
+    USAGE_DAILY_BUDGET_USD = float(os.getenv('USAGE_DAILY_BUDGET_USD', '0'))
+    
+    # Model Routing (see model_routing.py); each fallback trigger is off at 0
+    MODEL_DEFAULT = os.getenv('MODEL_DEFAULT', 'gpt-4o-mini')
+    MODEL_ROUTES = parse_model_routes(os.getenv('MODEL_ROUTES', ''))
+    MODEL_FALLBACK = os.getenv('MODEL_FALLBACK', 'gpt-4.1-nano').strip()
+    ROUTING_BUDGET_FRACTION = float(os.getenv('ROUTING_BUDGET_FRACTION', '0.8'))
+    ROUTING_MAX_IN_FLIGHT = int(os.getenv('ROUTING_MAX_IN_FLIGHT', '0'))
+    ROUTING_LATENCY_SECONDS = float(os.getenv('ROUTING_LATENCY_SECONDS', '0'))
+    ROUTING_LATENCY_PERCENTILE = float(os.getenv('ROUTING_LATENCY_PERCENTILE', '0.9'))
+    ROUTING_MIN_SAMPLES = int(os.getenv('ROUTING_MIN_SAMPLES', '20'))
+    
+    # Structured Output for JSON endpoints: off | json_object | json_schema
+    STRUCTURED_OUTPUT = os.getenv('STRUCTURED_OUTPUT', 'off').strip().lower()
+    
+    # Metrics Configuration (per-worker snapshots merged by /api/metrics)
+    METRICS_ENABLED = env_flag('METRICS_ENABLED', True)
+    METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(DATA_DIR, 'metrics'))
+    METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+    
+    # Server-Timing Configuration (per-request phase breakdown header / log line)
+    SERVER_TIMING_ENABLED = env_flag('SERVER_TIMING_ENABLED', True)
+    SERVER_TIMING_LOG = env_flag('SERVER_TIMING_LOG', False)
+    
+    # Batch Translation Configuration (max parallel upstream calls per batch)
+    BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', '6'))
+    
+    # Competitor Adaptation Configuration (/api/adapt-competitor/rewrite)
+    # Longest competitorText accepted; longer documents are rejected with 413
+    ADAPT_MAX_CHARS = int(os.getenv('ADAPT_MAX_CHARS', '40000'))
+    # Texts longer than this are split into chunks of about this size and
+    # adapted in parallel (at most ADAPT_MAX_CONCURRENCY calls per request)
+    ADAPT_CHUNK_CHARS = int(os.getenv('ADAPT_CHUNK_CHARS', '4000'))
+    ADAPT_MAX_CONCURRENCY = int(os.getenv('ADAPT_MAX_CONCURRENCY', '6'))
+    
+    # Content Calendar Configuration (/api/daily-inspiration/calendar)
+    CALENDAR_MAX_DAYS = int(os.getenv('CALENDAR_MAX_DAYS', '92'))
+    # Days generated per upstream call, and parallel calls per calendar
+    CALENDAR_BATCH_SIZE = int(os.getenv('CALENDAR_BATCH_SIZE', '5'))
+    CALENDAR_MAX_CONCURRENCY = int(os.getenv('CALENDAR_MAX_CONCURRENCY', '4'))
+    # Finished days are kept this long so an interrupted calendar can resume
+    CALENDAR_TTL_SECONDS = int(os.getenv('CALENDAR_TTL_SECONDS', '604800'))
+    
     @staticmethod
     def validate():
         """Validate that required configuration is present"""
         if not Config.OPENAI_API_KEY:
             raise ValueError("OPENAI_API_KEY environment variable is not set")
-        if not Config.ACCESS_CODE:
-            raise ValueError("ACCESS_CODE environment variable is not set")
+        if not Config.ACCESS_CODES:
+            raise ValueError("ACCESS_CODE (or ACCESS_CODES) environment variable is not set")
         return True
 
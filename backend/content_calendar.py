@@ -0,0 +1,174 @@
+"""
+Content calendar planning and progress storage
+Maps every day of a date range to a seasonality, rotates products and
+pillars across the days, groups them into multi-day batches for one upstream
+call each, and records finished days in SQLite so an interrupted calendar
+resumes where it stopped instead of starting over
+"""
+import hashlib
+import json
+import sqlite3
+import time
+from datetime import date, timedelta
+from config import Config
+from local_store import get_connection
+
+CALENDAR_DB = 'content_calendar.db'
+
+# Drop expired days every N saved days
+PRUNE_EVERY_WRITES = 200
+
+
+def easter_sunday(year):
+    """Gregorian Easter (anonymous Gregorian algorithm)"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def nth_sunday(year, month, n):
+    first = date(year, month, 1)
+    return first + timedelta(days=(6 - first.weekday()) % 7 + 7 * (n - 1))
+
+
+def seasonality_for_date(day):
+    """
+    Pick the SEASONALITY_PROMPTS key for a calendar day
+    Holidays win over the season they fall in; the run-up to a holiday counts
+    as the holiday so posts lead into it
+
+    Args:
+        day: datetime.date
+
+    Returns:
+        str: A key of ai_persona.SEASONALITY_PROMPTS
+    """
+    year = day.year
+    if day.month == 12 and day.day <= 25:
+        return 'christmas'
+    if (day.month == 12 and day.day > 25) or (day.month == 1 and day.day <= 15):
+        return 'new_year'
+    easter = easter_sunday(year)
+    if easter - timedelta(days=14) <= day <= easter + timedelta(days=1):
+        return 'easter'
+    mothers_day = nth_sunday(year, 5, 2)
+    if mothers_day - timedelta(days=10) <= day <= mothers_day:
+        return 'mothers_day'
+    fathers_day = nth_sunday(year, 6, 3)
+    if fathers_day - timedelta(days=10) <= day <= fathers_day:
+        return 'fathers_day'
+    if day.month == 8 or (day.month == 9 and day.day <= 10):
+        return 'back_to_school'
+    if day.month in (3, 4, 5):
+        return 'spring'
+    if day.month in (6, 7, 8):
+        return 'summer'
+    if day.month in (9, 10, 11):
+        return 'fall'
+    return 'winter'
+
+
+def plan_days(start, end, products, pillars):
+    """
+    One calendar entry per day
+
+    Products rotate day by day; pillars rotate too, shifted by one on every
+    pass through the product list so a product doesn't always get the same pillar
+
+    Returns:
+        list: [{ date, seasonality, product, pillar }] in date order
+    """
+    entries = []
+    for index in range((end - start).days + 1):
+        day = start + timedelta(days=index)
+        entries.append({
+            'date': day.isoformat(),
+            'seasonality': seasonality_for_date(day),
+            'product': products[index % len(products)],
+            'pillar': pillars[(index + index // len(products)) % len(pillars)]
+        })
+    return entries
+
+
+def batch_entries(entries, batch_size):
+    """Split consecutive days sharing a seasonality into batches of at most batch_size"""
+    batches = []
+    for entry in entries:
+        last = batches[-1] if batches else None
+        if last and len(last) < batch_size and last[0]['seasonality'] == entry['seasonality']:
+            last.append(entry)
+        else:
+            batches.append([entry])
+    return batches
+
+
+def calendar_id(owner, spec):
+    """Same caller + same request body = same calendar, which is what makes resuming work"""
+    canonical = json.dumps(spec, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f"{owner}|{canonical}".encode('utf-8')).hexdigest()[:24]
+
+
+class CalendarStore:
+    """Finished calendar days, kept for ttl_seconds after the calendar was last touched"""
+
+    def __init__(self, ttl_seconds=604800):
+        self.ttl_seconds = ttl_seconds
+        self._schema_ready = False
+        self._writes = 0
+
+    def _conn(self):
+        conn = get_connection(CALENDAR_DB)
+        if not self._schema_ready:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS calendar_days ('
+                'calendar_id TEXT NOT NULL, day TEXT NOT NULL, entry TEXT NOT NULL, '
+                'updated_at REAL NOT NULL, PRIMARY KEY (calendar_id, day))'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_calendar_days_updated ON calendar_days(updated_at)')
+            self._schema_ready = True
+        return conn
+
+    def load(self, cal_id):
+        """Returns {date: entry} for the days already generated"""
+        try:
+            rows = self._conn().execute(
+                'SELECT day, entry FROM calendar_days WHERE calendar_id = ? AND updated_at > ?',
+                (cal_id, time.time() - self.ttl_seconds)
+            ).fetchall()
+        except sqlite3.Error:
+            return {}
+        return {day: json.loads(entry) for day, entry in rows}
+
+    def save(self, cal_id, entry):
+        self._conn().execute(
+            'INSERT OR REPLACE INTO calendar_days (calendar_id, day, entry, updated_at) VALUES (?, ?, ?, ?)',
+            (cal_id, entry['date'], json.dumps(entry), time.time())
+        )
+        self._writes += 1
+        if self._writes % PRUNE_EVERY_WRITES == 0:
+            self.prune()
+
+    def touch(self, cal_id):
+        self._conn().execute(
+            'UPDATE calendar_days SET updated_at = ? WHERE calendar_id = ?', (time.time(), cal_id)
+        )
+
+    def clear(self, cal_id):
+        self._conn().execute('DELETE FROM calendar_days WHERE calendar_id = ?', (cal_id,))
+
+    def prune(self):
+        """Drop days of calendars nobody has touched for ttl_seconds"""
+        self._conn().execute(
+            'DELETE FROM calendar_days WHERE updated_at <= ?', (time.time() - self.ttl_seconds,)
+        )
+
+
+calendar_store = CalendarStore(ttl_seconds=Config.CALENDAR_TTL_SECONDS)
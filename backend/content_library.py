@@ -0,0 +1,318 @@
+"""
+Server-side content library (drafts and favorites)
+Every generation is saved automatically for its access code, replacing the
+capped, per-browser RECENT_DRAFTS and FAVORITES lists in localStorage.
+Items live in SQLite under Config.DATA_DIR with an FTS5 index kept in sync
+by triggers. Listing pages with an id cursor and searching pages through the
+FTS index restricted to the owner, so both stay fast with 100k+ items.
+"""
+import json
+import logging
+import re
+import sqlite3
+import time
+from config import Config
+from local_store import get_connection
+from jobs import current_owner
+from server_timing import phase
+
+logger = logging.getLogger(__name__)
+
+LIBRARY_DB = 'library.db'
+
+KINDS = ('idea', 'adaptation', 'translation')
+
+SNIPPET_LENGTH = 50
+
+# Metadata fields worth searching on besides the content itself
+TAG_FIELDS = ('product', 'platform', 'audience', 'seasonality', 'pillar', 'date')
+
+_SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS library_items ('
+    'id INTEGER PRIMARY KEY AUTOINCREMENT, owner TEXT NOT NULL, kind TEXT NOT NULL, '
+    'content TEXT NOT NULL, tags TEXT NOT NULL, metadata TEXT NOT NULL, '
+    'favorite INTEGER NOT NULL DEFAULT 0, posted INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL)',
+    # Ids grow with insertion time, so (owner, id) is the "most recent first" order
+    'CREATE INDEX IF NOT EXISTS library_owner_recent ON library_items (owner, id)',
+    'CREATE INDEX IF NOT EXISTS library_owner_kind ON library_items (owner, kind, id)',
+    'CREATE INDEX IF NOT EXISTS library_owner_favorites ON library_items (owner, id) WHERE favorite = 1',
+]
+
+_FTS_SCHEMA = [
+    # owner is indexed so a search only walks the caller's own postings
+    "CREATE VIRTUAL TABLE IF NOT EXISTS library_fts USING fts5("
+    "content, tags, owner, content='library_items', content_rowid='id', "
+    "tokenize='porter unicode61 remove_diacritics 2')",
+    'CREATE TRIGGER IF NOT EXISTS library_fts_insert AFTER INSERT ON library_items BEGIN '
+    'INSERT INTO library_fts (rowid, content, tags, owner) VALUES (new.id, new.content, new.tags, new.owner); END',
+    'CREATE TRIGGER IF NOT EXISTS library_fts_delete AFTER DELETE ON library_items BEGIN '
+    "INSERT INTO library_fts (library_fts, rowid, content, tags, owner) "
+    "VALUES ('delete', old.id, old.content, old.tags, old.owner); END",
+    'CREATE TRIGGER IF NOT EXISTS library_fts_update AFTER UPDATE OF content, tags, owner ON library_items BEGIN '
+    "INSERT INTO library_fts (library_fts, rowid, content, tags, owner) "
+    "VALUES ('delete', old.id, old.content, old.tags, old.owner); "
+    'INSERT INTO library_fts (rowid, content, tags, owner) VALUES (new.id, new.content, new.tags, new.owner); END',
+]
+
+_COLUMNS = 'i.id, i.kind, i.content, i.metadata, i.favorite, i.posted, i.created_at'
+
+
+def fts_query(text, max_terms=16):
+    """
+    Turn free text into a safe FTS5 query: every word must match, the last
+    one as a prefix so results follow the user while they type
+
+    Returns:
+        str or None: None when the text has no searchable words
+    """
+    terms = re.findall(r'\w+', text or '')[:max_terms]
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def idea_text(idea):
+    """An idea as one piece of content, laid out like the UI copies it"""
+    return '\n\n'.join(part for part in (idea.get('hook'), idea.get('caption'), idea.get('hashtags')) if part)
+
+
+def _item(row, highlight=None):
+    item_id, kind, content, metadata, favorite, posted, created_at = row
+    item = {
+        'id': item_id,
+        'kind': kind,
+        'content': content,
+        'snippet': content[:SNIPPET_LENGTH] + ('...' if len(content) > SNIPPET_LENGTH else ''),
+        'metadata': json.loads(metadata),
+        'favorite': bool(favorite),
+        'posted': bool(posted),
+        'createdAt': created_at
+    }
+    if highlight is not None:
+        item['highlight'] = highlight
+    return item
+
+
+class ContentLibrary:
+    """
+    Saved content per owner (a hash of the access code, as for jobs)
+
+    Args:
+        enabled: When False nothing is saved and the endpoints answer 404
+        autosave: Whether generation endpoints save their output
+        max_page_size: Upper bound for the limit of one page
+    """
+
+    def __init__(self, enabled=True, autosave=True, max_page_size=100):
+        self.enabled = enabled
+        self.autosave_enabled = autosave
+        self.max_page_size = max_page_size
+        self.fts = None
+        self._schema_ready = False
+
+    def _conn(self):
+        conn = get_connection(LIBRARY_DB)
+        if not self._schema_ready:
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            try:
+                for statement in _FTS_SCHEMA:
+                    conn.execute(statement)
+                self.fts = True
+            except sqlite3.OperationalError as e:
+                # SQLite built without FTS5: search falls back to LIKE scans
+                logger.warning('Content library search index unavailable: %s', e)
+                self.fts = False
+            self._schema_ready = True
+        return conn
+
+    def page_size(self, limit):
+        return max(1, min(int(limit or 20), self.max_page_size))
+
+    def save(self, kind, content, metadata=None, owner=None, favorite=False):
+        """
+        Store one piece of content
+
+        Returns:
+            int: The new item id
+        """
+        return self.save_many(kind, [(content, metadata)], owner=owner, favorite=favorite)[0]
+
+    def save_many(self, kind, entries, owner=None, favorite=False):
+        """
+        Store several (content, metadata) entries in one transaction
+
+        Returns:
+            list: The new item ids, in order
+        """
+        owner = owner or current_owner()
+        conn = self._conn()
+        ids = []
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for content, metadata in entries:
+                metadata = metadata or {}
+                tags = ' '.join(str(metadata[field]) for field in TAG_FIELDS if metadata.get(field) not in (None, '', 'none'))
+                cursor = conn.execute(
+                    'INSERT INTO library_items (owner, kind, content, tags, metadata, favorite, created_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (owner, kind, content, tags, json.dumps(metadata), int(bool(favorite)), time.time())
+                )
+                ids.append(cursor.lastrowid)
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+        return ids
+
+    def autosave(self, kind, entries, owner=None):
+        """
+        save_many() for generation endpoints: skipped when disabled or without
+        an owner, and never raises, so a library problem can't fail a generation
+
+        Returns:
+            list or None: The new item ids
+        """
+        if not (self.enabled and self.autosave_enabled and entries):
+            return None
+        owner = owner or current_owner()
+        if owner is None:
+            return None
+        try:
+            with phase('library'):
+                return self.save_many(kind, entries, owner=owner)
+        except sqlite3.Error as e:
+            logger.warning('Could not save to the content library: %s', e)
+            return None
+
+    def autosave_text(self, kind, content, metadata=None, owner=None):
+        """autosave for one translation / adaptation; returns its id or None"""
+        ids = self.autosave(kind, [(content, metadata)], owner=owner)
+        return ids[0] if ids else None
+
+    def autosave_ideas(self, ideas, metadata=None, owner=None):
+        """autosave for an idea set, each idea its own item; returns their ids or None"""
+        return self.autosave('idea', [(idea_text(idea), dict(metadata or {}, **idea)) for idea in ideas], owner=owner)
+
+    def _filters(self, owner, kind, favorite):
+        clauses = ['i.owner = ?']
+        params = [owner]
+        if kind:
+            clauses.append('i.kind = ?')
+            params.append(kind)
+        if favorite:
+            clauses.append('i.favorite = 1')
+        return clauses, params
+
+    def list(self, owner, kind=None, favorite=False, limit=20, before=None):
+        """
+        One page of items, newest first
+
+        Args:
+            before: Item id cursor; only items older than it are returned
+
+        Returns:
+            tuple: (items, next cursor or None)
+        """
+        clauses, params = self._filters(owner, kind, favorite)
+        return self._newest(clauses, params, self.page_size(limit), before)
+
+    def search(self, owner, text, kind=None, favorite=False, limit=20, cursor=None, sort='relevance'):
+        """
+        One page of items matching text
+
+        Args:
+            sort: 'relevance' (bm25, cursor is an offset) or 'recent'
+                (newest first, cursor is an item id like list())
+
+        Returns:
+            tuple: (items, next cursor or None)
+        """
+        limit = self.page_size(limit)
+        query = fts_query(text)
+        if query is None:
+            return [], None
+        conn = self._conn()
+        clauses, params = self._filters(owner, kind, favorite)
+
+        if not self.fts:
+            for term in re.findall(r'\w+', text)[:16]:
+                clauses.append("(i.content LIKE ? ESCAPE '\\' OR i.tags LIKE ? ESCAPE '\\')")
+                pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+                params += [pattern, pattern]
+            return self._newest(clauses, params, limit, cursor)
+
+        match = f'owner : "{owner}" AND {{content tags}} : ({query})'
+        highlight = "snippet(library_fts, 0, '[', ']', '...', 12)"
+        if sort == 'recent':
+            if cursor is not None:
+                clauses.append('i.id < ?')
+                params.append(cursor)
+            rows = conn.execute(
+                f'SELECT {_COLUMNS}, {highlight} FROM library_fts JOIN library_items i ON i.id = library_fts.rowid '
+                f'WHERE library_fts MATCH ? AND {" AND ".join(clauses)} ORDER BY library_fts.rowid DESC LIMIT ?',
+                [match] + params + [limit + 1]
+            ).fetchall()
+            items = [_item(row[:7], row[7]) for row in rows[:limit]]
+            return items, (items[-1]['id'] if len(rows) > limit else None)
+
+        offset = max(0, int(cursor or 0))
+        rows = conn.execute(
+            f'SELECT {_COLUMNS}, {highlight} FROM library_fts JOIN library_items i ON i.id = library_fts.rowid '
+            f'WHERE library_fts MATCH ? AND {" AND ".join(clauses)} ORDER BY library_fts.rank LIMIT ? OFFSET ?',
+            [match] + params + [limit + 1, offset]
+        ).fetchall()
+        items = [_item(row[:7], row[7]) for row in rows[:limit]]
+        return items, (offset + limit if len(rows) > limit else None)
+
+    def _newest(self, clauses, params, limit, before):
+        """Newest-first page of library_items rows matching clauses"""
+        if before is not None:
+            clauses.append('i.id < ?')
+            params.append(before)
+        rows = self._conn().execute(
+            f'SELECT {_COLUMNS} FROM library_items i WHERE {" AND ".join(clauses)} ORDER BY i.id DESC LIMIT ?',
+            params + [limit + 1]
+        ).fetchall()
+        items = [_item(row) for row in rows[:limit]]
+        return items, (items[-1]['id'] if len(rows) > limit else None)
+
+    def get(self, owner, item_id):
+        row = self._conn().execute(
+            f'SELECT {_COLUMNS} FROM library_items i WHERE i.id = ? AND i.owner = ?', (item_id, owner)
+        ).fetchone()
+        return _item(row) if row else None
+
+    def update(self, owner, item_id, favorite=None, posted=None):
+        """Set the favorite / posted flags; returns the item or None if it isn't the owner's"""
+        changes = {name: int(bool(value)) for name, value in (('favorite', favorite), ('posted', posted)) if value is not None}
+        if changes:
+            assignments = ', '.join(f'{name} = ?' for name in changes)
+            self._conn().execute(
+                f'UPDATE library_items SET {assignments} WHERE id = ? AND owner = ?',
+                list(changes.values()) + [item_id, owner]
+            )
+        return self.get(owner, item_id)
+
+    def delete(self, owner, item_id):
+        """Returns whether an item was deleted"""
+        cursor = self._conn().execute('DELETE FROM library_items WHERE id = ? AND owner = ?', (item_id, owner))
+        return cursor.rowcount > 0
+
+    def stats(self):
+        if not self.enabled:
+            return {'enabled': False}
+        try:
+            items = self._conn().execute('SELECT COUNT(*) FROM library_items').fetchone()[0]
+        except sqlite3.Error:
+            items = None
+        return {'enabled': True, 'autosave': self.autosave_enabled, 'search_index': self.fts, 'items': items}
+
+
+content_library = ContentLibrary(
+    enabled=Config.LIBRARY_ENABLED,
+    autosave=Config.LIBRARY_AUTOSAVE,
+    max_page_size=Config.LIBRARY_MAX_PAGE_SIZE
+)
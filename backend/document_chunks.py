@@ -0,0 +1,102 @@
+"""
+Splitting long documents for chunked generation
+Text is cut at section and paragraph boundaries so each chunk is a
+self-contained stretch of the original that can be rewritten on its own,
+and the rewrites joined back in order. Paragraphs longer than a chunk fall
+back to sentence, then word boundaries.
+"""
+import re
+
+PARAGRAPH_BREAK = '\n\n'
+
+# Markdown headings, short ALL-CAPS lines and short lines ending in a colon
+HEADING_RE = re.compile(r"^(#{1,6}\s+\S.*|[A-Z0-9][A-Z0-9 &'’/,!?:-]{2,79}|[^\n.!?]{1,80}:)$")
+SENTENCE_END_RE = re.compile(r'(?<=[.!?…])\s+')
+
+
+def paragraphs(text):
+    """Non-empty blocks of text separated by blank lines"""
+    return [block.strip() for block in re.split(r'\n[ \t]*\n', text.strip()) if block.strip()]
+
+
+def is_heading(block):
+    return '\n' not in block and bool(HEADING_RE.match(block))
+
+
+def _split_words(text, max_chars):
+    pieces = []
+    while len(text) > max_chars:
+        cut = text.rfind(' ', 0, max_chars + 1)
+        if cut <= 0:
+            cut = max_chars
+        pieces.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    if text:
+        pieces.append(text)
+    return pieces
+
+
+def split_paragraph(paragraph, max_chars):
+    """A paragraph longer than max_chars as consecutive pieces, cut between sentences where possible"""
+    pieces = []
+    current = ''
+    for sentence in SENTENCE_END_RE.split(paragraph):
+        if len(sentence) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.extend(_split_words(sentence, max_chars))
+        elif current and len(current) + 1 + len(sentence) > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f'{current} {sentence}' if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_document(text, max_chars):
+    """
+    Split text into chunks of at most max_chars
+
+    A new chunk starts at a section heading once the current chunk is half
+    full, and a heading is never left as the last block of a chunk.
+
+    Args:
+        text: The document
+        max_chars: Target (and, except for unbreakable words, maximum) chunk size
+
+    Returns:
+        list: Chunk strings in document order; paragraphs inside a chunk stay
+            separated by blank lines
+    """
+    chunks = []
+    current = []
+    size = 0
+
+    def flush():
+        nonlocal current, size
+        carried = []
+        # Keep a trailing heading with the section it introduces
+        while len(current) > 1 and is_heading(current[-1][0]):
+            carried.insert(0, current.pop())
+        if current:
+            chunks.append(''.join(joiner + piece for piece, joiner in current).lstrip())
+        current = [(piece, PARAGRAPH_BREAK) for piece, _ in carried]
+        size = sum(len(piece) + len(PARAGRAPH_BREAK) for piece, _ in current)
+
+    for block in paragraphs(text):
+        pieces = [block] if len(block) <= max_chars else split_paragraph(block, max_chars)
+        for index, piece in enumerate(pieces):
+            joiner = ' ' if index else PARAGRAPH_BREAK
+            starts_section = index == 0 and is_heading(piece) and size >= max_chars // 2
+            if current and (size + len(joiner) + len(piece) > max_chars or starts_section):
+                flush()
+            current.append((piece, joiner))
+            size += len(joiner) + len(piece)
+    if current:
+        flush()
+        if current:
+            chunks.append(''.join(joiner + piece for piece, joiner in current).lstrip())
+    return chunks
@@ -0,0 +1,78 @@
+"""
+Fast JSON for API responses and NDJSON lines
+Uses orjson when it is installed (several times faster than the json module
+on large batch and calendar payloads) and the standard library otherwise.
+Output matches Flask's default provider: sorted keys, Flask's handling of
+dates, UUIDs and dataclasses, and indentation in debug mode.
+"""
+import json
+from flask import current_app, has_app_context
+from server_timing import TimedJSONProvider, phase
+
+try:
+    import orjson
+except ImportError:  # Optional - falls back to the json module
+    orjson = None
+
+if orjson is not None:
+    # Dates and dataclasses go through Flask's default() so they serialize as before
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+
+def _default(obj):
+    if has_app_context():
+        return current_app.json.default(obj)
+    return TimedJSONProvider.default(obj)
+
+
+def dumps(obj):
+    """Compact JSON text, e.g. one NDJSON line (keys keep their insertion order)"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=_default, option=_OPTIONS).decode('utf-8')
+        except orjson.JSONEncodeError:
+            pass  # e.g. integers beyond 64 bits; the json module handles them
+    return json.dumps(obj, default=_default)
+
+
+class FastJSONProvider(TimedJSONProvider):
+    """TimedJSONProvider that serializes with orjson when it can"""
+
+    def _orjson_bytes(self, obj, indent=False):
+        option = _OPTIONS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        # Callers asking for specific json.dumps options get the stdlib
+        if orjson is None or set(kwargs) - {'separators'}:
+            return super().dumps(obj, **kwargs)
+        with phase('serialize'):
+            try:
+                return self._orjson_bytes(obj).decode('utf-8')
+            except orjson.JSONEncodeError:
+                pass
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        # orjson.JSONDecodeError subclasses json.JSONDecodeError, so error handling is unchanged
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        with phase('serialize'):
+            try:
+                body = self._orjson_bytes(obj, indent=indent) + b'\n'
+            except orjson.JSONEncodeError:
+                body = None
+        if body is None:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(body, mimetype=self.mimetype)
@@ -0,0 +1,221 @@
+"""
+Generation plans shared by the sync (WSGI) and async (ASGI) serving paths
+A route validates its request body into a plan; the serving path decides
+how to run it (blocking call, async call or SSE stream). fan_out runs
+several generations of one request in parallel (batches, calendars,
+document chunks)
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils import generate_ai_content, agenerate_ai_content, stream_ai_content
+from streaming import sse_response
+from server_timing import phase
+from metrics import endpoint_scope, current_endpoint, current_pillar
+from jobs import current_owner
+
+
+def fan_out(fn, items, max_workers, ordered=False, pillar_for=None):
+    """
+    Run fn(item) for every item on a thread pool, with upstream calls
+    attributed to the current request's endpoint, pillar and owner. The pool
+    is shut down without waiting as soon as the caller stops iterating, so a
+    client that went away never leaves queued calls behind.
+
+    Args:
+        fn: Callable taking one item; runs on an executor thread, outside the request context
+        items: Work items
+        max_workers: Items processed at the same time
+        ordered: Yield in item order instead of completion order
+        pillar_for: Optional callable giving an item's pillar (default: the request's)
+
+    Yields:
+        tuple: (item, future) - future.result() returns fn's value or raises its error
+    """
+    items = list(items)
+    endpoint, pillar, owner = current_endpoint(), current_pillar(), current_owner()
+
+    def run(item):
+        with endpoint_scope(endpoint, pillar=pillar_for(item) if pillar_for else pillar, owner=owner):
+            return fn(item)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items))))
+    try:
+        futures = {executor.submit(run, item): item for item in items}
+        for future in (futures if ordered else as_completed(futures)):
+            yield futures[future], future
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+class GenerationPlan:
+    """
+    Everything needed to run one generation and shape its response
+
+    Args:
+        user_prompt: Prompt sent as the user message
+        build_payload: Callable taking the generated text, returning (payload, status)
+        error_message: Message used in the 500 payload if generation fails
+        system_prompt: Static system message (defaults to the shared persona prefix)
+        temperature: Sampling temperature
+        use_cache: Whether the response cache may serve/store this generation
+        coalesce: Whether identical in-flight generations share one upstream call
+        response_format: Optional OpenAI response_format (structured output)
+        hedge: Whether a slow upstream call may be hedged with a second one
+        stream_events: Optional factory returning a per-request chunk handler that
+            yields extra (event, data) SSE events while streaming
+        cached_text: Text already known for this request (e.g. a near-duplicate
+            hit); when set, OpenAI is not called at all
+    """
+
+    def __init__(self, user_prompt, build_payload, error_message, system_prompt=None, temperature=0.7, use_cache=True, coalesce=False,
+                 response_format=None, stream_events=None, hedge=False, cached_text=None):
+        self.user_prompt = user_prompt
+        self.build_payload = build_payload
+        self.error_message = error_message
+        self.system_prompt = system_prompt
+        self.temperature = temperature
+        self.use_cache = use_cache
+        self.coalesce = coalesce
+        self.response_format = response_format
+        self.stream_events = stream_events
+        self.hedge = hedge
+        self.cached_text = cached_text
+
+    def run(self):
+        """Blocking generation, returns (payload, status)"""
+        if self.cached_text is not None:
+            return self.build_payload(self.cached_text)
+        text = generate_ai_content(
+            self.user_prompt,
+            system_prompt_override=self.system_prompt,
+            temperature=self.temperature,
+            use_cache=self.use_cache,
+            coalesce=self.coalesce,
+            response_format=self.response_format,
+            hedge=self.hedge
+        )
+        with phase('parse'):
+            return self.build_payload(text)
+
+    async def run_async(self):
+        """
+        Async generation on the AsyncOpenAI client, returns (payload, status)
+        build_payload runs on a thread since it may write to SQLite (library autosave)
+        """
+        if self.cached_text is not None:
+            return await asyncio.to_thread(self.build_payload, self.cached_text)
+        text = await agenerate_ai_content(
+            self.user_prompt,
+            system_prompt_override=self.system_prompt,
+            temperature=self.temperature,
+            use_cache=self.use_cache,
+            coalesce=self.coalesce,
+            response_format=self.response_format,
+            hedge=self.hedge
+        )
+        with phase('parse'):
+            return await asyncio.to_thread(self.build_payload, text)
+
+    def stream(self):
+        """Server-Sent Events response streaming the generation"""
+        if self.cached_text is not None:
+            chunks = [self.cached_text]
+        else:
+            chunks = stream_ai_content(
+                self.user_prompt,
+                system_prompt_override=self.system_prompt,
+                temperature=self.temperature,
+                use_cache=self.use_cache,
+                response_format=self.response_format,
+                hedge=self.hedge
+            )
+        return sse_response(
+            chunks,
+            self.build_payload,
+            self.error_message,
+            on_chunk=self.stream_events() if self.stream_events else None
+        )
+
+
+class MapReducePlan:
+    """
+    A generation split into independent parts (e.g. the chunks of a long
+    document) that run concurrently and are joined back in order, so the
+    latency follows the largest part rather than the whole input
+
+    Args:
+        user_prompts: One user prompt per part, in output order
+        build_payload: Callable taking the joined text, returning (payload, status)
+        error_message: Message used in the 500 payload if generation fails
+        system_prompt: Static system message shared by every part
+        temperature: Sampling temperature
+        use_cache: Whether the response cache may serve/store each part
+        coalesce: Whether identical in-flight parts share one upstream call
+        hedge: Whether a slow upstream call may be hedged with a second one
+        max_concurrency: Parts generated at the same time
+        separator: Text placed between consecutive parts
+    """
+
+    def __init__(self, user_prompts, build_payload, error_message, system_prompt=None, temperature=0.7, use_cache=True, coalesce=False,
+                 hedge=False, max_concurrency=4, separator='\n\n'):
+        self.user_prompts = list(user_prompts)
+        self.build_payload = build_payload
+        self.error_message = error_message
+        self.system_prompt = system_prompt
+        self.temperature = temperature
+        self.use_cache = use_cache
+        self.coalesce = coalesce
+        self.hedge = hedge
+        self.max_concurrency = max(1, max_concurrency)
+        self.separator = separator
+
+    def _generate(self, user_prompt):
+        return generate_ai_content(
+            user_prompt,
+            system_prompt_override=self.system_prompt,
+            temperature=self.temperature,
+            use_cache=self.use_cache,
+            coalesce=self.coalesce,
+            hedge=self.hedge
+        )
+
+    def parts(self):
+        """
+        Generate every part on a thread pool, yielding each (after the
+        separator) as soon as it and all parts before it are done
+        """
+        for index, (_, future) in enumerate(fan_out(self._generate, self.user_prompts, self.max_concurrency, ordered=True)):
+            text = future.result().strip()
+            yield text if index == 0 else self.separator + text
+
+    def run(self):
+        """Blocking generation, returns (payload, status)"""
+        with phase('map'):
+            text = ''.join(self.parts())
+        with phase('parse'):
+            return self.build_payload(text)
+
+    async def run_async(self):
+        """Async generation on the AsyncOpenAI client, returns (payload, status)"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def generate_part(user_prompt):
+            async with semaphore:
+                text = await agenerate_ai_content(
+                    user_prompt,
+                    system_prompt_override=self.system_prompt,
+                    temperature=self.temperature,
+                    use_cache=self.use_cache,
+                    coalesce=self.coalesce,
+                    hedge=self.hedge
+                )
+            return text.strip()
+
+        with phase('map'):
+            texts = await asyncio.gather(*(generate_part(prompt) for prompt in self.user_prompts))
+        with phase('parse'):
+            return await asyncio.to_thread(self.build_payload, self.separator.join(texts))
+
+    def stream(self):
+        """Server-Sent Events response streaming each part, in order, as it completes"""
+        return sse_response(self.parts(), self.build_payload, self.error_message)
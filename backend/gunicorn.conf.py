@@ -0,0 +1,22 @@
+"""
+gunicorn settings, picked up automatically when gunicorn starts in backend/
+Command-line flags (render.yaml's --workers/--timeout) still take precedence
+"""
+from config import Config
+
+# Import the app once in the master and fork workers from it; clients and
+# background threads are per process and rebuilt after the fork (see startup.py)
+preload_app = Config.GUNICORN_PRELOAD
+
+
+def when_ready(server):
+    """Runs in the master after a preloaded app is imported, before the first fork"""
+    if server.cfg.preload_app:
+        from startup import preload_imports
+        preload_imports()
+
+
+def post_worker_init(worker):
+    """Runs in each worker after the app is loaded, before it accepts connections"""
+    from startup import warm_up
+    warm_up()
@@ -0,0 +1,236 @@
+"""
+Hedged upstream requests
+When a call hasn't answered (or streamed its first token) within the recent
+pN latency, an identical second call is fired and whichever finishes first
+wins; the loser is cancelled. Hedges are capped by a token budget so they
+can never exceed HEDGE_MAX_RATIO of requests in the long run.
+
+Hedging runs on asyncio so the losing request can actually be cancelled.
+The async (ASGI) path awaits it directly; sync callers run it on a
+per-process background event loop with its own AsyncOpenAI client.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from config import Config
+from upstream import build_async_client
+
+
+class LatencyTracker:
+    """Recent successful latencies per key (model, or model:ttft for streams)"""
+
+    def __init__(self, size=200):
+        self.size = size
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.size)
+            samples.append(seconds)
+
+    def percentile(self, key, fraction, min_samples):
+        """pN of the recent samples, or None until min_samples have been seen"""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < max(1, min_samples):
+            return None
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    def counts(self):
+        with self._lock:
+            return {key: len(samples) for key, samples in self._samples.items()}
+
+
+class HedgeBudget:
+    """Earns max_ratio of a hedge per request, holds at most burst hedges"""
+
+    def __init__(self, max_ratio, burst):
+        self.max_ratio = max_ratio
+        self.burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def on_request(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.max_ratio)
+
+    def try_spend(self):
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class _BackgroundLoop:
+    """Event loop thread for sync callers, restarted after fork"""
+
+    def __init__(self):
+        self._loop = None
+        self._pid = None
+        self._client = None
+        self._lock = threading.Lock()
+
+    def loop(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._client = None
+                self._pid = os.getpid()
+                threading.Thread(target=self._loop.run_forever, name='hedge-loop', daemon=True).start()
+            return self._loop
+
+    def client(self):
+        """AsyncOpenAI client bound to this loop (the ASGI client belongs to uvicorn's loop)"""
+        self.loop()
+        if self._client is None:
+            self._client = build_async_client()
+        return self._client
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop()).result()
+
+
+class Hedger:
+    """
+    Args:
+        percentile: Latency percentile (0-1) after which a hedge fires
+        min_delay / max_delay: Clamp for the hedge delay, in seconds; max_delay
+            is also used until min_samples latencies have been recorded
+        min_samples: Samples needed before the percentile is trusted
+        max_ratio: Long-run hedges per request
+        burst: Hedges available before the ratio kicks in
+    """
+
+    def __init__(self, percentile=0.9, min_delay=1.0, max_delay=15.0, min_samples=20, max_ratio=0.1, burst=2):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.latencies = LatencyTracker()
+        self.budget = HedgeBudget(max_ratio, burst)
+        self.background = _BackgroundLoop()
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'hedges_fired': 0, 'hedge_wins': 0, 'budget_denied': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def delay_for(self, key):
+        observed = self.latencies.percentile(key, self.percentile, self.min_samples)
+        if observed is None:
+            return self.max_delay
+        return min(self.max_delay, max(self.min_delay, observed))
+
+    async def run(self, key, make_coro, discard=None, on_lost=None):
+        """
+        Await make_coro(), hedging with a second make_coro() if it is slow
+
+        Args:
+            key: Latency bucket used to pick the hedge delay
+            make_coro: Zero-argument callable returning a fresh awaitable
+            discard: Optional async callable for a result that lost the race
+                (e.g. closing an open stream)
+            on_lost: Optional callable run once for every call that lost the
+                race without failing, with its result, or None when it is
+                cancelled still in flight (its tokens may be billed anyway)
+
+        Returns:
+            The first successful result; if both calls fail, the last error is raised
+        """
+        self._count('requests')
+        self.budget.on_request()
+        started = {}
+        tasks = []
+
+        def launch(name):
+            started[name] = time.perf_counter()
+            task = asyncio.ensure_future(make_coro())
+            task.hedge_name = name
+            tasks.append(task)
+            return task
+
+        try:
+            primary = launch('primary')
+            done, _ = await asyncio.wait({primary}, timeout=self.delay_for(key))
+            if not done and not self.budget.try_spend():
+                self._count('budget_denied')
+                await asyncio.wait({primary})
+            if primary.done():
+                result = primary.result()
+                self.latencies.record(key, time.perf_counter() - started['primary'])
+                return result
+
+            self._count('hedges_fired')
+            pending = {primary, launch('hedge')}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winners = [task for task in done if task.exception() is None]
+                for task in done:
+                    if task not in winners:
+                        error = task.exception()
+                if not winners:
+                    continue
+                winner = winners[0]
+                if winner.hedge_name == 'hedge':
+                    self._count('hedge_wins')
+                self.latencies.record(key, time.perf_counter() - started[winner.hedge_name])
+                for extra in winners[1:]:
+                    if discard:
+                        await discard(extra.result())
+                    if on_lost:
+                        on_lost(extra.result())
+                if on_lost:
+                    for task in pending:
+                        on_lost(None)
+                return winner.result()
+            raise error
+        finally:
+            # Cancels the losing call (and both calls if the caller itself was cancelled)
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def run_sync(self, key, make_coro, discard=None, on_lost=None):
+        """
+        Blocking variant for WSGI workers
+
+        Args:
+            make_coro: Callable taking the background loop's AsyncOpenAI client
+        """
+        client = self.background.client()
+        return self.background.run(self.run(key, lambda: make_coro(client), discard, on_lost))
+
+    def call_sync(self, coro):
+        """Run one more awaitable (e.g. the next stream chunk) on the background loop"""
+        return self.background.run(coro)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['hedge_rate'] = round(stats['hedges_fired'] / stats['requests'], 4) if stats['requests'] else 0.0
+        stats['win_rate'] = round(stats['hedge_wins'] / stats['hedges_fired'], 4) if stats['hedges_fired'] else 0.0
+        stats['delays'] = {key: round(self.delay_for(key), 3) for key in self.latencies.counts()}
+        return stats
+
+
+def enabled_for(blueprint_name):
+    """Whether generations from this blueprint may be hedged"""
+    return blueprint_name in Config.HEDGE_BLUEPRINTS
+
+
+hedger = Hedger(
+    percentile=Config.HEDGE_PERCENTILE,
+    min_delay=Config.HEDGE_MIN_DELAY,
+    max_delay=Config.HEDGE_MAX_DELAY,
+    min_samples=Config.HEDGE_MIN_SAMPLES,
+    max_ratio=Config.HEDGE_MAX_RATIO,
+    burst=Config.HEDGE_BURST
+)
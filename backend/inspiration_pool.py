@@ -0,0 +1,319 @@
+"""
+Background pre-generation pool for Daily Inspiration
+Keeps a few pre-validated idea sets per product x seasonality x pillar so a
+request can pop one instantly while a refill runs in the background.
+Refills spend upstream tokens without a request asking for them, so the
+pool is off unless INSPIRATION_POOL_ENABLED is set, and each combination is
+refilled by one process on the instance at a time.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from local_store import get_connection, get_db_path, immediate_transaction, pid_alive
+from metrics import endpoint_scope
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines - every process runs its own warmer
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+POOL_DB = 'inspiration_pool.db'
+
+# Demand key used when the client didn't ask for a specific product
+ANY_PRODUCT = '*'
+
+
+class InspirationPool:
+    """
+    Args:
+        generate_set: Callable (product or None, seasonality, pillar) -> (product, ideas)
+            that produces one validated idea set; raises on failure
+        depth: Fresh sets to keep per active combination
+        max_age_seconds: Sets older than this are stale and never served
+        max_sets: Hard cap of stored sets per combination (oldest dropped first)
+        active_window_seconds: Combinations requested within this window are kept warm
+        warm_interval_seconds: How often the warmer tops up active combinations
+        workers: Background threads generating refills in this process
+        refill_lease_seconds: How long one process's claim on refilling a
+            combination lasts if it never releases it
+    """
+
+    def __init__(self, generate_set, enabled=True, depth=2, max_age_seconds=21600, max_sets=4,
+                 active_window_seconds=86400, warm_interval_seconds=300, workers=2, refill_lease_seconds=600):
+        self.generate_set = generate_set
+        self.enabled = enabled
+        self.depth = depth
+        self.max_age_seconds = max_age_seconds
+        self.max_sets = max_sets
+        self.active_window_seconds = active_window_seconds
+        self.warm_interval_seconds = warm_interval_seconds
+        self.workers = workers
+        self.refill_lease_seconds = refill_lease_seconds
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._started_pid = None
+        self._warmer_lock_file = None
+        self._schema_ready = False
+        self._stats = {'hits': 0, 'misses': 0, 'refills': 0, 'refill_errors': 0, 'refills_skipped': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _conn(self):
+        conn = get_connection(POOL_DB)
+        if not self._schema_ready:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS inspiration_pool ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, product TEXT NOT NULL, '
+                'seasonality TEXT NOT NULL, pillar TEXT NOT NULL, '
+                'ideas TEXT NOT NULL, created_at REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_inspiration_pool_combo '
+                'ON inspiration_pool(seasonality, pillar, product, created_at)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS inspiration_demand ('
+                'product TEXT NOT NULL, seasonality TEXT NOT NULL, pillar TEXT NOT NULL, '
+                'last_requested_at REAL NOT NULL, PRIMARY KEY (product, seasonality, pillar))'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS inspiration_refills ('
+                'product TEXT NOT NULL, seasonality TEXT NOT NULL, pillar TEXT NOT NULL, '
+                'pid INTEGER NOT NULL, claimed_at REAL NOT NULL, PRIMARY KEY (product, seasonality, pillar))'
+            )
+            self._schema_ready = True
+        return conn
+
+    # Serving
+
+    def take(self, product, seasonality, pillar):
+        """
+        Pop a fresh idea set and schedule a refill for the combination
+
+        Args:
+            product: Requested product, or None for any product
+            seasonality: Seasonality key
+            pillar: Communication pillar key
+
+        Returns:
+            tuple: (product, ideas) or None when the pool is empty
+        """
+        if not self.enabled:
+            return None
+        self.ensure_started()
+
+        demand_product = product or ANY_PRODUCT
+        try:
+            self._record_demand(demand_product, seasonality, pillar)
+            popped = self._pop(product, seasonality, pillar)
+        except sqlite3.Error as e:
+            logger.warning('Inspiration pool unavailable: %s', e)
+            return None
+
+        self.schedule_refill(demand_product, seasonality, pillar)
+        if popped is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return popped
+
+    def _record_demand(self, product, seasonality, pillar):
+        self._conn().execute(
+            'INSERT OR REPLACE INTO inspiration_demand (product, seasonality, pillar, last_requested_at) '
+            'VALUES (?, ?, ?, ?)',
+            (product, seasonality, pillar, time.time())
+        )
+
+    def _pop(self, product, seasonality, pillar):
+        conn = self._conn()
+        fresh_after = time.time() - self.max_age_seconds
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if product:
+                row = conn.execute(
+                    'SELECT id, product, ideas FROM inspiration_pool '
+                    'WHERE seasonality = ? AND pillar = ? AND product = ? AND created_at > ? '
+                    'ORDER BY created_at LIMIT 1',
+                    (seasonality, pillar, product, fresh_after)
+                ).fetchone()
+            else:
+                row = conn.execute(
+                    'SELECT id, product, ideas FROM inspiration_pool '
+                    'WHERE seasonality = ? AND pillar = ? AND created_at > ? '
+                    'ORDER BY created_at LIMIT 1',
+                    (seasonality, pillar, fresh_after)
+                ).fetchone()
+            if row is None:
+                return None
+            conn.execute('DELETE FROM inspiration_pool WHERE id = ?', (row[0],))
+            return row[1], json.loads(row[2])
+        finally:
+            conn.execute('COMMIT')
+
+    def _fresh_count(self, demand_product, seasonality, pillar):
+        fresh_after = time.time() - self.max_age_seconds
+        if demand_product == ANY_PRODUCT:
+            row = self._conn().execute(
+                'SELECT COUNT(*) FROM inspiration_pool WHERE seasonality = ? AND pillar = ? AND created_at > ?',
+                (seasonality, pillar, fresh_after)
+            ).fetchone()
+        else:
+            row = self._conn().execute(
+                'SELECT COUNT(*) FROM inspiration_pool '
+                'WHERE seasonality = ? AND pillar = ? AND product = ? AND created_at > ?',
+                (seasonality, pillar, demand_product, fresh_after)
+            ).fetchone()
+        return row[0]
+
+    # Refilling
+
+    def schedule_refill(self, demand_product, seasonality, pillar):
+        """Queue a background top-up for one combination (deduplicated per process)"""
+        combo = (demand_product, seasonality, pillar)
+        with self._lock:
+            if combo in self._pending or self._executor is None:
+                return
+            self._pending.add(combo)
+        self._executor.submit(self._refill, combo)
+
+    def _claim_refill(self, combo):
+        """
+        Claim refilling one combination for this process; every worker shares
+        the demand table, so without this each would refill the same sets
+
+        Returns:
+            bool: False while another live process holds an unexpired claim
+        """
+        now = time.time()
+        conn = self._conn()
+        with immediate_transaction(conn):
+            row = conn.execute(
+                'SELECT pid, claimed_at FROM inspiration_refills WHERE product = ? AND seasonality = ? AND pillar = ?',
+                combo
+            ).fetchone()
+            if row is not None and row[1] > now - self.refill_lease_seconds and pid_alive(row[0]):
+                return False
+            conn.execute(
+                'INSERT OR REPLACE INTO inspiration_refills (product, seasonality, pillar, pid, claimed_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                combo + (os.getpid(), now)
+            )
+        return True
+
+    def _release_refill(self, combo):
+        self._conn().execute(
+            'DELETE FROM inspiration_refills WHERE product = ? AND seasonality = ? AND pillar = ? AND pid = ?',
+            combo + (os.getpid(),)
+        )
+
+    def _refill(self, combo):
+        demand_product, seasonality, pillar = combo
+        claimed = False
+        try:
+            claimed = self._claim_refill(combo)
+            if not claimed:
+                self._count('refills_skipped')
+                return
+            missing = self.depth - self._fresh_count(demand_product, seasonality, pillar)
+            for _ in range(max(0, missing)):
+                product = None if demand_product == ANY_PRODUCT else demand_product
+                # Routed (model_routing.route_for) and billed as daily_inspiration traffic
+                with endpoint_scope('daily_inspiration.pool_refill', pillar=pillar):
+                    product, ideas = self.generate_set(product, seasonality, pillar)
+                self._conn().execute(
+                    'INSERT INTO inspiration_pool (product, seasonality, pillar, ideas, created_at) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (product, seasonality, pillar, json.dumps(ideas), time.time())
+                )
+                self._count('refills')
+        except Exception as e:
+            logger.warning('Inspiration pool refill failed for %s: %s', combo, e)
+            self._count('refill_errors')
+        finally:
+            if claimed:
+                try:
+                    self._release_refill(combo)
+                except sqlite3.Error as e:
+                    logger.warning('Inspiration pool refill release failed for %s: %s', combo, e)
+            with self._lock:
+                self._pending.discard(combo)
+
+    def prune(self):
+        """Drop stale sets and enforce the per-combination cap"""
+        conn = self._conn()
+        conn.execute('DELETE FROM inspiration_pool WHERE created_at <= ?', (time.time() - self.max_age_seconds,))
+        conn.execute(
+            'DELETE FROM inspiration_pool WHERE id IN ('
+            'SELECT id FROM (SELECT id, ROW_NUMBER() OVER ('
+            'PARTITION BY product, seasonality, pillar ORDER BY created_at DESC) AS position '
+            'FROM inspiration_pool) WHERE position > ?)',
+            (self.max_sets,)
+        )
+        conn.execute(
+            'DELETE FROM inspiration_demand WHERE last_requested_at <= ?',
+            (time.time() - self.active_window_seconds,)
+        )
+
+    def warm_once(self):
+        """Prune, then schedule refills for every recently requested combination"""
+        self.prune()
+        rows = self._conn().execute(
+            'SELECT product, seasonality, pillar FROM inspiration_demand WHERE last_requested_at > ?',
+            (time.time() - self.active_window_seconds,)
+        ).fetchall()
+        for product, seasonality, pillar in rows:
+            self.schedule_refill(product, seasonality, pillar)
+
+    def _warm_loop(self):
+        while True:
+            try:
+                self.warm_once()
+            except Exception as e:
+                logger.warning('Inspiration pool warm-up failed: %s', e)
+            time.sleep(self.warm_interval_seconds)
+
+    def _claim_warmer(self):
+        """Only one process on the instance runs the periodic warmer"""
+        if fcntl is None:
+            return True
+        lock_file = open(get_db_path('inspiration_warmer.lock'), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._warmer_lock_file = lock_file
+        return True
+
+    def ensure_started(self):
+        """Lazily start the refill executor and warmer (after any gunicorn fork)"""
+        pid = os.getpid()
+        with self._lock:
+            if self._started_pid == pid:
+                return
+            self._started_pid = pid
+            self._pending = set()
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='inspiration-pool')
+        if self._claim_warmer():
+            threading.Thread(target=self._warm_loop, name='inspiration-warmer', daemon=True).start()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['enabled'] = self.enabled
+        stats['depth'] = self.depth
+        try:
+            stats['stored_sets'] = self._conn().execute('SELECT COUNT(*) FROM inspiration_pool').fetchone()[0]
+        except sqlite3.Error:
+            stats['stored_sets'] = None
+        return stats
@@ -0,0 +1,337 @@
+"""
+Persistent background job queue for long generations
+A generation endpoint called with ?async=1 (or Prefer: respond-async) stores
+the request in SQLite and answers 202 with a job id right away. Worker
+threads in every gunicorn process claim queued jobs, run them and store the
+payload; clients poll or long-poll GET /api/jobs/<id>. Jobs survive worker
+restarts: a job whose worker died (or ran past its lease) goes back to the
+queue until it runs out of attempts.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from flask import g, has_request_context, jsonify
+from config import Config
+from local_store import get_connection, pid_alive
+from upstream import UpstreamUnavailable
+from metrics import endpoint_scope, scope_value
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB = 'jobs.db'
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+FINISHED = (SUCCEEDED, FAILED)
+
+
+def owner_id(access_code):
+    """Jobs are tied to a hash of the access code that submitted them"""
+    return hashlib.sha256((access_code or '').encode('utf-8')).hexdigest()[:32]
+
+
+def current_owner():
+    """Owner of the work on this thread: the one set by endpoint_scope (jobs, batch threads), else the request's"""
+    owner = scope_value('owner')
+    if owner is None and has_request_context() and g.get('access_code'):
+        owner = owner_id(g.access_code)
+    return owner
+
+
+class JobQueue:
+    """
+    Args:
+        workers: Worker threads per process
+        max_attempts: Runs a job gets before it is failed (worker crashes and
+            open-breaker rejections each use one)
+        lease_seconds: A running job older than this is assumed lost and requeued
+        result_ttl_seconds: Finished jobs are deleted after this long
+        poll_interval: Seconds between queue checks when idle, and between
+            status checks while long-polling
+    """
+
+    def __init__(self, enabled=True, workers=2, max_attempts=3, lease_seconds=600, result_ttl_seconds=86400,
+                 poll_interval=0.5):
+        self.enabled = enabled
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.result_ttl_seconds = result_ttl_seconds
+        self.poll_interval = poll_interval
+        self._handlers = {}
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._started_pid = None
+        self._schema_ready = False
+        self._last_maintenance = 0.0
+        self._stats = {'submitted': 0, 'succeeded': 0, 'failed': 0, 'requeued': 0, 'reclaimed': 0}
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _conn(self):
+        conn = get_connection(JOBS_DB)
+        if not self._schema_ready:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id TEXT PRIMARY KEY, kind TEXT NOT NULL, params TEXT NOT NULL, owner TEXT NOT NULL, '
+                'status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, pid INTEGER, '
+                'result TEXT, result_status INTEGER, error TEXT, '
+                'created_at REAL NOT NULL, available_at REAL NOT NULL, started_at REAL, finished_at REAL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs(status, available_at, created_at)')
+            self._schema_ready = True
+        return conn
+
+    def register(self, kind, handler, error_message):
+        """
+        Register the runner for one kind of job
+
+        Args:
+            kind: Job kind, e.g. the blueprint name
+            handler: Callable taking the request body and returning (payload, status)
+            error_message: Message stored in the payload if the handler raises
+        """
+        self._handlers[kind] = (handler, error_message)
+
+    # Submitting and reading
+
+    def submit(self, kind, params, access_code):
+        """
+        Queue a job
+
+        Returns:
+            str: The new job id
+        """
+        if kind not in self._handlers:
+            raise ValueError(f'Unknown job kind: {kind}')
+        self.ensure_started()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._conn().execute(
+            'INSERT INTO jobs (id, kind, params, owner, status, created_at, available_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (job_id, kind, json.dumps(params), owner_id(access_code), QUEUED, now, now)
+        )
+        self._count('submitted')
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id, access_code):
+        """
+        Current state of a job, or None if it doesn't exist or belongs to another code
+
+        Returns:
+            dict: { jobId, kind, status, attempts, createdAt, startedAt, finishedAt,
+                    result?, resultStatus? } with timestamps in epoch seconds
+        """
+        row = self._conn().execute(
+            'SELECT id, kind, status, attempts, result, result_status, created_at, started_at, finished_at '
+            'FROM jobs WHERE id = ? AND owner = ?',
+            (job_id, owner_id(access_code))
+        ).fetchone()
+        if row is None:
+            return None
+        job = {
+            'jobId': row[0],
+            'kind': row[1],
+            'status': row[2],
+            'attempts': row[3],
+            'createdAt': row[6],
+            'startedAt': row[7],
+            'finishedAt': row[8]
+        }
+        if row[2] in FINISHED:
+            job['result'] = json.loads(row[4]) if row[4] else None
+            job['resultStatus'] = row[5]
+        return job
+
+    def wait(self, job_id, access_code, timeout):
+        """Long-poll: get() once the job finishes or timeout seconds pass, whichever is first"""
+        deadline = time.monotonic() + max(0.0, timeout)
+        while True:
+            job = self.get(job_id, access_code)
+            if job is None or job['status'] in FINISHED or time.monotonic() >= deadline:
+                return job
+            time.sleep(min(self.poll_interval, max(0.0, deadline - time.monotonic())))
+
+    # Working
+
+    def _maintain(self, conn, now):
+        """Requeue jobs of dead workers or past their lease; drop expired results"""
+        rows = conn.execute(
+            'SELECT id, pid, attempts, started_at FROM jobs WHERE status = ?', (RUNNING,)
+        ).fetchall()
+        for job_id, pid, attempts, started_at in rows:
+            lost = started_at < now - self.lease_seconds or (pid != os.getpid() and not pid_alive(pid))
+            if not lost:
+                continue
+            self._count('reclaimed')
+            if attempts >= self.max_attempts:
+                self._fail(conn, job_id, now, 'The job was interrupted too many times')
+            else:
+                conn.execute(
+                    'UPDATE jobs SET status = ?, pid = NULL, available_at = ? WHERE id = ?', (QUEUED, now, job_id)
+                )
+        conn.execute(
+            'DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?',
+            (SUCCEEDED, FAILED, now - self.result_ttl_seconds)
+        )
+
+    def _fail(self, conn, job_id, now, error):
+        payload = {'success': False, 'error': error, 'message': 'The job could not be completed'}
+        conn.execute(
+            'UPDATE jobs SET status = ?, result = ?, result_status = ?, error = ?, finished_at = ? WHERE id = ?',
+            (FAILED, json.dumps(payload), 500, error, now, job_id)
+        )
+        self._count('failed')
+
+    def _claim(self):
+        """Atomically take the oldest runnable job, returns (id, kind, params, owner) or None"""
+        conn = self._conn()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if now - self._last_maintenance >= max(5.0, self.poll_interval):
+                self._last_maintenance = now
+                self._maintain(conn, now)
+            row = conn.execute(
+                'SELECT id, kind, params, owner FROM jobs WHERE status = ? AND available_at <= ? '
+                'ORDER BY created_at LIMIT 1',
+                (QUEUED, now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                'UPDATE jobs SET status = ?, pid = ?, started_at = ?, attempts = attempts + 1 WHERE id = ?',
+                (RUNNING, os.getpid(), now, row[0])
+            )
+            return row[0], row[1], json.loads(row[2]), row[3]
+        finally:
+            conn.execute('COMMIT')
+
+    def _finish(self, job_id, payload, status):
+        self._conn().execute(
+            'UPDATE jobs SET status = ?, result = ?, result_status = ?, finished_at = ? WHERE id = ? AND pid = ?',
+            (SUCCEEDED if status < 400 else FAILED, json.dumps(payload), status, time.time(), job_id, os.getpid())
+        )
+        self._count('succeeded' if status < 400 else 'failed')
+
+    def _retry_later(self, job_id, error):
+        """Back to the queue after the breaker's cooldown, unless attempts are used up"""
+        conn = self._conn()
+        attempts = conn.execute('SELECT attempts FROM jobs WHERE id = ?', (job_id,)).fetchone()[0]
+        if attempts >= self.max_attempts:
+            self._finish(job_id, {
+                'success': False,
+                'error': str(error),
+                'message': 'The AI service is temporarily unavailable. Please try again shortly.'
+            }, 503)
+            return
+        conn.execute(
+            'UPDATE jobs SET status = ?, pid = NULL, available_at = ? WHERE id = ? AND pid = ?',
+            (QUEUED, time.time() + error.retry_after, job_id, os.getpid())
+        )
+        self._count('requeued')
+
+    def run_job(self, job_id, kind, params, owner=None):
+        """Run one claimed job and store its outcome"""
+        handler, error_message = self._handlers.get(kind, (None, 'Unknown job kind'))
+        try:
+            if handler is None:
+                raise ValueError(f'Unknown job kind: {kind}')
+            with endpoint_scope(f'jobs.{kind}', pillar=params.get('pillar'), owner=owner):
+                payload, status = handler(params)
+        except UpstreamUnavailable as e:
+            self._retry_later(job_id, e)
+            return
+        except Exception as e:
+            logger.warning('Job %s (%s) failed: %s', job_id, kind, e)
+            payload, status = {'success': False, 'error': str(e), 'message': error_message}, 500
+        self._finish(job_id, payload, status)
+
+    def _work_loop(self):
+        while True:
+            try:
+                claimed = self._claim()
+            except sqlite3.Error as e:
+                logger.warning('Job queue unavailable: %s', e)
+                claimed = None
+            if claimed is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            try:
+                self.run_job(*claimed)
+            except sqlite3.Error as e:
+                logger.warning('Could not store the result of job %s: %s', claimed[0], e)
+
+    def ensure_started(self):
+        """Lazily start this process's worker threads (after any gunicorn fork)"""
+        if not self.enabled:
+            return
+        pid = os.getpid()
+        with self._lock:
+            if self._started_pid == pid:
+                return
+            self._started_pid = pid
+            self._wakeup = threading.Event()
+        for index in range(max(1, self.workers)):
+            threading.Thread(target=self._work_loop, name=f'job-worker-{index}', daemon=True).start()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['enabled'] = self.enabled
+        stats['workers'] = self.workers
+        try:
+            counts = dict(self._conn().execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+        except sqlite3.Error:
+            counts = {}
+        stats['queued'] = counts.get(QUEUED, 0)
+        stats['running'] = counts.get(RUNNING, 0)
+        return stats
+
+
+def wants_job(request):
+    """
+    Check whether the client asked for a background job
+    Either ?async=1 (or true) or a Prefer: respond-async header
+    """
+    if not job_queue.enabled:
+        return False
+    if request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return 'respond-async' in request.headers.get('Prefer', '')
+
+
+def enqueue_response(kind, data):
+    """Queue the request body as a job and answer 202 with its status URL"""
+    job_id = job_queue.submit(kind, data, g.access_code)
+    status_url = f"/api/jobs/{job_id}"
+    response = jsonify({
+        'success': True,
+        'jobId': job_id,
+        'status': QUEUED,
+        'statusUrl': status_url
+    })
+    response.headers['Location'] = status_url
+    return response, 202
+
+
+job_queue = JobQueue(
+    enabled=Config.JOBS_ENABLED,
+    workers=Config.JOBS_WORKERS,
+    max_attempts=Config.JOBS_MAX_ATTEMPTS,
+    lease_seconds=Config.JOBS_LEASE_SECONDS,
+    result_ttl_seconds=Config.JOBS_RESULT_TTL_SECONDS,
+    poll_interval=Config.JOBS_POLL_INTERVAL
+)
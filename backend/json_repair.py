@@ -0,0 +1,175 @@
+"""
+Local repair for almost-valid JSON from the model
+Fixes the common defects (code fences, smart quotes, trailing commas,
+truncated output) so a bad parse doesn't cost a full regeneration
+"""
+import json
+import re
+import threading
+
+_FENCE_RE = re.compile(r'```(?:json|JSON)?\s*(.*?)(?:```|$)', re.DOTALL)
+# Curly quotes only where they act as JSON delimiters, so quotes inside captions survive
+_SMART_OPEN_RE = re.compile(r'(?<=[{\[,:])(\s*)[“”]')
+_SMART_CLOSE_RE = re.compile(r'[“”](?=\s*[:,}\]])')
+
+_stats_lock = threading.Lock()
+_stats = {'clean': 0, 'repaired': 0, 'salvaged': 0, 'failed': 0}
+_fix_counts = {}
+
+
+def record_outcome(outcome, fixes=()):
+    """
+    Count how a model response was parsed
+
+    Args:
+        outcome: 'clean', 'repaired', 'salvaged' or 'failed'
+        fixes: Names of the repairs applied (for 'repaired')
+    """
+    with _stats_lock:
+        _stats[outcome] += 1
+        for fix in fixes:
+            _fix_counts[fix] = _fix_counts.get(fix, 0) + 1
+
+
+def repair_stats():
+    """Returns parse outcome counters; saved_round_trips = repaired + salvaged"""
+    with _stats_lock:
+        stats = dict(_stats)
+        stats['fixes'] = dict(_fix_counts)
+    stats['saved_round_trips'] = stats['repaired'] + stats['salvaged']
+    return stats
+
+
+def strip_code_fences(text):
+    match = _FENCE_RE.search(text)
+    return match.group(1) if match else text
+
+
+def normalize_smart_quotes(text):
+    text = _SMART_OPEN_RE.sub(r'\1"', text)
+    return _SMART_CLOSE_RE.sub('"', text)
+
+
+def remove_trailing_commas(text):
+    """Drop commas directly before a closing bracket, ignoring string contents"""
+    out = []
+    in_string = False
+    escaped = False
+    pending_comma = None
+    for char in text:
+        if in_string:
+            out.append(char)
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if pending_comma is not None:
+            if char.isspace():
+                pending_comma.append(char)
+                continue
+            if char not in '}]':
+                out.extend(pending_comma)
+            else:
+                out.extend(pending_comma[1:])
+            pending_comma = None
+        if char == ',':
+            pending_comma = [char]
+            continue
+        if char == '"':
+            in_string = True
+        out.append(char)
+    if pending_comma is not None:
+        out.extend(pending_comma)
+    return ''.join(out)
+
+
+def close_truncated(text):
+    """
+    Cut a truncated document back to its last complete element and close
+    every bracket still open at that point
+    """
+    start = min((i for i in (text.find('['), text.find('{')) if i >= 0), default=-1)
+    if start < 0:
+        return text
+
+    stack = []
+    in_string = False
+    escaped = False
+    cut = None
+    cut_stack = None
+    for pos in range(start, len(text)):
+        char = text[pos]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in '[{':
+            stack.append(']' if char == '[' else '}')
+        elif char in ']}':
+            if not stack:
+                break
+            stack.pop()
+            if not stack:
+                # The document is complete; nothing to close
+                return text[start:pos + 1]
+            cut = pos + 1
+            cut_stack = list(stack)
+
+    if cut is None:
+        return text
+    head = text[start:cut].rstrip().rstrip(',')
+    return head + ''.join(reversed(cut_stack))
+
+
+# Applied in order; each step is kept only if it changes the text
+REPAIRS = [
+    ('code_fences', strip_code_fences),
+    ('smart_quotes', normalize_smart_quotes),
+    ('trailing_commas', remove_trailing_commas),
+    ('truncation', close_truncated),
+]
+
+
+def repair_json(text):
+    """
+    Try the local repairs cumulatively until the text parses
+
+    Returns:
+        tuple: (parsed value, list of repair names applied)
+
+    Raises:
+        json.JSONDecodeError: If the text still doesn't parse
+    """
+    fixes = []
+    candidate = text.strip()
+    error = None
+    for name, repair in REPAIRS:
+        repaired = repair(candidate)
+        if repaired == candidate:
+            continue
+        candidate = repaired
+        fixes.append(name)
+        try:
+            return json.loads(candidate), fixes
+        except json.JSONDecodeError as e:
+            error = e
+
+    # Last resort: the outermost array/object with prose around it
+    start = min((i for i in (candidate.find('['), candidate.find('{')) if i >= 0), default=-1)
+    end = max(candidate.rfind(']'), candidate.rfind('}'))
+    if 0 <= start < end:
+        try:
+            return json.loads(candidate[start:end + 1]), fixes + ['surrounding_text']
+        except json.JSONDecodeError as e:
+            error = e
+
+    raise error or json.JSONDecodeError('Unrepairable JSON', text, 0)
@@ -0,0 +1,108 @@
+"""
+Incremental parser for JSON arrays of objects arriving in pieces
+Used to pull complete ideas out of a streamed (or truncated) completion
+"""
+import json
+
+
+class ArrayObjectParser:
+    """
+    Yields each top-level object of the first JSON array as soon as its
+    closing brace arrives. Text before the array (prose, code fences) is
+    skipped, and an object that fails to parse is dropped without affecting
+    the ones around it.
+
+    Usage:
+        parser = ArrayObjectParser()
+        for chunk in chunks:
+            for obj in parser.feed(chunk):
+                ...
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._pos = 0
+        self._in_array = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._object_start = None
+        self.malformed = 0
+
+    def feed(self, text):
+        """
+        Consume more text
+
+        Returns:
+            list: Objects completed by this chunk, in order
+        """
+        if self._done or not text:
+            return []
+
+        self._buffer += text
+        completed = []
+        buffer = self._buffer
+        pos = self._pos
+
+        while pos < len(buffer):
+            char = buffer[pos]
+
+            if not self._in_array:
+                if char == '[':
+                    self._in_array = True
+                pos += 1
+                continue
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                # Strings only matter inside objects; stray ones between them are skipped
+                if self._depth > 0:
+                    self._in_string = True
+            elif char in '{[':
+                if self._depth == 0 and char == '{':
+                    self._object_start = pos
+                self._depth += 1
+            elif char in '}]':
+                if self._depth == 0:
+                    if char == ']':
+                        self._done = True
+                        break
+                else:
+                    self._depth -= 1
+                    if self._depth == 0 and self._object_start is not None:
+                        obj = self._parse(buffer[self._object_start:pos + 1])
+                        if obj is not None:
+                            completed.append(obj)
+                        self._object_start = None
+            pos += 1
+
+        # Drop consumed text so the buffer only holds the object in progress
+        keep_from = self._object_start if self._object_start is not None else pos
+        self._buffer = buffer[keep_from:]
+        self._pos = pos - keep_from
+        if self._object_start is not None:
+            self._object_start = 0
+        return completed
+
+    def _parse(self, text):
+        try:
+            obj = json.loads(text)
+        except json.JSONDecodeError:
+            self.malformed += 1
+            return None
+        if not isinstance(obj, dict):
+            self.malformed += 1
+            return None
+        return obj
+
+
+def parse_array_objects(text):
+    """Parse every complete object from a (possibly truncated) JSON array"""
+    return ArrayObjectParser().feed(text)
@@ -0,0 +1,72 @@
+"""
+Local SQLite storage helpers
+Shared by every feature that keeps state under Config.DATA_DIR so that all
+gunicorn workers on the instance see the same data
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from config import Config
+
+_local = threading.local()
+
+
+def get_db_path(filename):
+    """Returns the absolute path of a database file inside the data directory"""
+    os.makedirs(Config.DATA_DIR, exist_ok=True)
+    return os.path.join(Config.DATA_DIR, filename)
+
+
+@contextmanager
+def immediate_transaction(conn):
+    """
+    BEGIN IMMEDIATE ... COMMIT around a block, rolled back instead if the
+    block raises, so a half-applied update is never persisted
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+def get_connection(filename):
+    """
+    Get a SQLite connection for the current thread and process
+
+    Connections are never shared between threads or across a fork, so every
+    worker (and every thread inside it) lazily opens its own handle.
+
+    Args:
+        filename: Database file name inside Config.DATA_DIR
+
+    Returns:
+        sqlite3.Connection: Connection in autocommit mode with WAL enabled
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None or getattr(_local, 'pid', None) != os.getpid():
+        connections = {}
+        _local.connections = connections
+        _local.pid = os.getpid()
+
+    conn = connections.get(filename)
+    if conn is None:
+        conn = sqlite3.connect(get_db_path(filename), timeout=5.0, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        connections[filename] = conn
+    return conn
+
+
+def pid_alive(pid):
+    """Whether a process with this pid still exists on the instance"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,420 @@
+"""
+Prometheus-style metrics aggregated across gunicorn workers
+Each process keeps its own counters/histograms/gauges in memory and
+periodically writes a snapshot to Config.METRICS_DIR; /api/metrics merges
+every snapshot into the text exposition format.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from flask import has_request_context, request
+from config import Config
+from local_store import pid_alive
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+UPSTREAM_BUCKETS = (0.25, 0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 60, 120)
+
+ARCHIVE_FILE = 'archived.json'
+
+
+class Metric:
+    def __init__(self, name, kind, help_text, labelnames=(), buckets=None):
+        self.name = name
+        self.kind = kind
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) if buckets else None
+
+
+def _label_key(labels):
+    return json.dumps(sorted(labels.items()))
+
+
+class MetricsRegistry:
+    """
+    Args:
+        directory: Where per-process snapshots are written
+        flush_interval: Minimum seconds between snapshot writes
+    """
+
+    def __init__(self, directory, enabled=True, flush_interval=5.0):
+        self.directory = directory
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self._metrics = {}
+        self._values = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        self._flusher_pid = None
+
+    # Definitions
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        self._values[metric.name] = {}
+        return metric.name
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Metric(name, 'counter', help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._register(Metric(name, 'gauge', help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=REQUEST_BUCKETS):
+        return self._register(Metric(name, 'histogram', help_text, labelnames, buckets))
+
+    def add_collector(self, name, help_text, kind, collect):
+        """
+        Export values owned by another module at snapshot time
+
+        Args:
+            collect: Callable returning {labels_dict_as_tuple_items: value}
+        """
+        self._register(Metric(name, kind, help_text))
+        self._collectors.append((name, collect))
+
+    # Recording
+
+    def inc(self, name, labels=None, amount=1):
+        if not self.enabled:
+            return
+        key = _label_key(labels or {})
+        with self._lock:
+            values = self._values[name]
+            values[key] = values.get(key, 0) + amount
+
+    def set(self, name, value, labels=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._values[name][_label_key(labels or {})] = value
+
+    def observe(self, name, value, labels=None):
+        if not self.enabled:
+            return
+        buckets = self._metrics[name].buckets
+        key = _label_key(labels or {})
+        with self._lock:
+            values = self._values[name]
+            entry = values.get(key)
+            if entry is None:
+                entry = {'buckets': [0] * (len(buckets) + 1), 'sum': 0.0, 'count': 0}
+                values[key] = entry
+            index = len(buckets)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    index = i
+                    break
+            entry['buckets'][index] += 1
+            entry['sum'] += value
+            entry['count'] += 1
+        self.maybe_flush()
+
+    @contextmanager
+    def track_in_flight(self, name, labels=None):
+        self.inc(name, labels)
+        try:
+            yield
+        finally:
+            self.inc(name, labels, -1)
+
+    # Snapshots
+
+    def snapshot(self):
+        with self._lock:
+            data = {name: dict(values) for name, values in self._values.items()}
+            for name, entries in data.items():
+                if self._metrics[name].kind == 'histogram':
+                    data[name] = {
+                        key: {'buckets': list(e['buckets']), 'sum': e['sum'], 'count': e['count']}
+                        for key, e in entries.items()
+                    }
+        for name, collect in self._collectors:
+            try:
+                data[name] = {_label_key(dict(labels)): value for labels, value in collect().items()}
+            except Exception as e:
+                logger.warning('Metrics collector %s failed: %s', name, e)
+        return data
+
+    def flush(self):
+        """Write this process's snapshot atomically"""
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        # The flusher thread and /api/metrics can flush at the same time
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+        self._last_flush = time.time()
+
+    def maybe_flush(self):
+        if time.time() - self._last_flush < self.flush_interval:
+            return
+        try:
+            self.flush()
+        except OSError as e:
+            logger.warning('Metrics flush failed: %s', e)
+
+    def ensure_flusher(self):
+        """Start a background flusher so idle workers still publish (once per process)"""
+        if not self.enabled or self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+
+        def loop():
+            while True:
+                time.sleep(self.flush_interval)
+                self.maybe_flush()
+
+        threading.Thread(target=loop, name='metrics-flusher', daemon=True).start()
+
+    # Aggregation
+
+    def _merge(self, total, snapshot, include_gauges):
+        for name, entries in snapshot.items():
+            metric = self._metrics.get(name)
+            if metric is None or (metric.kind == 'gauge' and not include_gauges):
+                continue
+            merged = total.setdefault(name, {})
+            for key, value in entries.items():
+                if metric.kind == 'histogram':
+                    current = merged.get(key)
+                    if current is None or len(current['buckets']) != len(value['buckets']):
+                        merged[key] = {'buckets': list(value['buckets']), 'sum': value['sum'], 'count': value['count']}
+                    else:
+                        current['buckets'] = [a + b for a, b in zip(current['buckets'], value['buckets'])]
+                        current['sum'] += value['sum']
+                        current['count'] += value['count']
+                else:
+                    merged[key] = merged.get(key, 0) + value
+
+    def _archive_dead(self, dead_paths):
+        """Fold snapshots of exited workers into one archive so counters never go backwards"""
+        archive_path = os.path.join(self.directory, ARCHIVE_FILE)
+        with open(os.path.join(self.directory, 'archive.lock'), 'w') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            archive = {}
+            if os.path.exists(archive_path):
+                with open(archive_path) as f:
+                    archive = json.load(f)
+            for path in dead_paths:
+                if not os.path.exists(path):
+                    continue
+                with open(path) as f:
+                    self._merge(archive, json.load(f), include_gauges=False)
+                os.remove(path)
+            tmp_path = f"{archive_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(archive, f)
+            os.replace(tmp_path, archive_path)
+
+    def collect(self):
+        """Merge the snapshots of every worker (live and archived)"""
+        self.flush()
+        total = {}
+        dead = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json') or filename == ARCHIVE_FILE:
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                pid = int(filename[:-5])
+            except ValueError:
+                continue
+            if not pid_alive(pid):
+                dead.append(path)
+                continue
+            try:
+                with open(path) as f:
+                    self._merge(total, json.load(f), include_gauges=True)
+            except (OSError, ValueError) as e:
+                logger.warning('Skipping metrics snapshot %s: %s', filename, e)
+
+        if dead:
+            self._archive_dead(dead)
+        archive_path = os.path.join(self.directory, ARCHIVE_FILE)
+        if os.path.exists(archive_path):
+            with open(archive_path) as f:
+                self._merge(total, json.load(f), include_gauges=False)
+        return total
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        total = self.collect()
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f"# HELP {name} {metric.help_text}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key, value in sorted(total.get(name, {}).items()):
+                labels = json.loads(key)
+                if metric.kind == 'histogram':
+                    cumulative = 0
+                    bounds = [str(b) for b in metric.buckets] + ['+Inf']
+                    for bound, count in zip(bounds, value['buckets']):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(labels + [['le', bound]])} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {value['sum']}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+                else:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = []
+    for label, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{label}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+registry = MetricsRegistry(
+    Config.METRICS_DIR,
+    enabled=Config.METRICS_ENABLED,
+    flush_interval=Config.METRICS_FLUSH_INTERVAL
+)
+
+HTTP_REQUESTS = registry.counter(
+    'rockma_http_requests_total', 'HTTP requests by route and status',
+    ('blueprint', 'endpoint', 'method', 'status')
+)
+HTTP_ERRORS = registry.counter(
+    'rockma_http_errors_total', 'HTTP responses with status >= 400', ('status',)
+)
+HTTP_DURATION = registry.histogram(
+    'rockma_http_request_duration_seconds', 'Request latency by route (including streamed bodies)',
+    ('blueprint', 'endpoint')
+)
+HTTP_IN_FLIGHT = registry.gauge(
+    'rockma_http_requests_in_flight', 'Requests currently being served', ('blueprint',)
+)
+UPSTREAM_WAIT = registry.histogram(
+    'rockma_upstream_wait_seconds', 'Time spent waiting on OpenAI inside generate_ai_content',
+    ('endpoint', 'model', 'outcome'), buckets=UPSTREAM_BUCKETS
+)
+UPSTREAM_IN_FLIGHT = registry.gauge(
+    'rockma_upstream_in_flight', 'OpenAI calls currently in flight'
+)
+UPSTREAM_TOKENS = registry.counter(
+    'rockma_upstream_tokens_total',
+    'Tokens reported by OpenAI; type="cached" is the part of prompt served from the prompt cache',
+    ('endpoint', 'model', 'type')
+)
+
+_scope = threading.local()
+
+
+def current_endpoint():
+    """
+    Flask endpoint of the current request; outside one, the name set by
+    endpoint_scope (job workers, batch threads) or 'background'
+    """
+    if has_request_context():
+        return request.endpoint or 'unmatched'
+    return getattr(_scope, 'endpoint', None) or 'background'
+
+
+def scope_value(key):
+    """Attribution set by endpoint_scope on this thread (e.g. pillar, owner), or None"""
+    return getattr(_scope, 'values', {}).get(key)
+
+
+def current_pillar():
+    """Communication pillar of the current request body, or the one set by endpoint_scope"""
+    if has_request_context():
+        data = request.get_json(silent=True)
+        return data.get('pillar') if isinstance(data, dict) else None
+    return scope_value('pillar')
+
+
+@contextmanager
+def endpoint_scope(name, **values):
+    """
+    Attribute upstream calls made by this thread outside a request to name,
+    plus optional attribution such as pillar= and owner=
+    """
+    previous = getattr(_scope, 'endpoint', None), getattr(_scope, 'values', {})
+    _scope.endpoint = name
+    _scope.values = values
+    try:
+        yield
+    finally:
+        _scope.endpoint, _scope.values = previous
+
+
+class PromptCacheStats:
+    """Per-worker prompt and cached-token totals by endpoint, for /api/cache/stats"""
+
+    def __init__(self):
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, prompt_tokens, cached_tokens):
+        with self._lock:
+            totals = self._totals.setdefault(endpoint, {'calls': 0, 'prompt_tokens': 0, 'cached_tokens': 0})
+            totals['calls'] += 1
+            totals['prompt_tokens'] += prompt_tokens
+            totals['cached_tokens'] += cached_tokens
+
+    def stats(self):
+        with self._lock:
+            totals = {endpoint: dict(values) for endpoint, values in self._totals.items()}
+        for values in totals.values():
+            prompt = values['prompt_tokens']
+            values['cached_ratio'] = round(values['cached_tokens'] / prompt, 4) if prompt else 0.0
+        return totals
+
+
+prompt_cache_stats = PromptCacheStats()
+
+
+def record_usage(model, usage, endpoint=None):
+    """
+    Count the token usage of one completion (response.usage, or the final
+    chunk's usage for streams)
+    """
+    if usage is None:
+        return
+    endpoint = endpoint or current_endpoint()
+    prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+    details = getattr(usage, 'prompt_tokens_details', None)
+    cached_tokens = (getattr(details, 'cached_tokens', 0) or 0) if details is not None else 0
+    labels = {'endpoint': endpoint, 'model': model}
+    registry.inc(UPSTREAM_TOKENS, dict(labels, type='prompt'), prompt_tokens)
+    registry.inc(UPSTREAM_TOKENS, dict(labels, type='cached'), cached_tokens)
+    registry.inc(UPSTREAM_TOKENS, dict(labels, type='completion'), getattr(usage, 'completion_tokens', 0) or 0)
+    prompt_cache_stats.add(endpoint, prompt_tokens, cached_tokens)
+
+
+@contextmanager
+def time_upstream(model, endpoint=None):
+    """Time one upstream call into UPSTREAM_WAIT and the in-flight gauge"""
+    start = time.perf_counter()
+    outcome = 'error'
+    registry.inc(UPSTREAM_IN_FLIGHT)
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        registry.inc(UPSTREAM_IN_FLIGHT, amount=-1)
+        registry.observe(UPSTREAM_WAIT, time.perf_counter() - start, {
+            'endpoint': endpoint or current_endpoint(),
+            'model': model,
+            'outcome': outcome
+        })
@@ -2,49 +2,173 @@
 Authentication middleware for RockMa Creator AI
 Validates access code on every API request
 """
+import asyncio
+import inspect
 from functools import wraps
-from flask import request, jsonify
+from flask import g, request, jsonify, make_response
 from config import Config
+from server_timing import phase
+from admission import admission, rate_limiter, too_many_requests
 
-def require_auth(f):
+def check_auth():
     """
-    Decorator to protect routes with access code authentication
+    Check the Authorization header of the current request
     Expects: Authorization: Bearer ROCKMA-LOVE-2025
+    
+    Returns:
+        None if authenticated, otherwise an error (response, status) tuple
     """
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        # Get Authorization header
-        auth_header = request.headers.get('Authorization')
-        
-        if not auth_header:
+    # Get Authorization header
+    auth_header = request.headers.get('Authorization')
+    
+    if not auth_header:
+        return jsonify({
+            'success': False,
+            'error': 'No authorization provided'
+        }), 401
+    
+    # Expected format: "Bearer ROCKMA-LOVE-2025"
+    try:
+        scheme, token = auth_header.split(' ', 1)
+        if scheme.lower() != 'bearer':
             return jsonify({
                 'success': False,
-                'error': 'No authorization provided'
+                'error': 'Invalid authorization scheme'
             }), 401
         
-        # Expected format: "Bearer ROCKMA-LOVE-2025"
-        try:
-            scheme, token = auth_header.split(' ', 1)
-            if scheme.lower() != 'bearer':
-                return jsonify({
-                    'success': False,
-                    'error': 'Invalid authorization scheme'
-                }), 401
-            
-            # Validate token against ACCESS_CODE
-            if token != Config.ACCESS_CODE:
-                return jsonify({
-                    'success': False,
-                    'error': 'Invalid access code'
-                }), 403
-                
-        except ValueError:
+        # Validate token against the configured access codes
+        if token not in Config.ACCESS_CODES:
             return jsonify({
                 'success': False,
-                'error': 'Invalid authorization format'
-            }), 401
+                'error': 'Invalid access code'
+            }), 403
+        g.access_code = token
+            
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'Invalid authorization format'
+        }), 401
+    
+    return None
+
+
+def admit_request():
+    """
+    Apply the caller's token bucket, then take an admission slot
+    
+    Returns:
+        tuple: (slot_id, None) when admitted, otherwise (None, 429 response tuple)
+    """
+    with phase('admission'):
+        wait = rate_limiter.consume(g.access_code)
+        if wait:
+            return None, too_many_requests(
+                'Rate limit exceeded',
+                'Too many requests for this access code. Please slow down.',
+                wait
+            )
+        slot_id = admission.acquire()
+        if slot_id is None:
+            return None, too_many_requests(
+                'Server busy',
+                'Too many generations in progress. Please try again shortly.',
+                admission.retry_after
+            )
+    return slot_id, None
+
+
+def release_after(rv, slot_id):
+    """Free the admission slot once the response is done (streams hold it until closed)"""
+    response = make_response(rv)
+    if response.is_streamed:
+        response.call_on_close(lambda: admission.release(slot_id))
+    else:
+        admission.release(slot_id)
+    return response
+
+
+def require_auth(f):
+    """
+    Decorator to protect routes with access code authentication
+    Also enforces the per-code rate limit and the shared in-flight limit
+    Works for both regular views and the async views used by the ASGI path
+    """
+    if inspect.iscoroutinefunction(f):
+        @wraps(f)
+        async def async_decorated_function(*args, **kwargs):
+            with phase('auth'):
+                auth_error = check_auth()
+            if auth_error:
+                return auth_error
+            
+            # Admission lives in SQLite; keep its blocking calls off the event loop
+            slot_id, rejection = await asyncio.to_thread(admit_request)
+            if rejection:
+                return rejection
+            try:
+                rv = await f(*args, **kwargs)
+            except BaseException:
+                await asyncio.to_thread(admission.release, slot_id)
+                raise
+            return await asyncio.to_thread(release_after, rv, slot_id)
+        
+        return async_decorated_function
+    
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        with phase('auth'):
+            auth_error = check_auth()
+        if auth_error:
+            return auth_error
+        
+        slot_id, rejection = admit_request()
+        if rejection:
+            return rejection
         
-        # If we get here, authentication passed
+        # If we get here, authentication passed and the request was admitted
+        try:
+            rv = f(*args, **kwargs)
+        except BaseException:
+            admission.release(slot_id)
+            raise
+        return release_after(rv, slot_id)
+    
+    return decorated_function
+
+
+def require_access_code(f):
+    """
+    Decorator that only checks the access code, for cheap reads such as job
+    polling that shouldn't spend rate-limit quota or admission slots
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        with phase('auth'):
+            auth_error = check_auth()
+        if auth_error:
+            return auth_error
+        return f(*args, **kwargs)
+    
+    return decorated_function
+
+
+def require_stats_access(f):
+    """
+    Decorator for operational endpoints (stats, usage): a valid access code,
+    or METRICS_TOKEN when one is configured. g.access_code is None for
+    METRICS_TOKEN callers, who may see every owner's data.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        with phase('auth'):
+            if Config.METRICS_TOKEN and request.headers.get('Authorization') == f"Bearer {Config.METRICS_TOKEN}":
+                g.access_code = None
+                auth_error = None
+            else:
+                auth_error = check_auth()
+        if auth_error:
+            return auth_error
         return f(*args, **kwargs)
     
     return decorated_function
@@ -71,7 +195,7 @@ def validate_access_code_endpoint():
                 'error': 'Invalid authorization scheme'
             }), 401
         
-        if token != Config.ACCESS_CODE:
+        if token not in Config.ACCESS_CODES:
             return jsonify({
                 'success': False,
                 'error': 'Invalid access code'
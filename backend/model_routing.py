@@ -0,0 +1,150 @@
+"""
+Model routing
+Picks the OpenAI model for each generation: the model configured for the
+route (blueprint, or job kind), or the cheaper/faster fallback model when
+  - today's estimated spend has reached ROUTING_BUDGET_FRACTION of
+    USAGE_DAILY_BUDGET_USD (see usage_ledger.py),
+  - this worker already has ROUTING_MAX_IN_FLIGHT upstream calls open, or
+  - the route model's recent pN latency is above ROUTING_LATENCY_SECONDS.
+Each check is off while its setting is 0, so by default every route gets
+its configured model.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from config import Config
+from hedging import LatencyTracker
+from metrics import registry, current_endpoint
+from usage_ledger import usage_ledger
+
+ROUTING_DECISIONS = registry.counter(
+    'rockma_model_routing_total', 'Model chosen for each generation and why', ('route', 'model', 'reason')
+)
+
+
+def route_for(endpoint):
+    """'daily_inspiration.generate_ideas' -> 'daily_inspiration', 'jobs.platform_translator' -> 'platform_translator'"""
+    if endpoint.startswith('jobs.'):
+        return endpoint[len('jobs.'):]
+    return endpoint.split('.', 1)[0]
+
+
+class UpstreamCall:
+    """Handle yielded by ModelRouter.track"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+class ModelRouter:
+    """
+    Args:
+        default_model: Model for routes without an entry in routes
+        routes: {route: model}
+        fallback_model: Cheaper/faster model used under budget or load pressure
+            (empty disables every fallback)
+        daily_budget: Estimated USD per UTC day; 0 disables the budget check
+        budget_fraction: Share of the budget after which the fallback is used
+        max_in_flight: Upstream calls in this worker that count as overload; 0 disables
+        latency_threshold: Seconds of route-model pN latency that count as slow; 0 disables
+        latency_percentile: Which percentile of recent latencies is compared
+        min_samples: Latencies needed before the latency check applies
+    """
+
+    def __init__(self, default_model, routes=None, fallback_model='', daily_budget=0.0, budget_fraction=0.8,
+                 max_in_flight=0, latency_threshold=0.0, latency_percentile=0.9, min_samples=20):
+        self.default_model = default_model
+        self.routes = routes or {}
+        self.fallback_model = fallback_model
+        self.daily_budget = daily_budget
+        self.budget_fraction = budget_fraction
+        self.max_in_flight = max_in_flight
+        self.latency_threshold = latency_threshold
+        self.latency_percentile = latency_percentile
+        self.min_samples = min_samples
+        self.latency = LatencyTracker()
+        self._in_flight = 0
+        self._decisions = {}
+        self._lock = threading.Lock()
+
+    def _fallback_reason(self, model):
+        if self.daily_budget > 0 and usage_ledger.spend_today() >= self.daily_budget * self.budget_fraction:
+            return 'budget'
+        if self.max_in_flight > 0 and self._in_flight >= self.max_in_flight:
+            return 'load'
+        if self.latency_threshold > 0:
+            recent = self.latency.percentile(model, self.latency_percentile, self.min_samples)
+            if recent is not None and recent >= self.latency_threshold:
+                return 'latency'
+        return None
+
+    def choose(self, endpoint=None):
+        """
+        Model for a generation from endpoint (defaults to the current one)
+
+        Returns:
+            str: Model name
+        """
+        route = route_for(endpoint or current_endpoint())
+        model = self.routes.get(route, self.default_model)
+        reason = 'route'
+        if self.fallback_model and self.fallback_model != model:
+            fallback_reason = self._fallback_reason(model)
+            if fallback_reason:
+                model, reason = self.fallback_model, fallback_reason
+        with self._lock:
+            key = (route, model, reason)
+            self._decisions[key] = self._decisions.get(key, 0) + 1
+        registry.inc(ROUTING_DECISIONS, {'route': route, 'model': model, 'reason': reason})
+        return model
+
+    @contextmanager
+    def track(self, model):
+        """
+        Count one upstream call as in flight; its latency feeds the latency
+        check once it completes successfully
+
+        Yields:
+            UpstreamCall: call.elapsed() is the time since the call started
+        """
+        call = UpstreamCall()
+        with self._lock:
+            self._in_flight += 1
+        try:
+            yield call
+            self.latency.record(model, call.elapsed())
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            decisions = [
+                {'route': route, 'model': model, 'reason': reason, 'count': count}
+                for (route, model, reason), count in sorted(self._decisions.items())
+            ]
+            in_flight = self._in_flight
+        return {
+            'default_model': self.default_model,
+            'routes': dict(self.routes),
+            'fallback_model': self.fallback_model or None,
+            'daily_budget_usd': self.daily_budget or None,
+            'in_flight': in_flight,
+            'decisions': decisions
+        }
+
+
+model_router = ModelRouter(
+    Config.MODEL_DEFAULT,
+    routes=Config.MODEL_ROUTES,
+    fallback_model=Config.MODEL_FALLBACK,
+    daily_budget=Config.USAGE_DAILY_BUDGET_USD,
+    budget_fraction=Config.ROUTING_BUDGET_FRACTION,
+    max_in_flight=Config.ROUTING_MAX_IN_FLIGHT,
+    latency_threshold=Config.ROUTING_LATENCY_SECONDS,
+    latency_percentile=Config.ROUTING_LATENCY_PERCENTILE,
+    min_samples=Config.ROUTING_MIN_SAMPLES
+)
@@ -0,0 +1,248 @@
+"""
+Near-duplicate cache for competitor text
+Pasted competitor copy often differs only in whitespace, emoji or
+punctuation, which the exact-match response cache misses. Texts are
+normalized, shingled into word 3-grams and summarized with a MinHash
+signature; an LSH index (banded signatures in SQLite, shared by all
+workers) finds earlier texts whose estimated Jaccard similarity clears the
+threshold so their adaptation can be reused.
+"""
+import hashlib
+import logging
+import re
+import sqlite3
+import struct
+import threading
+import time
+import unicodedata
+from config import Config
+from local_store import get_connection
+
+logger = logging.getLogger(__name__)
+
+NEAR_DUP_DB = 'near_duplicate.db'
+
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WORD_RE = re.compile(r'[^\W_]+')
+
+# Fixed permutations so signatures stay comparable across processes and restarts
+_PERMUTATIONS = [
+    (
+        int.from_bytes(hashlib.sha256(f"a{i}".encode()).digest()[:8], 'big') % (_MERSENNE_PRIME - 1) + 1,
+        int.from_bytes(hashlib.sha256(f"b{i}".encode()).digest()[:8], 'big') % _MERSENNE_PRIME
+    )
+    for i in range(NUM_PERM)
+]
+
+
+def normalize_text(text):
+    """Case-fold and keep only words, so emoji, punctuation and spacing don't matter"""
+    text = unicodedata.normalize('NFKC', text).casefold()
+    return ' '.join(_WORD_RE.findall(text))
+
+
+def shingles(normalized):
+    """Hashed word 3-grams (a short text is one shingle)"""
+    words = normalized.split()
+    if len(words) <= SHINGLE_SIZE:
+        grams = [' '.join(words)]
+    else:
+        grams = [' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+    return {
+        int.from_bytes(hashlib.blake2b(gram.encode('utf-8'), digest_size=4).digest(), 'big')
+        for gram in grams
+    }
+
+
+def minhash(shingle_hashes):
+    """MinHash signature: the minimum of each universal hash permutation"""
+    return [
+        min(((a * x + b) % _MERSENNE_PRIME) & _MAX_HASH for x in shingle_hashes)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def band_keys(signature):
+    """One LSH bucket per band; texts sharing any bucket become candidates"""
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(struct.pack(f'>{ROWS_PER_BAND}I', *rows), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, 'big', signed=True))
+    return keys
+
+
+def similarity(signature_a, signature_b):
+    """Estimated Jaccard similarity of the two shingle sets"""
+    return sum(1 for a, b in zip(signature_a, signature_b) if a == b) / NUM_PERM
+
+
+def _pack(signature):
+    return struct.pack(f'>{NUM_PERM}I', *signature)
+
+
+def _unpack(blob):
+    return list(struct.unpack(f'>{NUM_PERM}I', blob))
+
+
+class NearDuplicateCache:
+    """
+    Args:
+        threshold: Minimum estimated similarity (0-1) to reuse an adaptation
+        max_entries: Index size cap; least recently used entries are pruned
+        ttl_seconds: Entries older than this are ignored and pruned
+    """
+
+    def __init__(self, enabled=True, threshold=0.9, max_entries=5000, ttl_seconds=604800):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._schema_ready = False
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'writes': 0, 'errors': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _conn(self):
+        conn = get_connection(NEAR_DUP_DB)
+        if not self._schema_ready:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS near_dup_entries ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, scope TEXT NOT NULL, signature BLOB NOT NULL, '
+                'result TEXT NOT NULL, created_at REAL NOT NULL, last_used_at REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS near_dup_bands ('
+                'scope TEXT NOT NULL, band INTEGER NOT NULL, bucket INTEGER NOT NULL, entry_id INTEGER NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_near_dup_bands ON near_dup_bands(scope, band, bucket)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_near_dup_bands_entry ON near_dup_bands(entry_id)')
+            self._schema_ready = True
+        return conn
+
+    def signature_for(self, text):
+        """MinHash signature of a text, or None if it has no words"""
+        normalized = normalize_text(text)
+        if not normalized:
+            return None
+        return minhash(shingles(normalized))
+
+    def lookup(self, signature, scope):
+        """
+        Find the most similar earlier text in the same scope
+
+        Args:
+            signature: From signature_for()
+            scope: Everything besides the text that shapes the output
+                (seasonality, pillar, prompt version)
+
+        Returns:
+            tuple: (result text, similarity) or None
+        """
+        if not self.enabled or signature is None:
+            return None
+        now = time.time()
+        keys = band_keys(signature)
+        try:
+            conn = self._conn()
+            clauses = ' OR '.join(['(band = ? AND bucket = ?)'] * BANDS)
+            params = [scope]
+            for band, key in enumerate(keys):
+                params.extend((band, key))
+            rows = conn.execute(
+                'SELECT id, signature, result FROM near_dup_entries WHERE id IN ('
+                f'SELECT entry_id FROM near_dup_bands WHERE scope = ? AND ({clauses})) AND created_at > ?',
+                params + [now - self.ttl_seconds]
+            ).fetchall()
+
+            best = None
+            for entry_id, blob, result in rows:
+                score = similarity(signature, _unpack(blob))
+                if score >= self.threshold and (best is None or score > best[2]):
+                    best = (entry_id, result, score)
+            if best is not None:
+                conn.execute('UPDATE near_dup_entries SET last_used_at = ? WHERE id = ?', (now, best[0]))
+        except sqlite3.Error as e:
+            logger.warning('Near-duplicate lookup failed: %s', e)
+            self._count('errors')
+            return None
+
+        if best is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return best[1], best[2]
+
+    def add(self, signature, scope, result):
+        """Index a text's signature with the result generated for it"""
+        if not self.enabled or signature is None or not result:
+            return
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                entry_id = conn.execute(
+                    'INSERT INTO near_dup_entries (scope, signature, result, created_at, last_used_at) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (scope, _pack(signature), result, now, now)
+                ).lastrowid
+                conn.executemany(
+                    'INSERT INTO near_dup_bands (scope, band, bucket, entry_id) VALUES (?, ?, ?, ?)',
+                    [(scope, band, key, entry_id) for band, key in enumerate(band_keys(signature))]
+                )
+            finally:
+                conn.execute('COMMIT')
+            self._count('writes')
+            self._writes += 1
+            if self._writes % 50 == 0:
+                self.prune()
+        except sqlite3.Error as e:
+            logger.warning('Near-duplicate write failed: %s', e)
+            self._count('errors')
+
+    def prune(self):
+        """Drop expired entries and keep only the max_entries most recently used"""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM near_dup_entries WHERE created_at <= ?', (time.time() - self.ttl_seconds,))
+            conn.execute(
+                'DELETE FROM near_dup_entries WHERE id IN ('
+                'SELECT id FROM near_dup_entries ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+            conn.execute('DELETE FROM near_dup_bands WHERE entry_id NOT IN (SELECT id FROM near_dup_entries)')
+        finally:
+            conn.execute('COMMIT')
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['enabled'] = self.enabled
+        stats['threshold'] = self.threshold
+        try:
+            stats['entries'] = self._conn().execute('SELECT COUNT(*) FROM near_dup_entries').fetchone()[0]
+        except sqlite3.Error:
+            stats['entries'] = None
+        return stats
+
+
+near_duplicate_cache = NearDuplicateCache(
+    enabled=Config.NEAR_DUP_ENABLED,
+    threshold=Config.NEAR_DUP_THRESHOLD,
+    max_entries=Config.NEAR_DUP_MAX_ENTRIES,
+    ttl_seconds=Config.NEAR_DUP_TTL_SECONDS
+)
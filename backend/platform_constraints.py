@@ -0,0 +1,237 @@
+"""
+Local platform-constraint post-processing
+Parses the sectioned output the prompts ask for (Hook / Script / Hashtags,
+or Subject Line / Email Body), trims sections that run past the platform's
+length limit at a sentence boundary, and dedupes and normalizes hashtags to
+the platform's range. Every change is reported, so an overlong output is
+fixed here in microseconds instead of by regenerating it.
+"""
+import re
+from config import Config
+from server_timing import phase
+
+# Characters per section and (min, max) hashtags, from the PLATFORM_GUIDELINES
+# lengths at roughly 100 characters a sentence
+PLATFORM_LIMITS = {
+    'TikTok': {'hook': 200, 'script': 500, 'hashtags': (5, 8)},
+    'Instagram': {'hook': 250, 'script': 700, 'hashtags': (5, 10)},
+    'YouTube': {'hook': 300, 'script': 1200, 'hashtags': (5, 8)},
+    'LinkedIn': {'body': 1500, 'hashtags': (0, 5)},
+    'Facebook Ad': {'body': 700, 'hashtags': (0, 3)},
+    'Email': {'subject': 80, 'body': 1800, 'hashtags': (0, 0)},
+}
+
+# Daily Inspiration ideas are TikTok / Instagram / Facebook posts
+IDEA_LIMITS = {'hook': 200, 'caption': 800, 'hashtags': (5, 10)}
+
+# Section headers as the prompts write them; markdown emphasis around them is tolerated
+SECTION_LABELS = {
+    'hook': 'Hook',
+    'script': 'Script',
+    'hashtags': 'Hashtags',
+    'subject': 'Subject Line',
+    'body': 'Email Body',
+}
+SECTION_KEYS = {'caption': 'script', 'subject line': 'subject', 'email body': 'body'}
+SECTION_RE = re.compile(
+    r'^[ \t]*[#*_>]*[ \t]*(hook|script|caption|hashtags|subject line|subject|email body)[ \t]*[*_]*[ \t]*:[ \t]*[*_]*[ \t]*(.*)$',
+    re.IGNORECASE
+)
+SENTENCE_END_RE = re.compile(r'[.!?…]+["\')\]”’]*(?=\s|$)')
+HASHTAG_SPLIT_RE = re.compile(r'[\s,;]+')
+
+
+def trim_text(text, limit):
+    """
+    Shorten text to at most limit characters, preferring the last sentence
+    end and falling back to a word boundary with an ellipsis
+    """
+    text = text.strip()
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    ends = [match.end() for match in SENTENCE_END_RE.finditer(cut)]
+    if ends and ends[-1] >= limit // 2:
+        return cut[:ends[-1]].rstrip()
+    space = cut.rfind(' ', 0, limit - 1)
+    base = cut[:space] if space > limit // 2 else cut[:limit - 1]
+    return base.rstrip(' ,;:-–—') + '…'
+
+
+def normalize_hashtags(raw, max_count):
+    """
+    Parse a hashtag list into #Tags: the leading # added where missing,
+    punctuation dropped, case-insensitive duplicates removed, capped at max_count
+
+    Returns:
+        tuple: (tags list, normalized count, removed duplicates list, dropped over-limit list)
+    """
+    tags = []
+    seen = set()
+    duplicates = []
+    normalized = 0
+    for token in HASHTAG_SPLIT_RE.split(raw.strip()):
+        if not token:
+            continue
+        word = ''.join(ch for ch in token.lstrip('#') if ch.isalnum() or ch == '_')
+        if not word:
+            continue
+        tag = f'#{word}'
+        if tag != token:
+            normalized += 1
+        if word.casefold() in seen:
+            duplicates.append(tag)
+            continue
+        seen.add(word.casefold())
+        tags.append(tag)
+    return tags[:max_count], normalized, duplicates, tags[max_count:]
+
+
+def _hashtag_changes(field, raw, hashtag_range, report):
+    """Normalize one hashtag list, recording changes/warnings; returns the fixed text"""
+    min_count, max_count = hashtag_range
+    tags, normalized, duplicates, dropped = normalize_hashtags(raw, max_count)
+    if normalized:
+        report['changes'].append({'field': field, 'action': 'normalized', 'count': normalized})
+    if duplicates:
+        report['changes'].append({'field': field, 'action': 'deduplicated', 'removed': duplicates})
+    if dropped:
+        action = 'removed' if max_count == 0 else 'trimmed'
+        report['changes'].append({'field': field, 'action': action, 'removed': dropped, 'limit': max_count})
+    if len(tags) < min_count:
+        report['warnings'].append({'field': field, 'issue': 'too_few_hashtags', 'count': len(tags), 'minimum': min_count})
+    return ' '.join(tags)
+
+
+def _trim_field(field, text, limit, report):
+    trimmed = trim_text(text, limit)
+    if trimmed != text.strip():
+        report['changes'].append({
+            'field': field, 'action': 'trimmed', 'before': len(text.strip()), 'after': len(trimmed), 'limit': limit
+        })
+    return trimmed
+
+
+def parse_sections(text):
+    """
+    Split sectioned output into its parts
+
+    Returns:
+        list: [(key or None, text)] in order; key None is text before the first header
+    """
+    sections = [[None, []]]
+    for line in text.splitlines():
+        match = SECTION_RE.match(line)
+        if match:
+            name = match.group(1).lower()
+            sections.append([SECTION_KEYS.get(name, name), [match.group(2)] if match.group(2).strip() else []])
+        else:
+            sections[-1][1].append(line)
+    return [(key, '\n'.join(lines).strip()) for key, lines in sections if key or '\n'.join(lines).strip()]
+
+
+def _split_trailing_hashtags(body):
+    """Free-form posts end with a run of hashtags (own line or not); returns (body, hashtag text)"""
+    words = re.split(r'(\s+)', body.rstrip())
+    cut = len(words)
+    while cut > 0 and (words[cut - 1].isspace() or words[cut - 1].startswith('#')):
+        cut -= 1
+    tags = [word for word in words[cut:] if not word.isspace()]
+    return ''.join(words[:cut]).rstrip(), ' '.join(tags)
+
+
+def enforce_platform(text, platform):
+    """
+    Fit a translation to its platform's length and hashtag limits
+
+    Args:
+        text: Generated content in the prompt's output format
+        platform: A PLATFORM_LIMITS key (unknown platforms are returned unchanged)
+
+    Returns:
+        tuple: (text, report) where report is { changes: [...], warnings: [...] },
+            or (text, None) when post-processing is disabled
+    """
+    if not Config.PLATFORM_CONSTRAINTS_ENABLED:
+        return text, None
+    report = {'changes': [], 'warnings': []}
+    limits = PLATFORM_LIMITS.get(platform)
+    if limits is None:
+        return text, report
+
+    with phase('postprocess'):
+        sections = parse_sections(text)
+        keyed = [key for key, _ in sections if key]
+        if not keyed:
+            # Free-form post (or the model ignored the format): one body plus trailing hashtags
+            body, hashtags = _split_trailing_hashtags(text)
+            body_limit = limits.get('body') or limits['hook'] + limits['script']
+            fixed = [(None, _trim_field('body', body, body_limit, report))]
+            if hashtags:
+                fixed_tags = _hashtag_changes('hashtags', hashtags, limits['hashtags'], report)
+                if fixed_tags:
+                    fixed.append((None, fixed_tags))
+        else:
+            fixed = []
+            for key, content in sections:
+                if key == 'hashtags':
+                    content = _hashtag_changes('hashtags', content, limits['hashtags'], report)
+                    if not content and limits['hashtags'][1] == 0:
+                        continue
+                elif key and limits.get(key):
+                    content = _trim_field(key, content, limits[key], report)
+                fixed.append((key, content))
+            if 'hashtags' not in keyed and limits['hashtags'][0] > 0:
+                report['warnings'].append({'field': 'hashtags', 'issue': 'missing'})
+
+    if not report['changes']:
+        return text, report
+    return render_sections(fixed), report
+
+
+def render_sections(sections):
+    """Inverse of parse_sections with canonical headers"""
+    blocks = []
+    for key, content in sections:
+        if key is None:
+            blocks.append(content)
+            continue
+        blocks.append(f"{SECTION_LABELS[key]}:\n{content}")
+    return '\n\n'.join(block for block in blocks if block)
+
+
+def enforce_idea(idea, limits=IDEA_LIMITS):
+    """
+    Fit one { hook, caption, hashtags } idea to the idea limits
+
+    Returns:
+        tuple: (idea, report)
+    """
+    report = {'changes': [], 'warnings': []}
+    fixed = dict(idea)
+    fixed['hook'] = _trim_field('hook', str(idea.get('hook', '')), limits['hook'], report)
+    fixed['caption'] = _trim_field('caption', str(idea.get('caption', '')), limits['caption'], report)
+    fixed['hashtags'] = _hashtag_changes('hashtags', str(idea.get('hashtags', '')), limits['hashtags'], report)
+    if not report['changes']:
+        fixed = idea
+    return fixed, report
+
+
+def enforce_ideas(ideas):
+    """
+    enforce_idea over a list, with every change tagged by the idea's index
+
+    Returns:
+        tuple: (ideas, report) or (ideas, None) when post-processing is disabled
+    """
+    if not Config.PLATFORM_CONSTRAINTS_ENABLED:
+        return ideas, None
+    report = {'changes': [], 'warnings': []}
+    fixed_ideas = []
+    with phase('postprocess'):
+        for index, idea in enumerate(ideas):
+            fixed, idea_report = enforce_idea(idea)
+            fixed_ideas.append(fixed)
+            report['changes'].extend(dict(change, index=index) for change in idea_report['changes'])
+            report['warnings'].extend(dict(warning, index=index) for warning in idea_report['warnings'])
+    return fixed_ideas, report
@@ -0,0 +1,218 @@
+"""
+Precompiled prompt templates
+Every static prompt piece (persona, each seasonality x pillar context, each
+platform x audience target block, each route's system prompt and the flat
+product list) is built once and served from memory with its token count.
+The registry fingerprints the definitions in ai_persona and recompiles only
+when that fingerprint changes.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+import ai_persona
+from config import Config
+
+try:
+    import tiktoken
+except ImportError:  # Optional - token counts fall back to a ~4 characters per token estimate
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Name of the system prompt used when a route doesn't register its own task
+DEFAULT_TASK = 'default'
+
+
+def _encoder():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding('o200k_base')
+    except Exception as e:  # Encoding files are downloaded on first use
+        logger.warning('tiktoken unavailable, estimating prompt tokens: %s', e)
+        return None
+
+
+class PromptRegistry:
+    """
+    Args:
+        check_interval_seconds: How often maybe_refresh() re-fingerprints the
+            definitions (0 = only when refresh() is called)
+    """
+
+    def __init__(self, check_interval_seconds=60):
+        self.check_interval_seconds = check_interval_seconds
+        self._tasks = {DEFAULT_TASK: ''}
+        self._lock = threading.Lock()
+        self._encoder = _encoder()
+        self._compiled = None
+        self._last_check = 0.0
+        self._compiles = 0
+
+    def count_tokens(self, text):
+        if self._encoder is not None:
+            return len(self._encoder.encode(text))
+        return (len(text) + 3) // 4
+
+    def _instructions(self, instructions):
+        return instructions() if callable(instructions) else instructions
+
+    def fingerprint(self):
+        """Hash of every definition the templates are built from"""
+        with self._lock:
+            tasks = {name: self._instructions(instructions) for name, instructions in self._tasks.items()}
+        definitions = {
+            'inventory': ai_persona.PRODUCT_INVENTORY,
+            'voice': ai_persona.BRAND_VOICE,
+            'platforms': ai_persona.PLATFORM_GUIDELINES,
+            'audiences': ai_persona.AUDIENCE_GUIDELINES,
+            'seasonality': ai_persona.SEASONALITY_PROMPTS,
+            'pillars': ai_persona.PILLAR_PROMPTS,
+            'tasks': tasks
+        }
+        canonical = json.dumps(definitions, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+
+    def _compile(self, fingerprint):
+        with self._lock:
+            tasks = dict(self._tasks)
+        templates = {
+            'persona': ai_persona.get_base_system_prompt(),
+            'guidelines': ai_persona.get_guidelines_prompt()
+        }
+        contexts = {}
+        for seasonality in ai_persona.SEASONALITY_PROMPTS:
+            for pillar in ai_persona.PILLAR_PROMPTS:
+                contexts[(seasonality, pillar)] = ai_persona.get_contextual_prompt(seasonality, pillar)
+                templates[f'context:{seasonality}:{pillar}'] = contexts[(seasonality, pillar)]
+        targets = {}
+        for platform in ai_persona.PLATFORM_GUIDELINES:
+            for audience in ai_persona.AUDIENCE_GUIDELINES:
+                targets[(platform, audience)] = f"TARGET PLATFORM: {platform}\nTARGET AUDIENCE: {audience}"
+                templates[f'target:{platform}:{audience}'] = targets[(platform, audience)]
+        system_prompts = {}
+        for name, instructions in tasks.items():
+            system_prompts[name] = ai_persona.build_system_prompt(self._instructions(instructions))
+            templates[f'system:{name}'] = system_prompts[name]
+        products = tuple(ai_persona.get_product_list())
+        catalog = {
+            'version': fingerprint,
+            'products': list(products),
+            'productCategories': {category: list(items) for category, items in ai_persona.PRODUCT_INVENTORY.items()},
+            'platforms': {name: dict(rules) for name, rules in ai_persona.PLATFORM_GUIDELINES.items()},
+            'audiences': {name: dict(rules) for name, rules in ai_persona.AUDIENCE_GUIDELINES.items()},
+            'seasonalities': list(ai_persona.SEASONALITY_PROMPTS),
+            'pillars': list(ai_persona.PILLAR_PROMPTS)
+        }
+        return {
+            'fingerprint': fingerprint,
+            'templates': templates,
+            'tokens': {name: self.count_tokens(text) for name, text in templates.items()},
+            'contexts': contexts,
+            'targets': targets,
+            'system_prompts': system_prompts,
+            'products': products,
+            'product_set': frozenset(products),
+            'catalog': catalog
+        }
+
+    def refresh(self):
+        """
+        Recompile if the definitions changed since the last compile
+
+        Returns:
+            bool: True if the templates were rebuilt
+        """
+        fingerprint = self.fingerprint()
+        compiled = self._compiled
+        if compiled is not None and compiled['fingerprint'] == fingerprint:
+            return False
+        # Readers keep using the old snapshot until the new one is swapped in
+        self._compiled = self._compile(fingerprint)
+        with self._lock:
+            self._compiles += 1
+        if compiled is not None:
+            logger.info('Prompt definitions changed, recompiled templates (%s)', fingerprint)
+        return True
+
+    def maybe_refresh(self):
+        """refresh() at most once per check interval; cheap enough for every request"""
+        if not self.check_interval_seconds:
+            return
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval_seconds:
+            return
+        self._last_check = now
+        self.refresh()
+
+    def _current(self):
+        if self._compiled is None:
+            self.refresh()
+        return self._compiled
+
+    def register_task(self, name, instructions):
+        """
+        Register a route's static task instructions; its system prompt is the
+        shared persona prefix followed by them
+
+        Args:
+            name: Task name passed to system_prompt()
+            instructions: Instruction text, or a callable returning it when the
+                text is derived from other definitions
+        """
+        with self._lock:
+            self._tasks[name] = instructions
+        if self._compiled is not None:
+            self.refresh()
+
+    # Lookups
+
+    def system_prompt(self, name=DEFAULT_TASK):
+        return self._current()['system_prompts'][name]
+
+    def context(self, seasonality='none', pillar='support'):
+        """Seasonality + pillar context; unknown keys contribute nothing, as in get_contextual_prompt"""
+        compiled = self._current()
+        context = compiled['contexts'].get((seasonality, pillar))
+        if context is None:
+            return ai_persona.get_contextual_prompt(seasonality, pillar)
+        return context
+
+    def target(self, platform, audience):
+        return self._current()['targets'][(platform, audience)]
+
+    def products(self):
+        """Every product in inventory order, as a tuple"""
+        return self._current()['products']
+
+    def has_product(self, product):
+        return isinstance(product, str) and product in self._current()['product_set']
+
+    def catalog(self):
+        """
+        Client-facing tables: products, platforms, audiences, seasonalities, pillars
+        'version' is the definitions fingerprint, so it changes whenever they do
+        """
+        return self._current()['catalog']
+
+    def token_count(self, name):
+        """Precomputed tokens of a template, e.g. 'persona', 'system:translation', 'context:christmas:support'"""
+        return self._current()['tokens'][name]
+
+    def stats(self):
+        compiled = self._current()
+        with self._lock:
+            compiles = self._compiles
+        return {
+            'fingerprint': compiled['fingerprint'],
+            'compiles': compiles,
+            'templates': len(compiled['templates']),
+            'tokenizer': 'tiktoken' if self._encoder is not None else 'estimate',
+            'system_prompt_tokens': {name: compiled['tokens'][f'system:{name}'] for name in compiled['system_prompts']},
+            'persona_tokens': compiled['tokens']['persona']
+        }
+
+
+prompt_registry = PromptRegistry(check_interval_seconds=Config.PROMPT_REGISTRY_CHECK_SECONDS)
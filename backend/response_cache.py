@@ -0,0 +1,210 @@
+"""
+Two-tier response cache for AI generations
+An in-process LRU with TTL sits in front of a SQLite store that every
+gunicorn worker on the instance can read and write
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config import Config
+from local_store import get_connection
+
+logger = logging.getLogger(__name__)
+
+CACHE_DB = 'response_cache.db'
+
+# Prune expired/overflow rows from the disk tier every N writes
+PRUNE_EVERY_WRITES = 100
+
+
+def make_cache_key(system_prompt, user_prompt, model, temperature, response_format=None):
+    """
+    Build the cache key for a generation
+
+    Args:
+        system_prompt: Full system prompt (hashed, since it is several KB)
+        user_prompt: The user's prompt/request
+        model: OpenAI model name
+        temperature: Sampling temperature
+        response_format: Optional structured-output format (changes the output shape)
+
+    Returns:
+        str: Hex digest identifying the generation
+    """
+    system_hash = hashlib.sha256(system_prompt.encode('utf-8')).hexdigest()
+    parts = [system_hash, user_prompt, model, float(temperature)]
+    if response_format:
+        parts.append(response_format)
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class MemoryLRU:
+    """Thread-safe LRU with per-entry expiry"""
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at=None):
+        if self.max_entries <= 0:
+            return
+        expires_at = expires_at or time.time() + self.ttl_seconds
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskStore:
+    """SQLite-backed tier shared by all worker processes"""
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._writes = 0
+        self._schema_ready = False
+
+    def _conn(self):
+        conn = get_connection(CACHE_DB)
+        if not self._schema_ready:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS response_cache ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                'created_at REAL NOT NULL, expires_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_response_cache_created ON response_cache(created_at)')
+            self._schema_ready = True
+        return conn
+
+    def get(self, key):
+        """Returns (value, expires_at) or None"""
+        row = self._conn().execute(
+            'SELECT value, expires_at FROM response_cache WHERE key = ? AND expires_at > ?',
+            (key, time.time())
+        ).fetchone()
+        return row
+
+    def set(self, key, value):
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            'INSERT OR REPLACE INTO response_cache (key, value, created_at, expires_at) VALUES (?, ?, ?, ?)',
+            (key, value, now, now + self.ttl_seconds)
+        )
+        self._writes += 1
+        if self._writes % PRUNE_EVERY_WRITES == 0:
+            self.prune()
+
+    def prune(self):
+        """Drop expired rows and trim the table down to max_entries"""
+        conn = self._conn()
+        conn.execute('DELETE FROM response_cache WHERE expires_at <= ?', (time.time(),))
+        conn.execute(
+            'DELETE FROM response_cache WHERE key IN ('
+            'SELECT key FROM response_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+
+    def count(self):
+        return self._conn().execute('SELECT COUNT(*) FROM response_cache').fetchone()[0]
+
+
+class ResponseCache:
+    """
+    Memory tier first, then disk tier; disk hits are promoted into memory.
+    Disk errors are logged and treated as misses so caching never breaks a
+    generation.
+    """
+
+    def __init__(self, enabled=True, ttl_seconds=86400, memory_entries=512, disk_entries=20000):
+        self.enabled = enabled
+        self.memory = MemoryLRU(memory_entries, ttl_seconds)
+        self.disk = DiskStore(disk_entries, ttl_seconds) if disk_entries > 0 else None
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'writes': 0, 'errors': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            self._count('memory_hits')
+            return value
+
+        if self.disk is not None:
+            try:
+                row = self.disk.get(key)
+            except sqlite3.Error as e:
+                logger.warning('Response cache read failed: %s', e)
+                self._count('errors')
+                row = None
+            if row is not None:
+                value, expires_at = row
+                self.memory.set(key, value, expires_at)
+                self._count('disk_hits')
+                return value
+
+        self._count('misses')
+        return None
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        self._count('writes')
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value)
+            except sqlite3.Error as e:
+                logger.warning('Response cache write failed: %s', e)
+                self._count('errors')
+
+    def stats(self):
+        """Returns hit/miss counters for this worker plus tier sizes"""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0
+        stats['enabled'] = self.enabled
+        stats['memory_entries'] = len(self.memory)
+        if self.disk is not None:
+            try:
+                stats['disk_entries'] = self.disk.count()
+            except sqlite3.Error:
+                stats['disk_entries'] = None
+        return stats
+
+
+response_cache = ResponseCache(
+    enabled=Config.RESPONSE_CACHE_ENABLED,
+    ttl_seconds=Config.RESPONSE_CACHE_TTL_SECONDS,
+    memory_entries=Config.RESPONSE_CACHE_MEMORY_ENTRIES,
+    disk_entries=Config.RESPONSE_CACHE_DISK_ENTRIES
+)
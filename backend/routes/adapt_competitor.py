@@ -1,22 +1,194 @@
 """
 Adapt a Competitor API Routes
 Rewrites competitor content in RockMa brand voice
+Long documents are split at section/paragraph boundaries and the chunks
+adapted in parallel, then joined back in order
 """
-from flask import Blueprint, request, jsonify
-from utils import generate_ai_content
+import asyncio
+import hashlib
+from flask import Blueprint, g, request, jsonify
+from config import Config
 from request_validators import validate_json_request
 from middleware.auth_middleware import require_auth
-from ai_persona import get_contextual_prompt
+from prompt_registry import prompt_registry
+from streaming import wants_stream
+from generation import GenerationPlan, MapReducePlan
+from document_chunks import split_document
+from single_flight import enabled_for as single_flight_enabled_for
+from hedging import enabled_for as hedging_enabled_for
+from server_timing import phase
+from near_duplicate import near_duplicate_cache
+from jobs import job_queue, wants_job, enqueue_response
+from upstream import UpstreamUnavailable, unavailable_response
+from content_library import content_library
+from admission import fan_out_rejection
 
 adapt_competitor_bp = Blueprint('adapt_competitor', __name__)
 
+# Static task instructions (system message); the competitor text goes in the user message
+ADAPTATION_INSTRUCTIONS = """CURRENT TASK: ADAPT COMPETITOR CONTENT
+You will receive competitor content (from brands like Burt's Bees, EOS, or similar). Rewrite it in the RockMa "Mama's Love" brand voice.
+
+INSTRUCTIONS:
+1. Maintain the core message and value proposition, but rewrite it in RockMa's warm, caring, inspirational voice
+2. Emphasize RockMa's differentiators:
+   - Mom-owned business (relatable owner, not a conglomerate)
+   - Clean, organic production from the start
+   - Ethically and sustainably made in the USA
+   - USDA ORGANIC certified
+   - Leaping Bunny certified
+3. Use the brand keywords: Love, Joy, Hope, Peace, Nurture, Clean, Healthy, Community, Inspire
+4. Make it feel authentic and personal, like a caring note from a mother
+5. Keep the same general structure and length, but infuse it with RockMa's personality
+6. Follow any seasonal or communication pillar context given with the request
+
+Return ONLY the rewritten content, without any additional explanation or formatting."""
+
+prompt_registry.register_task('adaptation', ADAPTATION_INSTRUCTIONS)
+
+def adaptation_system_prompt():
+    return prompt_registry.system_prompt('adaptation')
+
+def build_adaptation_prompt(competitor_text, seasonality='none', pillar='support'):
+    """Build the user prompt (context, then the competitor text) for one rewrite"""
+    # Get the precompiled contextual prompt based on settings
+    contextual_prompt = prompt_registry.context(seasonality, pillar)
+    contextual_instruction = f"{contextual_prompt}\n\n" if contextual_prompt else ""
+    
+    return f"""{contextual_instruction}COMPETITOR CONTENT:
+{competitor_text}"""
+
+def build_chunk_prompt(chunk, index, total, seasonality='none', pillar='support'):
+    """User prompt for one chunk of a long competitor document"""
+    return f"""This is part {index + 1} of {total} of a longer document; the other parts are adapted separately and joined in order.
+Rewrite only this part. Keep its headings and paragraph breaks, and do not add an introduction, greeting or sign-off it does not already have.
+
+{build_adaptation_prompt(chunk, seasonality, pillar)}"""
+
+def near_duplicate_scope(seasonality, pillar):
+    """Near-duplicate index scope: the settings plus the prompts around the text"""
+    template = adaptation_system_prompt() + build_adaptation_prompt('', seasonality, pillar)
+    return f"{seasonality}|{pillar}|{hashlib.sha256(template.encode('utf-8')).hexdigest()[:16]}"
+
+def prepare_adaptation(data):
+    """
+    Validate a rewrite request body and build its generation plan
+    
+    Texts longer than ADAPT_CHUNK_CHARS get a MapReducePlan over their chunks
+    
+    Returns:
+        tuple: (plan: GenerationPlan / MapReducePlan or None, error: (payload, status) or None)
+    """
+    competitor_text = data['competitorText'].strip()
+    seasonality = data.get('seasonality', 'none')
+    pillar = data.get('pillar', 'support')
+    
+    if not competitor_text:
+        return None, ({
+            'success': False,
+            'error': 'competitorText cannot be empty'
+        }, 400)
+    
+    # Checked before any prompt building or upstream call
+    if len(competitor_text) > Config.ADAPT_MAX_CHARS:
+        return None, ({
+            'success': False,
+            'error': f'competitorText is too long ({len(competitor_text)} characters). The limit is {Config.ADAPT_MAX_CHARS}'
+        }, 413)
+    
+    with phase('prompt'):
+        user_prompt = build_adaptation_prompt(competitor_text, seasonality, pillar)
+    
+    # Reuse the adaptation of an earlier, near-identical competitor post
+    with phase('cache'):
+        scope = near_duplicate_scope(seasonality, pillar)
+        signature = near_duplicate_cache.signature_for(competitor_text)
+        match = near_duplicate_cache.lookup(signature, scope)
+    prior = match[0] if match else None
+    
+    chunks = [competitor_text]
+    if prior is None and len(competitor_text) > Config.ADAPT_CHUNK_CHARS:
+        with phase('prompt'):
+            chunks = split_document(competitor_text, Config.ADAPT_CHUNK_CHARS)
+    
+    def build_payload(adapted_text):
+        if prior is None:
+            near_duplicate_cache.add(signature, scope, adapted_text)
+        payload = {
+            'success': True,
+            'adaptedText': adapted_text
+        }
+        if len(chunks) > 1:
+            payload['chunks'] = len(chunks)
+        draft_id = content_library.autosave_text('adaptation', adapted_text, {'seasonality': seasonality, 'pillar': pillar})
+        if draft_id is not None:
+            payload['draftId'] = draft_id
+        return payload, 200
+    
+    if len(chunks) > 1:
+        with phase('prompt'):
+            user_prompts = [
+                build_chunk_prompt(chunk, index, len(chunks), seasonality, pillar)
+                for index, chunk in enumerate(chunks)
+            ]
+        return MapReducePlan(
+            user_prompts,
+            build_payload,
+            'Failed to adapt competitor content',
+            system_prompt=adaptation_system_prompt(),
+            temperature=0.7,
+            coalesce=single_flight_enabled_for('adapt_competitor'),
+            hedge=hedging_enabled_for('adapt_competitor'),
+            max_concurrency=Config.ADAPT_MAX_CONCURRENCY
+        ), None
+    
+    return GenerationPlan(
+        user_prompt,
+        build_payload,
+        'Failed to adapt competitor content',
+        system_prompt=adaptation_system_prompt(),
+        temperature=0.7,
+        coalesce=single_flight_enabled_for('adapt_competitor'),
+        hedge=hedging_enabled_for('adapt_competitor'),
+        cached_text=prior
+    ), None
+
+def run_adaptation_job(data):
+    """Background job runner for ?async=1 rewrites, returns (payload, status)"""
+    plan, error = prepare_adaptation(data)
+    if error:
+        return error
+    return plan.run()
+
+job_queue.register('adapt_competitor', run_adaptation_job, 'Failed to adapt competitor content')
+
+def charge_chunks(plan):
+    """
+    Each extra chunk of a long document costs one more token, up to a full
+    bucket, so documents up to ADAPT_MAX_CHARS can always run
+    
+    Returns:
+        Flask 429 response, or None when the request may go ahead
+    """
+    if not isinstance(plan, MapReducePlan):
+        return None
+    parts = len(plan.user_prompts)
+    return fan_out_rejection(
+        g.access_code, parts, f'This document is adapted in {parts} parts and needs more request quota. Please try again later.'
+    )
+
 @adapt_competitor_bp.route('/rewrite', methods=['POST'])
 @require_auth
 def rewrite_content():
     """
     Adapt competitor content for RockMa brand
     Accepts: { competitorText: string }
-    Returns: { adaptedText: string }
+    Returns: { adaptedText: string, chunks?: number }
+    competitorText is limited to ADAPT_MAX_CHARS (413 beyond); longer than
+    ADAPT_CHUNK_CHARS it is adapted in parallel chunks, each costing a request of
+    quota (at most RATE_LIMIT_BURST)
+    Streams Server-Sent Events instead when called with ?stream=1
+    Queues a background job instead when called with ?async=1 (202 + jobId)
     """
     # Validate request
     is_valid, error_response = validate_json_request(request, ['competitorText'])
@@ -24,53 +196,61 @@ def rewrite_content():
         return error_response
     
     try:
-        data = request.get_json()
-        competitor_text = data['competitorText'].strip()
-        seasonality = data.get('seasonality', 'none')
-        pillar = data.get('pillar', 'support')
+        plan, error = prepare_adaptation(request.get_json())
+        if error:
+            return jsonify(error[0]), error[1]
         
-        if not competitor_text:
-            return jsonify({
-                'success': False,
-                'error': 'competitorText cannot be empty'
-            }), 400
+        rate_limited = charge_chunks(plan)
+        if rate_limited:
+            return rate_limited
         
-        # Get contextual prompt based on settings
-        contextual_prompt = get_contextual_prompt(seasonality, pillar)
-        contextual_instruction = f"\n\n{contextual_prompt}" if contextual_prompt else ""
+        if wants_job(request):
+            return enqueue_response('adapt_competitor', request.get_json())
+        
+        if wants_stream(request):
+            return plan.stream()
         
-        # Build the prompt for adapting content
-        user_prompt = f"""Rewrite the following competitor content (from brands like Burt's Bees, EOS, or similar) in the RockMa "Mama's Love" brand voice.
-
-COMPETITOR CONTENT:
-{competitor_text}
-
-INSTRUCTIONS:
-1. Maintain the core message and value proposition, but rewrite it in RockMa's warm, caring, inspirational voice
-2. Emphasize RockMa's differentiators:
-   - Mom-owned business (relatable owner, not a conglomerate)
-   - Clean, organic production from the start
-   - Ethically and sustainably made in the USA
-   - USDA ORGANIC certified
-   - Leaping Bunny certified
-3. Use the brand keywords: Love, Joy, Hope, Peace, Nurture, Clean, Healthy, Community, Inspire
-4. Make it feel authentic and personal, like a caring note from a mother
-5. Keep the same general structure and length, but infuse it with RockMa's personality{contextual_instruction}
-
-Return ONLY the rewritten content, without any additional explanation or formatting."""
-
         # Generate adapted content using AI
-        adapted_text = generate_ai_content(user_prompt, temperature=0.7)
+        payload, status = plan.run()
+        return jsonify(payload), status
         
+    except UpstreamUnavailable as e:
+        return unavailable_response(e)
+    except Exception as e:
         return jsonify({
-            'success': True,
-            'adaptedText': adapted_text
-        }), 200
+            'success': False,
+            'error': str(e),
+            'message': 'Failed to adapt competitor content'
+        }), 500
+
+@require_auth
+async def rewrite_content_async():
+    """ASGI twin of rewrite_content - awaits the async OpenAI client"""
+    is_valid, error_response = validate_json_request(request, ['competitorText'])
+    if not is_valid:
+        return error_response
+    
+    try:
+        # SQLite work (near-duplicate lookups, rate limits, job queue) runs on a thread, not the event loop
+        plan, error = await asyncio.to_thread(prepare_adaptation, request.get_json())
+        if error:
+            return jsonify(error[0]), error[1]
         
+        rate_limited = await asyncio.to_thread(charge_chunks, plan)
+        if rate_limited:
+            return rate_limited
+        
+        if wants_job(request):
+            return await asyncio.to_thread(enqueue_response, 'adapt_competitor', request.get_json())
+        
+        payload, status = await plan.run_async()
+        return jsonify(payload), status
+        
+    except UpstreamUnavailable as e:
+        return unavailable_response(e)
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e),
             'message': 'Failed to adapt competitor content'
         }), 500
-
@@ -0,0 +1,54 @@
+"""
+Catalog API Routes
+Products, platforms, audiences, seasonalities and pillars for the frontend,
+served with a content-hash ETag so repeat loads are answered with a 304
+"""
+import hashlib
+import threading
+from flask import Blueprint, current_app, request
+from config import Config
+from fast_json import dumps
+from prompt_registry import prompt_registry
+
+catalog_bp = Blueprint('catalog', __name__)
+
+_rendered = {}
+_lock = threading.Lock()
+
+def rendered_catalog():
+    """
+    The catalog serialized once per version of the definitions
+
+    Returns:
+        tuple: (body bytes, etag)
+    """
+    catalog = prompt_registry.catalog()
+    with _lock:
+        if _rendered.get('version') != catalog['version']:
+            body = (dumps(catalog) + '\n').encode('utf-8')
+            _rendered.update(
+                version=catalog['version'],
+                body=body,
+                etag=hashlib.sha256(body).hexdigest()[:32]
+            )
+        return _rendered['body'], _rendered['etag']
+
+@catalog_bp.route('', methods=['GET'])
+def get_catalog():
+    """
+    GET /api/catalog
+    Returns: { version, products, productCategories, platforms, audiences, seasonalities, pillars }
+    Public (nothing here is secret) and cacheable; send If-None-Match with the
+    ETag to get a 304 instead of the body
+    """
+    body, etag = rendered_catalog()
+    response = current_app.response_class(body, mimetype='application/json')
+    # Set before make_conditional so a 304 carries the same validators as the
+    # (possibly compressed, weakly tagged) 200 it revalidates
+    response.set_etag(etag, weak=Config.COMPRESSION_ENABLED)
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = (
+        f'public, max-age={Config.CATALOG_MAX_AGE_SECONDS}, '
+        f'stale-while-revalidate={Config.CATALOG_STALE_SECONDS}'
+    )
+    return response.make_conditional(request)
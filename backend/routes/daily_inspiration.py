@@ -2,21 +2,388 @@
 Daily Inspiration API Routes
 Generates 3-5 unique content ideas with Hook, Caption, Hashtags
 """
-from flask import Blueprint, request, jsonify
+from datetime import date
+from flask import Blueprint, g, request, jsonify, Response, stream_with_context
+from config import Config
 from utils import generate_ai_content
-from ai_persona import PRODUCT_INVENTORY, get_contextual_prompt
+from ai_persona import SEASONALITY_PROMPTS, PILLAR_PROMPTS
+from prompt_registry import prompt_registry
 from middleware.auth_middleware import require_auth
+from streaming import wants_stream
+from generation import GenerationPlan, fan_out
+from single_flight import enabled_for as single_flight_enabled_for
+from hedging import enabled_for as hedging_enabled_for
+from inspiration_pool import InspirationPool
+from json_stream import ArrayObjectParser, parse_array_objects
+from json_repair import repair_json, record_outcome
+from server_timing import phase
+from upstream import UpstreamUnavailable, unavailable_response
+from jobs import job_queue, wants_job, enqueue_response, owner_id, current_owner
+from admission import fan_out_rejection
+from content_calendar import plan_days, batch_entries, calendar_id, calendar_store
+from platform_constraints import enforce_ideas
+from content_library import content_library, idea_text
+import asyncio
 import json
+import logging
 import random
+import sqlite3
+import fast_json
+
+logger = logging.getLogger(__name__)
 
 daily_inspiration_bp = Blueprint('daily_inspiration', __name__)
 
+# Invalid-product errors point here instead of listing every product
+CATALOG_URL = '/api/catalog'
+
 def get_random_product():
     """Get a random product from inventory"""
-    all_products = []
-    for category, items in PRODUCT_INVENTORY.items():
-        all_products.extend(items)
-    return random.choice(all_products) if all_products else "RockMa product"
+    products = prompt_registry.products()
+    return random.choice(products) if products else "RockMa product"
+
+# Schema for STRUCTURED_OUTPUT=json_schema (structured output needs an object at the top level)
+IDEAS_JSON_SCHEMA = {
+    "name": "daily_inspiration_ideas",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "ideas": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "hook": {"type": "string"},
+                        "caption": {"type": "string"},
+                        "hashtags": {"type": "string"}
+                    },
+                    "required": ["hook", "caption", "hashtags"],
+                    "additionalProperties": False
+                }
+            }
+        },
+        "required": ["ideas"],
+        "additionalProperties": False
+    }
+}
+
+def ideas_response_format():
+    """Returns the OpenAI response_format for the configured structured-output mode, or None"""
+    if Config.STRUCTURED_OUTPUT == 'json_schema':
+        return {"type": "json_schema", "json_schema": IDEAS_JSON_SCHEMA}
+    if Config.STRUCTURED_OUTPUT == 'json_object':
+        return {"type": "json_object"}
+    return None
+
+# Static task instructions (system message); product and context go in the user message
+IDEAS_INSTRUCTIONS = """CURRENT TASK: DAILY INSPIRATION IDEAS
+Generate 3-5 unique content ideas for social media (TikTok, Instagram, Facebook) about the specific RockMa product named in the request, following any seasonal or communication pillar context given with it.
+
+For each idea, provide:
+1. HOOK: An attention-grabbing opening line (1-2 sentences)
+2. CAPTION: The post caption text that goes with the photo/video (2-4 sentences)
+3. HASHTAGS: 5-10 relevant hashtags
+
+Format your response as a JSON array where each object has "hook", "caption", and "hashtags" fields.
+
+Example format:
+[
+  {
+    "hook": "You know that feeling when your skin just drinks up moisture?",
+    "caption": "That's what our Better Body Butter does every single day. Made with love and the cleanest ingredients, because your skin deserves the best. No harsh chemicals, just pure nourishment.",
+    "hashtags": "#CleanBeauty #OrganicSkincare #MomOwned #RockMa #SelfCare"
+  }
+]
+
+Make each idea unique, authentic, and aligned with the RockMa "Mama's Love" brand voice. Focus on the product's benefits, the brand's values (clean, organic, family-owned), and create content that resonates with health-conscious mothers."""
+
+# Structured output modes must return an object, so the array goes under "ideas"
+STRUCTURED_INSTRUCTION = '\n\nReturn the array as the "ideas" field of a JSON object.'
+
+prompt_registry.register_task('ideas', IDEAS_INSTRUCTIONS)
+prompt_registry.register_task('ideas_structured', IDEAS_INSTRUCTIONS + STRUCTURED_INSTRUCTION)
+
+def ideas_system_prompt():
+    return prompt_registry.system_prompt('ideas_structured' if ideas_response_format() else 'ideas')
+
+def build_ideas_prompt(selected_product, seasonality='none', pillar='support'):
+    """Build the user prompt (context, then the product) asking for 3-5 ideas"""
+    # Get the precompiled contextual prompt based on settings
+    contextual_prompt = prompt_registry.context(seasonality, pillar)
+    contextual_instruction = f"{contextual_prompt}\n\n" if contextual_prompt else ""
+    
+    return f"{contextual_instruction}PRODUCT: {selected_product}"
+
+def normalize_idea(idea):
+    """
+    Validate one parsed idea
+    
+    Returns:
+        dict: { hook, caption, hashtags } or None if the idea is unusable
+    """
+    if isinstance(idea, dict) and 'hook' in idea and ('caption' in idea or 'script' in idea):
+        # Support both 'caption' (new) and 'script' (legacy) for backward compatibility
+        caption = idea.get('caption', idea.get('script', ''))
+        return {
+            'hook': idea.get('hook', ''),
+            'caption': caption,
+            'hashtags': idea.get('hashtags', '')
+        }
+    return None
+
+def parse_idea_array(ai_response):
+    """
+    Parse the JSON array of idea objects from an AI response
+    Malformed output is repaired locally first; failing that, every complete
+    object before the damage is kept
+    
+    Raises:
+        json.JSONDecodeError: If no JSON could be parsed
+        ValueError: If the JSON is not an array
+    
+    Returns:
+        list: The raw (unvalidated) items
+    """
+    # Try to extract JSON from the response (AI might add extra text)
+    # Look for JSON array in the response
+    json_start = ai_response.find('[')
+    json_end = ai_response.rfind(']') + 1
+    
+    try:
+        if json_start >= 0 and json_end > json_start:
+            json_str = ai_response[json_start:json_end]
+            ideas = json.loads(json_str)
+        else:
+            # Fallback: try parsing the whole response
+            ideas = json.loads(ai_response)
+        record_outcome('clean')
+    except json.JSONDecodeError:
+        try:
+            # Fix fences, smart quotes, trailing commas and truncation locally
+            ideas, fixes = repair_json(ai_response)
+            record_outcome('repaired', fixes)
+        except json.JSONDecodeError:
+            # Salvage the complete objects; re-raise if there are none
+            ideas = parse_array_objects(ai_response)
+            if not ideas:
+                record_outcome('failed')
+                raise
+            record_outcome('salvaged')
+    
+    # Structured output wraps the array in { "ideas": [...] }
+    if isinstance(ideas, dict) and isinstance(ideas.get('ideas'), list):
+        ideas = ideas['ideas']
+    
+    # Validate structure
+    if not isinstance(ideas, list):
+        raise ValueError("Response is not a list")
+    
+    return ideas
+
+def parse_ideas(ai_response):
+    """
+    Parse and validate the ideas array from an AI response
+    
+    Raises:
+        json.JSONDecodeError: If no JSON could be parsed
+        ValueError: If the JSON holds no usable ideas
+    
+    Returns:
+        list: Up to 5 ideas as { hook, caption, hashtags }
+    """
+    ideas = parse_idea_array(ai_response)
+    
+    # Ensure each idea has required fields
+    validated_ideas = [normalized for normalized in map(normalize_idea, ideas) if normalized]
+    
+    if not validated_ideas:
+        raise ValueError("No valid ideas found in response")
+    
+    # Limit to 5 ideas max
+    return validated_ideas[:5]
+
+def idea_stream_events():
+    """
+    Build a per-request chunk handler for SSE that emits an 'idea' event as
+    soon as each idea object closes in the streamed completion
+    """
+    parser = ArrayObjectParser()
+    emitted = []
+    
+    def on_chunk(chunk):
+        events = []
+        for idea in parser.feed(chunk):
+            normalized = normalize_idea(idea)
+            if normalized and len(emitted) < 5:
+                emitted.append(normalized)
+                events.append(('idea', {'index': len(emitted) - 1, 'idea': normalized}))
+        return events
+    
+    return on_chunk
+
+def build_ideas_payload(ai_response, selected_product, seasonality='none', pillar='support'):
+    """
+    Turn a raw AI response into the endpoint's JSON payload
+    
+    Returns:
+        tuple: (payload: dict, status: int)
+    """
+    try:
+        validated_ideas = parse_ideas(ai_response)
+    except json.JSONDecodeError:
+        # If JSON parsing fails, return a structured error
+        return {
+            'success': False,
+            'error': 'Failed to parse AI response',
+            'message': 'The AI generated content could not be parsed. Please try again.',
+            'raw_response': ai_response[:200]  # First 200 chars for debugging
+        }, 500
+    except ValueError as e:
+        return {
+            'success': False,
+            'error': str(e),
+            'message': 'Failed to generate daily inspiration ideas'
+        }, 500
+    
+    return ideas_payload(validated_ideas, selected_product, seasonality, pillar), 200
+
+def ideas_payload(ideas, product, seasonality='none', pillar='support'):
+    """Success payload: the ideas fitted to the platform limits, what changed, and their library ids"""
+    ideas, constraints = enforce_ideas(ideas)
+    payload = {
+        'success': True,
+        'ideas': ideas,
+        'product': product
+    }
+    if constraints is not None:
+        payload['constraints'] = constraints
+    draft_ids = content_library.autosave_ideas(ideas, {'product': product, 'seasonality': seasonality, 'pillar': pillar})
+    if draft_ids is not None:
+        payload['draftIds'] = draft_ids
+    return payload
+
+def generate_idea_set(product, seasonality, pillar):
+    """
+    Generate one validated idea set for the pre-generation pool
+    
+    Returns:
+        tuple: (product, ideas)
+    """
+    selected_product = product or get_random_product()
+    ai_response = generate_ai_content(
+        build_ideas_prompt(selected_product, seasonality, pillar),
+        system_prompt_override=ideas_system_prompt(),
+        temperature=0.8,
+        use_cache=False,
+        response_format=ideas_response_format()
+    )
+    return selected_product, parse_ideas(ai_response)
+
+inspiration_pool = InspirationPool(
+    generate_idea_set,
+    enabled=Config.INSPIRATION_POOL_ENABLED,
+    depth=Config.INSPIRATION_POOL_DEPTH,
+    max_age_seconds=Config.INSPIRATION_POOL_MAX_AGE_SECONDS,
+    max_sets=Config.INSPIRATION_POOL_MAX_SETS,
+    active_window_seconds=Config.INSPIRATION_POOL_ACTIVE_WINDOW_SECONDS,
+    warm_interval_seconds=Config.INSPIRATION_POOL_WARM_INTERVAL_SECONDS,
+    workers=Config.INSPIRATION_POOL_WORKERS
+)
+
+def take_pooled_ideas(data):
+    """
+    Serve a pre-generated idea set when the pool has one for this request
+    Unknown products/settings are left to prepare_ideas to handle
+    
+    Returns:
+        dict: Endpoint payload, or None on a pool miss
+    """
+    requested_product = data.get('product') or None
+    seasonality = data.get('seasonality', 'none')
+    pillar = data.get('pillar', 'support')
+    
+    if requested_product and not prompt_registry.has_product(requested_product):
+        return None
+    if seasonality not in SEASONALITY_PROMPTS or pillar not in PILLAR_PROMPTS:
+        return None
+    
+    with phase('cache'):
+        pooled = inspiration_pool.take(requested_product, seasonality, pillar)
+    if pooled is None:
+        return None
+    
+    product, ideas = pooled
+    return ideas_payload(ideas, product, seasonality, pillar)
+
+def prepare_ideas(data):
+    """
+    Validate a generate request body and build its generation plan
+    
+    Returns:
+        tuple: (plan: GenerationPlan or None, error: (payload, status) or None)
+    """
+    requested_product = data.get('product', None)
+    seasonality = data.get('seasonality', 'none')
+    pillar = data.get('pillar', 'support')
+    
+    # Validate and select product
+    if requested_product:
+        # If product specified, validate it
+        if not prompt_registry.has_product(requested_product):
+            return None, ({
+                'success': False,
+                'message': 'Invalid product. Please select from available products.',
+                'catalogUrl': CATALOG_URL
+            }, 400)
+        selected_product = requested_product
+    else:
+        # If no product specified, select random
+        selected_product = get_random_product()
+    
+    # Build the prompt for generating ideas
+    with phase('prompt'):
+        user_prompt = build_ideas_prompt(selected_product, seasonality, pillar)
+    
+    def build_payload(ai_response):
+        return build_ideas_payload(ai_response, selected_product, seasonality, pillar)
+    
+    # Uncached - every click should bring new ideas
+    return GenerationPlan(
+        user_prompt,
+        build_payload,
+        'Failed to generate daily inspiration ideas',
+        system_prompt=ideas_system_prompt(),
+        temperature=0.8,
+        use_cache=False,
+        coalesce=single_flight_enabled_for('daily_inspiration'),
+        response_format=ideas_response_format(),
+        stream_events=idea_stream_events,
+        hedge=hedging_enabled_for('daily_inspiration')
+    ), None
+
+def run_ideas_job(data):
+    """Background job runner for ?async=1 requests, returns (payload, status)"""
+    pooled = take_pooled_ideas(data)
+    if pooled:
+        return pooled, 200
+    plan, error = prepare_ideas(data)
+    if error:
+        return error
+    return plan.run()
+
+job_queue.register('daily_inspiration', run_ideas_job, 'Failed to generate daily inspiration ideas')
+
+def submit_ideas_job(data):
+    """Reject an invalid product up front, otherwise queue the request as a job"""
+    requested_product = data.get('product')
+    if requested_product and not prompt_registry.has_product(requested_product):
+        return jsonify({
+            'success': False,
+            'message': 'Invalid product. Please select from available products.',
+            'catalogUrl': CATALOG_URL
+        }), 400
+    return enqueue_response('daily_inspiration', data)
 
 @daily_inspiration_bp.route('/generate', methods=['POST'])
 @require_auth
@@ -24,117 +391,323 @@ def generate_ideas():
     """
     Generate 3-5 daily inspiration content ideas
     Accepts optional 'product' parameter in request body
-    Returns: { ideas: [{ hook, caption, hashtags }], product: string }
+    Returns: { ideas: [{ hook, caption, hashtags }], product: string, constraints: { changes, warnings }, draftIds }
+    Streams Server-Sent Events instead when called with ?stream=1, with an
+    'idea' event as soon as each idea is complete
+    Queues a background job instead when called with ?async=1 (202 + jobId)
     """
     try:
         # Get product and settings from request body (optional)
         data = request.get_json() or {}
-        requested_product = data.get('product', None)
-        seasonality = data.get('seasonality', 'none')
-        pillar = data.get('pillar', 'support')
-        
-        # Get contextual prompt based on settings
-        contextual_prompt = get_contextual_prompt(seasonality, pillar)
-        
-        # Get all available products for validation
-        all_products = []
-        for category, items in PRODUCT_INVENTORY.items():
-            all_products.extend(items)
-        
-        # Validate and select product
-        if requested_product:
-            # If product specified, validate it
-            if requested_product not in all_products:
-                return jsonify({
-                    'success': False,
-                    'message': f'Invalid product. Please select from available products.',
-                    'available_products': all_products
-                }), 400
-            selected_product = requested_product
-        else:
-            # If no product specified, select random
-            selected_product = get_random_product()
         
-        # Build the prompt for generating ideas
-        contextual_instruction = f"\n\n{contextual_prompt}" if contextual_prompt else ""
-        user_prompt = f"""Generate 3-5 unique content ideas for social media (TikTok, Instagram, Facebook) about this specific RockMa product: {selected_product}{contextual_instruction}
+        if wants_job(request):
+            return submit_ideas_job(data)
+        
+        if wants_stream(request):
+            plan, error = prepare_ideas(data)
+            if error:
+                return jsonify(error[0]), error[1]
+            return plan.stream()
+        
+        # Pre-generated sets come back instantly; a refill is queued either way
+        pooled = take_pooled_ideas(data)
+        if pooled:
+            return jsonify(pooled), 200
+        
+        plan, error = prepare_ideas(data)
+        if error:
+            return jsonify(error[0]), error[1]
+        
+        # Generate content using AI
+        payload, status = plan.run()
+        return jsonify(payload), status
+            
+    except UpstreamUnavailable as e:
+        return unavailable_response(e)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Failed to generate daily inspiration ideas'
+        }), 500
+
+@require_auth
+async def generate_ideas_async():
+    """ASGI twin of generate_ideas - awaits the async OpenAI client"""
+    try:
+        data = request.get_json() or {}
+        
+        # SQLite work (job queue, idea pool) runs on a thread, not the event loop
+        if wants_job(request):
+            return await asyncio.to_thread(submit_ideas_job, data)
+        
+        pooled = await asyncio.to_thread(take_pooled_ideas, data)
+        if pooled:
+            return jsonify(pooled), 200
+        
+        plan, error = prepare_ideas(data)
+        if error:
+            return jsonify(error[0]), error[1]
+        
+        payload, status = await plan.run_async()
+        return jsonify(payload), status
+            
+    except UpstreamUnavailable as e:
+        return unavailable_response(e)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Failed to generate daily inspiration ideas'
+        }), 500
 
-For each idea, provide:
+# Static task instructions for calendar batches; every pillar is listed so the prefix never changes
+CALENDAR_INSTRUCTIONS = """CURRENT TASK: CONTENT CALENDAR
+Plan social media posts (TikTok, Instagram, Facebook) for the days of the RockMa content calendar listed in the request. Write exactly one idea per day, about that day's product and following that day's communication pillar and any seasonal context given with the request.
+
+COMMUNICATION PILLARS:
+{pillars}
+
+For each day, provide:
 1. HOOK: An attention-grabbing opening line (1-2 sentences)
 2. CAPTION: The post caption text that goes with the photo/video (2-4 sentences)
 3. HASHTAGS: 5-10 relevant hashtags
 
-Format your response as a JSON array where each object has "hook", "caption", and "hashtags" fields.
+Format your response as a JSON array with one object per day, in the same order as the days in the request, where each object has "date", "hook", "caption", and "hashtags" fields.
 
-Example format:
-[
-  {{
-    "hook": "You know that feeling when your skin just drinks up moisture?",
-    "caption": "That's what our {selected_product} does every single day. Made with love and the cleanest ingredients, because your skin deserves the best. No harsh chemicals, just pure nourishment.",
-    "hashtags": "#CleanBeauty #OrganicSkincare #MomOwned #RockMa #SelfCare"
-  }}
-]
+Make every post unique, authentic, and aligned with the RockMa "Mama's Love" brand voice, so the calendar doesn't repeat itself from one day to the next."""
 
-Make each idea unique, authentic, and aligned with the RockMa "Mama's Love" brand voice. Focus on the product's benefits, the brand's values (clean, organic, family-owned), and create content that resonates with health-conscious mothers."""
+def calendar_instructions():
+    """CALENDAR_INSTRUCTIONS with the current pillar definitions filled in"""
+    pillars = "\n".join(f"- {pillar}: {prompt}" for pillar, prompt in PILLAR_PROMPTS.items())
+    return CALENDAR_INSTRUCTIONS.format(pillars=pillars)
 
-        # Generate content using AI
-        ai_response = generate_ai_content(user_prompt, temperature=0.8)
+# Callables, so the registry rebuilds them when PILLAR_PROMPTS changes
+prompt_registry.register_task('calendar', calendar_instructions)
+prompt_registry.register_task('calendar_structured', lambda: calendar_instructions() + STRUCTURED_INSTRUCTION)
+
+def calendar_response_format():
+    return {"type": "json_object"} if Config.STRUCTURED_OUTPUT != 'off' else None
+
+def calendar_system_prompt():
+    return prompt_registry.system_prompt('calendar_structured' if calendar_response_format() else 'calendar')
+
+def build_calendar_prompt(entries):
+    """Build the user prompt (season context, then the days) for one batch sharing a seasonality"""
+    season_context = SEASONALITY_PROMPTS.get(entries[0]['seasonality'], "")
+    season_instruction = f"{season_context}\n\n" if season_context else ""
+    
+    day_lines = "\n".join(f"- {entry['date']}: {entry['product']} (pillar: {entry['pillar']})" for entry in entries)
+    return f"""{season_instruction}DAYS:
+{day_lines}"""
+
+def parse_calendar_ideas(ai_response, entries):
+    """
+    Match the ideas in a calendar batch response to their days
+    Items are matched by their "date" field, falling back to position
+    
+    Raises:
+        json.JSONDecodeError: If no JSON could be parsed
+        ValueError: If the JSON is not an array
+    
+    Returns:
+        dict: { date: { hook, caption, hashtags } } for the days that got a usable idea
+    """
+    items = parse_idea_array(ai_response)
+    dates = [entry['date'] for entry in entries]
+    matched = {}
+    for position, item in enumerate(items):
+        idea = normalize_idea(item)
+        if not idea:
+            continue
+        day = item.get('date')
+        if day not in dates and position < len(dates):
+            day = dates[position]
+        if day in dates and day not in matched:
+            matched[day] = idea
+    return matched
+
+def prepare_calendar(data):
+    """
+    Validate a calendar request body
+    
+    Returns:
+        tuple: (spec: dict or None, error: (payload, status) or None)
+    """
+    try:
+        start = date.fromisoformat(str(data.get('startDate', '')))
+        end = date.fromisoformat(str(data.get('endDate', '')))
+    except ValueError:
+        return None, ({
+            'success': False,
+            'error': 'startDate and endDate must be dates in YYYY-MM-DD format'
+        }, 400)
+    
+    if end < start:
+        return None, ({
+            'success': False,
+            'error': 'endDate must not be before startDate'
+        }, 400)
+    
+    if (end - start).days + 1 > Config.CALENDAR_MAX_DAYS:
+        return None, ({
+            'success': False,
+            'error': f'A calendar can cover at most {Config.CALENDAR_MAX_DAYS} days'
+        }, 400)
+    
+    products = data.get('products') or list(prompt_registry.products())
+    pillars = data.get('pillars') or list(PILLAR_PROMPTS.keys())
+    if not isinstance(products, list) or not all(prompt_registry.has_product(product) for product in products):
+        return None, ({
+            'success': False,
+            'message': 'Invalid product. Please select from available products.',
+            'catalogUrl': CATALOG_URL
+        }, 400)
+    if not isinstance(pillars, list) or any(pillar not in PILLAR_PROMPTS for pillar in pillars):
+        return None, ({
+            'success': False,
+            'error': f'Invalid pillar. Must be one of: {", ".join(PILLAR_PROMPTS.keys())}'
+        }, 400)
+    
+    return {
+        'startDate': start.isoformat(),
+        'endDate': end.isoformat(),
+        'products': products,
+        'pillars': pillars
+    }, None
+
+@daily_inspiration_bp.route('/calendar', methods=['POST'])
+@require_auth
+def generate_calendar():
+    """
+    Generate a content calendar with one post idea per day
+    Accepts: { startDate: 'YYYY-MM-DD', endDate: 'YYYY-MM-DD', products?: [string],
+               pillars?: [string], restart?: bool }
+    Each day gets the seasonality of its date; products and pillars rotate
+    across the days (all of them when omitted)
+    Returns: NDJSON - a header line, one line per day as its batch finishes, then a summary line
+        { calendarId, total, resumed }
+        { date, seasonality, product, pillar, success, idea | error, resumed, saved }
+        { done: true, calendarId, total, succeeded, failed }
+    saved: false means the day's idea was generated but could not be stored,
+    so resuming generates it again
+    Sending the same body again resumes the calendar: finished days are replayed
+    from storage and only the missing ones are generated. restart: true starts over.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        spec, error = prepare_calendar(data)
+        if error:
+            return jsonify(error[0]), error[1]
         
-        # Parse the JSON response
-        try:
-            # Try to extract JSON from the response (AI might add extra text)
-            # Look for JSON array in the response
-            json_start = ai_response.find('[')
-            json_end = ai_response.rfind(']') + 1
-            
-            if json_start >= 0 and json_end > json_start:
-                json_str = ai_response[json_start:json_end]
-                ideas = json.loads(json_str)
-            else:
-                # Fallback: try parsing the whole response
-                ideas = json.loads(ai_response)
-            
-            # Validate structure
-            if not isinstance(ideas, list):
-                raise ValueError("Response is not a list")
-            
-            # Ensure each idea has required fields
-            validated_ideas = []
-            for idea in ideas:
-                if isinstance(idea, dict) and 'hook' in idea and ('caption' in idea or 'script' in idea):
-                    # Support both 'caption' (new) and 'script' (legacy) for backward compatibility
-                    caption = idea.get('caption', idea.get('script', ''))
-                    validated_ideas.append({
-                        'hook': idea.get('hook', ''),
-                        'caption': caption,
-                        'hashtags': idea.get('hashtags', '')
-                    })
-            
-            if not validated_ideas:
-                raise ValueError("No valid ideas found in response")
-            
-            # Limit to 5 ideas max
-            validated_ideas = validated_ideas[:5]
+        start = date.fromisoformat(spec['startDate'])
+        end = date.fromisoformat(spec['endDate'])
+        entries = plan_days(start, end, spec['products'], spec['pillars'])
+        cal_id = calendar_id(owner_id(g.access_code), spec)
+        
+        with phase('cache'):
+            if data.get('restart'):
+                calendar_store.clear(cal_id)
+            stored = calendar_store.load(cal_id)
+        missing = [entry for entry in entries if entry['date'] not in stored]
+        batches = batch_entries(missing, max(1, Config.CALENDAR_BATCH_SIZE))
+        
+        # Each extra upstream call costs one more token, up to a full bucket, so
+        # calendars of any length up to CALENDAR_MAX_DAYS can run
+        rejection = fan_out_rejection(
+            g.access_code, len(batches), f'This calendar needs {len(batches)} generations and more request quota. Please try again later.'
+        )
+        if rejection:
+            return rejection
+        
+        owner = current_owner()
+        
+        def batch_pillar(batch):
+            pillars = {entry['pillar'] for entry in batch}
+            return pillars.pop() if len(pillars) == 1 else 'mixed'
+        
+        def generate_batch(batch):
+            ai_response = generate_ai_content(
+                build_calendar_prompt(batch),
+                system_prompt_override=calendar_system_prompt(),
+                temperature=0.8,
+                use_cache=False,
+                response_format=calendar_response_format(),
+                hedge=hedging_enabled_for('daily_inspiration')
+            )
+            ideas = parse_calendar_ideas(ai_response, batch)
+            dates = list(ideas)
+            fitted, _ = enforce_ideas([ideas[day] for day in dates])
+            ideas = dict(zip(dates, fitted))
+            # Saved here rather than when streamed, so a dropped client loses nothing.
+            # A storage failure only costs resuming these days, not the ideas themselves
+            saved = True
+            try:
+                for entry in batch:
+                    if entry['date'] in ideas:
+                        calendar_store.save(cal_id, dict(entry, idea=ideas[entry['date']]))
+            except sqlite3.Error as e:
+                logger.warning('Saving calendar %s days failed: %s', cal_id, e)
+                saved = False
+            content_library.autosave('idea', [
+                (idea_text(ideas[entry['date']]), dict(entry, **ideas[entry['date']]))
+                for entry in batch if entry['date'] in ideas
+            ], owner=owner)
+            return ideas, saved
+        
+        def generate():
+            succeeded = 0
+            failed = 0
+            yield fast_json.dumps({'calendarId': cal_id, 'total': len(entries), 'resumed': len(stored)}) + '\n'
             
-            return jsonify({
-                'success': True,
-                'ideas': validated_ideas,
-                'product': selected_product
-            }), 200
+            for entry in entries:
+                if entry['date'] in stored:
+                    succeeded += 1
+                    yield fast_json.dumps(dict(stored[entry['date']], success=True, resumed=True)) + '\n'
+            if stored:
+                try:
+                    calendar_store.touch(cal_id)
+                except sqlite3.Error as e:
+                    logger.warning('Touching calendar %s failed: %s', cal_id, e)
             
-        except json.JSONDecodeError as e:
-            # If JSON parsing fails, return a structured error
-            return jsonify({
-                'success': False,
-                'error': 'Failed to parse AI response',
-                'message': 'The AI generated content could not be parsed. Please try again.',
-                'raw_response': ai_response[:200]  # First 200 chars for debugging
-            }), 500
+            for batch, future in fan_out(generate_batch, batches, Config.CALENDAR_MAX_CONCURRENCY, pillar_for=batch_pillar):
+                try:
+                    ideas, saved = future.result()
+                    batch_error = 'The AI response had no idea for this day'
+                except Exception as e:
+                    ideas, saved = {}, False
+                    batch_error = str(e)
+                for entry in batch:
+                    if entry['date'] in ideas:
+                        succeeded += 1
+                        line = dict(entry, success=True, idea=ideas[entry['date']], resumed=False, saved=saved)
+                    else:
+                        failed += 1
+                        line = dict(entry, success=False, error=batch_error, resumed=False)
+                    yield fast_json.dumps(line) + '\n'
             
+            yield fast_json.dumps({
+                'done': True,
+                'calendarId': cal_id,
+                'total': len(entries),
+                'succeeded': succeeded,
+                'failed': failed
+            }) + '\n'
+        
+        return Response(
+            stream_with_context(generate()),
+            mimetype='application/x-ndjson',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            }
+        )
+        
+    except UpstreamUnavailable as e:
+        return unavailable_response(e)
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e),
-            'message': 'Failed to generate daily inspiration ideas'
+            'message': 'Failed to generate content calendar'
         }), 500
-
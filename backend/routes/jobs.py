@@ -0,0 +1,54 @@
+"""
+Background Job API Routes
+Status and results of generations submitted with ?async=1
+"""
+from flask import Blueprint, g, request, jsonify
+from config import Config
+from middleware.auth_middleware import require_access_code
+from jobs import job_queue
+
+jobs_bp = Blueprint('jobs', __name__)
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+@require_access_code
+def get_job(job_id):
+    """
+    GET /api/jobs/<job_id>[?wait=seconds]
+    Returns: { success, jobId, kind, status, attempts, createdAt, startedAt, finishedAt }
+        plus { result, resultStatus } once status is succeeded or failed;
+        result is the payload the endpoint would have returned directly
+    With ?wait=N the request is held until the job finishes or N seconds pass
+    (capped by JOBS_MAX_WAIT_SECONDS). Single-threaded workers (gunicorn's
+    sync workers) can't serve anything else meanwhile, so there the wait is
+    capped by JOBS_SYNC_MAX_WAIT_SECONDS instead (0 by default: answer at once)
+    """
+    try:
+        wait = min(float(request.args.get('wait', 0)), Config.JOBS_MAX_WAIT_SECONDS)
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'wait must be a number of seconds'
+        }), 400
+    
+    if not request.environ.get('wsgi.multithread'):
+        wait = min(wait, Config.JOBS_SYNC_MAX_WAIT_SECONDS)
+
+    try:
+        if wait > 0:
+            job = job_queue.wait(job_id, g.access_code, wait)
+        else:
+            job = job_queue.get(job_id, g.access_code)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Failed to read job status'
+        }), 500
+
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found'
+        }), 404
+
+    return jsonify({'success': True, **job}), 200
@@ -0,0 +1,207 @@
+"""
+Content Library API Routes
+Drafts and favorites saved on the server: paginated lists, full-text search
+and the favorite / posted flags. Generation endpoints save their output here
+automatically; POST adds content the client wrote or edited itself.
+"""
+from functools import wraps
+from flask import Blueprint, g, request, jsonify
+from middleware.auth_middleware import require_access_code
+from content_library import content_library, KINDS
+from jobs import owner_id
+
+library_bp = Blueprint('library', __name__)
+
+def library_enabled(f):
+    """Answer 404 for every library route while the library is disabled"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not content_library.enabled:
+            return jsonify({
+                'success': False,
+                'error': 'The content library is disabled'
+            }), 404
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+def parse_page_args(args):
+    """
+    Validate the shared list/search query parameters
+
+    Returns:
+        tuple: (filters dict or None, error message or None)
+    """
+    kind = args.get('kind') or None
+    if kind is not None and kind not in KINDS:
+        return None, f'Invalid kind. Must be one of: {", ".join(KINDS)}'
+    try:
+        limit = int(args.get('limit', 20))
+        cursor = int(args['cursor']) if args.get('cursor') else None
+    except ValueError:
+        return None, 'limit and cursor must be integers'
+    return {
+        'kind': kind,
+        'favorite': args.get('favorite', '').lower() in ('1', 'true', 'yes'),
+        'limit': limit,
+        'cursor': cursor
+    }, None
+
+def page_response(items, next_cursor):
+    return jsonify({
+        'success': True,
+        'items': items,
+        'nextCursor': next_cursor
+    }), 200
+
+@library_bp.route('', methods=['GET'])
+@require_access_code
+@library_enabled
+def list_items():
+    """
+    GET /api/library[?kind=idea|adaptation|translation][&favorite=1][&limit=20][&cursor=]
+    Returns: { items: [{ id, kind, content, snippet, metadata, favorite, posted, createdAt }], nextCursor }
+    Newest first; pass nextCursor back as cursor for the next page (null on the last)
+    """
+    filters, error = parse_page_args(request.args)
+    if error:
+        return jsonify({
+            'success': False,
+            'error': error
+        }), 400
+
+    try:
+        items, next_cursor = content_library.list(
+            owner_id(g.access_code),
+            kind=filters['kind'],
+            favorite=filters['favorite'],
+            limit=filters['limit'],
+            before=filters['cursor']
+        )
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Failed to list saved content'
+        }), 500
+    return page_response(items, next_cursor)
+
+@library_bp.route('/search', methods=['GET'])
+@require_access_code
+@library_enabled
+def search_items():
+    """
+    GET /api/library/search?q=text[&sort=relevance|recent][&kind=][&favorite=1][&limit=20][&cursor=]
+    Returns: { items: [{ ...item, highlight }], nextCursor }
+    Every word must match (the last one as a prefix), in the content or the
+    product / platform / audience it was made for
+    """
+    filters, error = parse_page_args(request.args)
+    if not error and not request.args.get('q', '').strip():
+        error = 'q cannot be empty'
+    sort = request.args.get('sort', 'relevance')
+    if not error and sort not in ('relevance', 'recent'):
+        error = 'Invalid sort. Must be one of: relevance, recent'
+    if error:
+        return jsonify({
+            'success': False,
+            'error': error
+        }), 400
+
+    try:
+        items, next_cursor = content_library.search(
+            owner_id(g.access_code),
+            request.args['q'],
+            kind=filters['kind'],
+            favorite=filters['favorite'],
+            limit=filters['limit'],
+            cursor=filters['cursor'],
+            sort=sort
+        )
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Failed to search saved content'
+        }), 500
+    return page_response(items, next_cursor)
+
+@library_bp.route('', methods=['POST'])
+@require_access_code
+@library_enabled
+def save_item():
+    """
+    POST /api/library
+    Accepts: { kind, content, metadata?: object, favorite?: boolean }
+    Returns: { item } with status 201
+    """
+    data = request.get_json(silent=True) or {}
+    kind = data.get('kind')
+    content = data.get('content')
+    metadata = data.get('metadata') or {}
+
+    if kind not in KINDS:
+        error = f'Invalid kind. Must be one of: {", ".join(KINDS)}'
+    elif not isinstance(content, str) or not content.strip():
+        error = 'content cannot be empty'
+    elif not isinstance(metadata, dict):
+        error = 'metadata must be an object'
+    else:
+        error = None
+    if error:
+        return jsonify({
+            'success': False,
+            'error': error
+        }), 400
+
+    owner = owner_id(g.access_code)
+    try:
+        item_id = content_library.save(kind, content, metadata, owner=owner, favorite=bool(data.get('favorite')))
+        item = content_library.get(owner, item_id)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Failed to save content'
+        }), 500
+    return jsonify({'success': True, 'item': item}), 201
+
+@library_bp.route('/<int:item_id>', methods=['GET', 'PATCH', 'DELETE'])
+@require_access_code
+@library_enabled
+def item(item_id):
+    """
+    GET /api/library/<id>: { item }
+    PATCH /api/library/<id> with { favorite?: boolean, posted?: boolean }: { item }
+    DELETE /api/library/<id>: { deleted: true }
+    """
+    owner = owner_id(g.access_code)
+    try:
+        if request.method == 'DELETE':
+            found = content_library.delete(owner, item_id)
+            result = {'deleted': True}
+        elif request.method == 'PATCH':
+            data = request.get_json(silent=True) or {}
+            if any(not isinstance(data[flag], bool) for flag in ('favorite', 'posted') if flag in data):
+                return jsonify({
+                    'success': False,
+                    'error': 'favorite and posted must be booleans'
+                }), 400
+            found = content_library.update(owner, item_id, favorite=data.get('favorite'), posted=data.get('posted'))
+            result = {'item': found}
+        else:
+            found = content_library.get(owner, item_id)
+            result = {'item': found}
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Failed to update saved content'
+        }), 500
+
+    if not found:
+        return jsonify({
+            'success': False,
+            'error': 'Item not found'
+        }), 404
+    return jsonify({'success': True, **result}), 200
@@ -2,124 +2,50 @@
 Platform Translator API Routes
 Translates content for specific platforms and audiences
 """
-from flask import Blueprint, request, jsonify
+import asyncio
+import fast_json
+from flask import Blueprint, g, request, jsonify, Response, stream_with_context
+from config import Config
 from utils import generate_ai_content
 from request_validators import validate_json_request
 from middleware.auth_middleware import require_auth
-from ai_persona import get_contextual_prompt
+from ai_persona import PLATFORM_GUIDELINES, AUDIENCE_GUIDELINES
+from prompt_registry import prompt_registry
+from streaming import wants_stream
+from generation import GenerationPlan, fan_out
+from single_flight import enabled_for as single_flight_enabled_for
+from hedging import enabled_for as hedging_enabled_for
+from server_timing import phase
+from upstream import UpstreamUnavailable, unavailable_response
+from admission import admission, fan_out_rejection, too_many_requests
+from jobs import job_queue, wants_job, enqueue_response
+from platform_constraints import enforce_platform
+from content_library import content_library
 
 platform_translator_bp = Blueprint('platform_translator', __name__)
 
-# Platform-specific guidelines
-PLATFORM_GUIDELINES = {
-    "TikTok": {
-        "format": "Short, punchy, engaging. Use hooks that grab attention in first 3 seconds. Include trending elements when appropriate.",
-        "length": "Very concise (1-2 sentences for hook, 2-4 sentences for body)",
-        "tone": "Energetic, authentic, relatable"
-    },
-    "Instagram": {
-        "format": "Visual-first thinking. Include emojis strategically. Hashtags are important (5-10). Story-style captions work well.",
-        "length": "Medium length (2-3 sentences for hook, 3-5 sentences for body)",
-        "tone": "Inspirational, aspirational, community-focused"
-    },
-    "LinkedIn": {
-        "format": "Professional storytelling. Business value and insights. Personal narrative with business lessons. Strong opening hook.",
-        "length": "Medium to long form (2-3 sentences for hook, 4-6 sentences for body)",
-        "tone": "Professional, authentic, thought-leadership"
-    },
-    "Facebook Ad": {
-        "format": "Clear value proposition. Strong call-to-action. Benefit-focused. Professional but warm.",
-        "length": "Concise but complete (1-2 sentences for hook, 3-4 sentences for body)",
-        "tone": "Trustworthy, professional, value-driven"
-    },
-    "Email": {
-        "format": "Personal, conversational. Can be longer form. Clear structure with greeting and sign-off.",
-        "length": "Longer form (2-3 sentences for hook, 4-6 sentences for body)",
-        "tone": "Personal, warm, relationship-building"
-    },
-    "YouTube": {
-        "format": "Engaging hook, clear structure. Can include questions to encourage engagement. Longer form content.",
-        "length": "Longer form (2-3 sentences for hook, 5-8 sentences for body)",
-        "tone": "Educational, engaging, community-focused"
-    }
-}
-
-# Audience-specific guidelines
-AUDIENCE_GUIDELINES = {
-    "Core Moms 25-50": {
-        "focus": "Emphasize family, health, wellness, time-saving, quality, trust",
-        "language": "Relatable, warm, understanding of busy mom life",
-        "values": "Clean ingredients, safety, family wellness, ethical production"
-    },
-    "Gen-Z": {
-        "focus": "Authenticity, sustainability, social impact, trends, values",
-        "language": "Casual, direct, trend-aware, values-driven",
-        "values": "Sustainability, ethical practices, transparency, social responsibility"
-    },
-    "Wellness Enthusiasts": {
-        "focus": "Health benefits, ingredients, science-backed, holistic wellness",
-        "language": "Educational, detailed, health-focused, ingredient-aware",
-        "values": "Clean ingredients, organic certification, health benefits, natural solutions"
-    },
-    "B2B": {
-        "focus": "Partnership opportunities, wholesale, business value, professional relationships",
-        "language": "Professional, value-focused, partnership-oriented",
-        "values": "Quality, reliability, business growth, partnership potential"
-    }
-}
+def validate_target(platform, audience):
+    """Returns an error message for an unknown platform/audience, or None"""
+    if platform not in PLATFORM_GUIDELINES:
+        return f'Invalid platform. Must be one of: {", ".join(PLATFORM_GUIDELINES.keys())}'
+    if audience not in AUDIENCE_GUIDELINES:
+        return f'Invalid audience. Must be one of: {", ".join(AUDIENCE_GUIDELINES.keys())}'
+    return None
 
-@platform_translator_bp.route('/translate', methods=['POST'])
-@require_auth
-def translate_content():
-    """
-    Translate content for specific platform and audience
-    Accepts: { sourceText: string, platform: string, audience: string }
-    Returns: { translatedContent: string }
-    """
-    # Validate request
-    is_valid, error_response = validate_json_request(request, ['sourceText', 'platform', 'audience'])
-    if not is_valid:
-        return error_response
-    
-    try:
-        data = request.get_json()
-        source_text = data['sourceText'].strip()
-        platform = data['platform']
-        audience = data['audience']
-        seasonality = data.get('seasonality', 'none')
-        pillar = data.get('pillar', 'support')
-        
-        if not source_text:
-            return jsonify({
-                'success': False,
-                'error': 'sourceText cannot be empty'
-            }), 400
-        
-        # Validate platform
-        if platform not in PLATFORM_GUIDELINES:
-            return jsonify({
-                'success': False,
-                'error': f'Invalid platform. Must be one of: {", ".join(PLATFORM_GUIDELINES.keys())}'
-            }), 400
-        
-        # Validate audience
-        if audience not in AUDIENCE_GUIDELINES:
-            return jsonify({
-                'success': False,
-                'error': f'Invalid audience. Must be one of: {", ".join(AUDIENCE_GUIDELINES.keys())}'
-            }), 400
-        
-        platform_guidelines = PLATFORM_GUIDELINES[platform]
-        audience_guidelines = AUDIENCE_GUIDELINES[audience]
-        
-        # Get contextual prompt based on settings
-        contextual_prompt = get_contextual_prompt(seasonality, pillar)
-        contextual_instruction = f"\n\n{contextual_prompt}" if contextual_prompt else ""
-        
-        # Determine output format based on platform
-        if platform in ['TikTok', 'Instagram', 'YouTube']:
-            format_instructions = f"""
-FORMAT YOUR RESPONSE AS FOLLOWS:
+# Static task instructions (system message); the user message only names the target
+TRANSLATION_INSTRUCTIONS = """CURRENT TASK: PLATFORM TRANSLATION
+You will receive RockMa source content plus a target platform and audience. Transform the content for that platform and audience using the PLATFORM GUIDELINES and AUDIENCE GUIDELINES above.
+
+INSTRUCTIONS:
+1. Maintain the core RockMa brand voice (warm, caring, inspirational, trustworthy)
+2. Adapt the content to match the target platform's format, length and tone requirements
+3. Tailor the messaging to resonate with the target audience's focus, language and values
+4. Keep the RockMa differentiators (mom-owned, clean, organic, ethically made in USA)
+5. Ensure the content feels authentic and appropriate for the platform
+6. Follow any seasonal or communication pillar context given with the request
+
+OUTPUT FORMAT:
+For TikTok, Instagram and YouTube, format your response as follows:
 
 Hook:
 [Write an attention-grabbing opening line that stops the scroll]
@@ -128,54 +54,136 @@ Script:
 [Write the main content/caption here]
 
 Hashtags:
-[Include 5-8 relevant hashtags]"""
-        elif platform == 'Email':
-            format_instructions = """
-FORMAT YOUR RESPONSE AS FOLLOWS:
+[Include 5-8 relevant hashtags]
+
+For Email, format your response as follows:
 
 Subject Line:
 [Write a compelling subject line]
 
 Email Body:
-[Write the full email content with greeting and sign-off]"""
-        else:
-            format_instructions = """
-Return the formatted content ready to post."""
-        
-        # Build the prompt for platform/audience translation
-        user_prompt = f"""Transform the following RockMa content for {platform} targeting the {audience} audience.
+[Write the full email content with greeting and sign-off]
 
-SOURCE CONTENT:
-{source_text}
+For every other platform, return the formatted content ready to post."""
 
-PLATFORM REQUIREMENTS ({platform}):
-- Format: {platform_guidelines['format']}
-- Length: {platform_guidelines['length']}
-- Tone: {platform_guidelines['tone']}
+prompt_registry.register_task('translation', TRANSLATION_INSTRUCTIONS)
 
-AUDIENCE REQUIREMENTS ({audience}):
-- Focus: {audience_guidelines['focus']}
-- Language: {audience_guidelines['language']}
-- Values: {audience_guidelines['values']}
+def translation_system_prompt():
+    return prompt_registry.system_prompt('translation')
 
-INSTRUCTIONS:
-1. Maintain the core RockMa brand voice (warm, caring, inspirational, trustworthy)
-2. Adapt the content to match {platform} format and tone requirements
-3. Tailor the messaging to resonate with {audience} values and language
-4. Keep the RockMa differentiators (mom-owned, clean, organic, ethically made in USA)
-5. Ensure the content feels authentic and appropriate for the platform{contextual_instruction}
-{format_instructions}"""
+def build_translation_prompt(source_text, platform, audience, seasonality='none', pillar='support'):
+    """
+    Build the user prompt for translating content to a platform/audience pair
+    Only the per-request parts; the guidelines live in the system prompt
+    Assumes platform and audience were already validated
+    """
+    # Get the precompiled contextual prompt based on settings
+    contextual_prompt = prompt_registry.context(seasonality, pillar)
+    contextual_instruction = f"\n\n{contextual_prompt}" if contextual_prompt else ""
+    
+    return f"""{prompt_registry.target(platform, audience)}{contextual_instruction}
 
-        # Generate translated content using AI
-        translated_content = generate_ai_content(user_prompt, temperature=0.7)
-        
-        return jsonify({
+SOURCE CONTENT:
+{source_text}"""
+
+def prepare_translation(data):
+    """
+    Validate a translate request body and build its generation plan
+    
+    Returns:
+        tuple: (plan: GenerationPlan or None, error: (payload, status) or None)
+    """
+    source_text = data['sourceText'].strip()
+    platform = data['platform']
+    audience = data['audience']
+    seasonality = data.get('seasonality', 'none')
+    pillar = data.get('pillar', 'support')
+    
+    if not source_text:
+        return None, ({
+            'success': False,
+            'error': 'sourceText cannot be empty'
+        }, 400)
+    
+    # Validate platform and audience
+    target_error = validate_target(platform, audience)
+    if target_error:
+        return None, ({
+            'success': False,
+            'error': target_error
+        }, 400)
+    
+    with phase('prompt'):
+        user_prompt = build_translation_prompt(source_text, platform, audience, seasonality, pillar)
+    
+    def build_payload(translated_content):
+        translated_content, constraints = enforce_platform(translated_content, platform)
+        payload = {
             'success': True,
             'translatedContent': translated_content,
             'platform': platform,
             'audience': audience
-        }), 200
+        }
+        if constraints is not None:
+            payload['constraints'] = constraints
+        draft_id = content_library.autosave_text('translation', translated_content, {
+            'platform': platform, 'audience': audience, 'seasonality': seasonality, 'pillar': pillar
+        })
+        if draft_id is not None:
+            payload['draftId'] = draft_id
+        return payload, 200
+    
+    return GenerationPlan(
+        user_prompt,
+        build_payload,
+        'Failed to translate content',
+        system_prompt=translation_system_prompt(),
+        temperature=0.7,
+        coalesce=single_flight_enabled_for('platform_translator'),
+        hedge=hedging_enabled_for('platform_translator')
+    ), None
+
+def run_translation_job(data):
+    """Background job runner for ?async=1 translations, returns (payload, status)"""
+    plan, error = prepare_translation(data)
+    if error:
+        return error
+    return plan.run()
+
+job_queue.register('platform_translator', run_translation_job, 'Failed to translate content')
+
+@platform_translator_bp.route('/translate', methods=['POST'])
+@require_auth
+def translate_content():
+    """
+    Translate content for specific platform and audience
+    Accepts: { sourceText: string, platform: string, audience: string }
+    Returns: { translatedContent: string, constraints: { changes, warnings }, draftId }
+    Streams Server-Sent Events instead when called with ?stream=1
+    Queues a background job instead when called with ?async=1 (202 + jobId)
+    """
+    # Validate request
+    is_valid, error_response = validate_json_request(request, ['sourceText', 'platform', 'audience'])
+    if not is_valid:
+        return error_response
+    
+    try:
+        plan, error = prepare_translation(request.get_json())
+        if error:
+            return jsonify(error[0]), error[1]
+        
+        if wants_job(request):
+            return enqueue_response('platform_translator', request.get_json())
+        
+        if wants_stream(request):
+            return plan.stream()
+        
+        # Generate translated content using AI
+        payload, status = plan.run()
+        return jsonify(payload), status
         
+    except UpstreamUnavailable as e:
+        return unavailable_response(e)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -183,3 +191,166 @@ INSTRUCTIONS:
             'message': 'Failed to translate content'
         }), 500
 
+@require_auth
+async def translate_content_async():
+    """ASGI twin of translate_content - awaits the async OpenAI client"""
+    is_valid, error_response = validate_json_request(request, ['sourceText', 'platform', 'audience'])
+    if not is_valid:
+        return error_response
+    
+    try:
+        # SQLite work (near-duplicate lookups, job queue) runs on a thread, not the event loop
+        plan, error = await asyncio.to_thread(prepare_translation, request.get_json())
+        if error:
+            return jsonify(error[0]), error[1]
+        
+        if wants_job(request):
+            return await asyncio.to_thread(enqueue_response, 'platform_translator', request.get_json())
+        
+        payload, status = await plan.run_async()
+        return jsonify(payload), status
+        
+    except UpstreamUnavailable as e:
+        return unavailable_response(e)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Failed to translate content'
+        }), 500
+
+@platform_translator_bp.route('/translate-batch', methods=['POST'])
+@require_auth
+def translate_batch():
+    """
+    Translate one source text for many platform/audience pairs concurrently
+    Accepts: { sourceText: string, targets: [{ platform, audience }], seasonality?, pillar? }
+    Returns: NDJSON - one line per target as it finishes, then a summary line
+        { index, platform, audience, success, translatedContent + constraints + draftId | error }
+        { done: true, total, succeeded, failed }
+    """
+    # Validate request
+    is_valid, error_response = validate_json_request(request, ['sourceText', 'targets'])
+    if not is_valid:
+        return error_response
+    
+    data = request.get_json()
+    source_text = str(data['sourceText']).strip()
+    targets = data['targets']
+    seasonality = data.get('seasonality', 'none')
+    pillar = data.get('pillar', 'support')
+    max_targets = len(PLATFORM_GUIDELINES) * len(AUDIENCE_GUIDELINES)
+    
+    if not source_text:
+        return jsonify({
+            'success': False,
+            'error': 'sourceText cannot be empty'
+        }), 400
+    
+    if not isinstance(targets, list):
+        return jsonify({
+            'success': False,
+            'error': 'targets must be a list of { platform, audience } objects'
+        }), 400
+    
+    if len(targets) > max_targets:
+        return jsonify({
+            'success': False,
+            'error': f'Too many targets. A batch can contain at most {max_targets}'
+        }), 400
+    
+    # Invalid targets are reported up front without an upstream call, so only valid ones are charged
+    invalid = []
+    valid = []
+    for index, target in enumerate(targets):
+        target = target if isinstance(target, dict) else {}
+        platform = target.get('platform')
+        audience = target.get('audience')
+        error = validate_target(platform, audience)
+        if error:
+            invalid.append({
+                'index': index,
+                'platform': platform,
+                'audience': audience,
+                'success': False,
+                'error': error
+            })
+        else:
+            valid.append((index, platform, audience))
+    
+    # require_auth holds one admission slot; the batch takes one more per extra concurrent call
+    concurrency = max(1, min(Config.BATCH_MAX_CONCURRENCY, len(valid)))
+    if admission.enabled:
+        concurrency = min(concurrency, admission.max_in_flight)
+    extra_slots = concurrency - 1
+    slot_id = admission.acquire(extra_slots) if extra_slots else 0
+    if slot_id is None:
+        return too_many_requests(
+            'Server busy',
+            'Too many generations in progress. Please try again shortly.',
+            admission.retry_after
+        )
+    
+    # Each extra target costs one more token, up to a full bucket
+    rejection = fan_out_rejection(
+        g.access_code, len(valid), f'This batch of {len(valid)} targets needs more request quota. Please try again later.'
+    )
+    if rejection:
+        admission.release(slot_id, extra_slots)
+        return rejection
+    
+    def translate_target(target):
+        _, platform, audience = target
+        translated_content = generate_ai_content(
+            build_translation_prompt(source_text, platform, audience, seasonality, pillar),
+            system_prompt_override=translation_system_prompt(),
+            temperature=0.7,
+            coalesce=single_flight_enabled_for('platform_translator'),
+            hedge=hedging_enabled_for('platform_translator')
+        )
+        return enforce_platform(translated_content, platform)
+    
+    def generate():
+        succeeded = 0
+        failed = len(invalid)
+        for line in invalid:
+            yield fast_json.dumps(line) + '\n'
+        
+        for (index, platform, audience), future in fan_out(
+            translate_target, valid, concurrency, pillar_for=lambda target: pillar
+        ):
+            line = {'index': index, 'platform': platform, 'audience': audience}
+            try:
+                line['translatedContent'], constraints = future.result()
+                if constraints is not None:
+                    line['constraints'] = constraints
+                draft_id = content_library.autosave_text('translation', line['translatedContent'], {
+                    'platform': platform, 'audience': audience, 'seasonality': seasonality, 'pillar': pillar
+                })
+                if draft_id is not None:
+                    line['draftId'] = draft_id
+                line['success'] = True
+                succeeded += 1
+            except Exception as e:
+                line['success'] = False
+                line['error'] = str(e)
+                failed += 1
+            yield fast_json.dumps(line) + '\n'
+        
+        yield fast_json.dumps({
+            'done': True,
+            'total': len(targets),
+            'succeeded': succeeded,
+            'failed': failed
+        }) + '\n'
+    
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+    response.call_on_close(lambda: admission.release(slot_id, extra_slots))
+    return response
@@ -0,0 +1,93 @@
+"""
+Per-request phase timing
+Phases (auth, validate, prompt, cache, upstream, parse, serialize) are
+accumulated on flask.g and emitted as a Server-Timing header, plus an
+optional structured log line, so slowness can be split between local
+overhead and upstream latency without a profiler
+"""
+import json
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context
+from flask.json.provider import DefaultJSONProvider
+from config import Config
+
+logger = logging.getLogger('server_timing')
+if not logger.handlers:
+    # gunicorn doesn't configure the root logger, so give timing lines their own handler
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def start():
+    """Mark the start of the current request"""
+    g.timing_start = time.perf_counter()
+    g.timing_phases = {}
+
+
+def record_phase(name, seconds):
+    """Add time to a phase of the current request (no-op outside a request)"""
+    if not Config.SERVER_TIMING_ENABLED or not has_request_context():
+        return
+    phases = g.get('timing_phases')
+    if phases is None:
+        return
+    phases[name] = phases.get(name, 0.0) + seconds
+
+
+@contextmanager
+def phase(name):
+    """Time a block as one phase; repeated phases of the same name add up"""
+    began = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - began)
+
+
+def format_header(phases, total):
+    """
+    Build a Server-Timing header value
+
+    Args:
+        phases: {name: seconds} in the order they were first recorded
+        total: Seconds since the request started
+
+    Returns:
+        str: e.g. 'auth;dur=0.12, upstream;dur=812.40, total;dur=815.03'
+    """
+    entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in phases.items()]
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ', '.join(entries)
+
+
+def finish(response, endpoint, status):
+    """Attach the Server-Timing header and log the breakdown if enabled"""
+    if 'timing_start' not in g:
+        return response
+    total = time.perf_counter() - g.timing_start
+    phases = g.timing_phases
+    response.headers['Server-Timing'] = format_header(phases, total)
+    if Config.SERVER_TIMING_LOG:
+        logger.info(json.dumps({
+            'event': 'request_timing',
+            'endpoint': endpoint,
+            'status': status,
+            'total_ms': round(total * 1000, 1),
+            'phases_ms': {name: round(seconds * 1000, 2) for name, seconds in phases.items()},
+            'streamed': response.is_streamed
+        }))
+    return response
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Default Flask JSON provider that counts serialization as its own phase"""
+
+    def dumps(self, obj, **kwargs):
+        with phase('serialize'):
+            return super().dumps(obj, **kwargs)
@@ -0,0 +1,291 @@
+"""
+Single-flight coalescing for identical in-flight generations
+Concurrent callers with the same key share one upstream call. Inside a
+worker they wait on the leader directly; across workers a SQLite lease marks
+the key as in flight and followers poll for the leader's published result.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from config import Config
+from local_store import get_connection
+
+logger = logging.getLogger(__name__)
+
+SINGLE_FLIGHT_DB = 'single_flight.db'
+
+
+class _Call:
+    """One in-flight call inside this process"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Args:
+        cross_process: Coordinate with other workers through SQLite
+        lease_seconds: How long a worker may hold a key before others take over
+        poll_interval: Seconds between result checks while another worker leads
+        result_ttl: Seconds a published result is kept for late followers
+    """
+
+    def __init__(self, cross_process=True, lease_seconds=120, poll_interval=0.1, result_ttl=30):
+        self.cross_process = cross_process
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.result_ttl = result_ttl
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+        self._owner = None
+        self._schema_ready = False
+        self._stats = {'upstream_calls': 0, 'coalesced_local': 0, 'coalesced_remote': 0, 'errors': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        """Returns counters for this worker; saved_calls is what coalescing avoided"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['saved_calls'] = stats['coalesced_local'] + stats['coalesced_remote']
+        stats['in_flight'] = len(self._calls) + len(self._async_calls)
+        stats['cross_process'] = self.cross_process
+        return stats
+
+    # Cross-process coordination
+
+    def _conn(self):
+        conn = get_connection(SINGLE_FLIGHT_DB)
+        if not self._schema_ready:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS single_flight_leases ('
+                'key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS single_flight_results ('
+                'key TEXT PRIMARY KEY, result TEXT NOT NULL, finished_at REAL NOT NULL)'
+            )
+            self._schema_ready = True
+        return conn
+
+    def _owner_id(self):
+        # Re-derived after fork so each worker has its own identity
+        if self._owner is None or not self._owner.startswith(f"{os.getpid()}:"):
+            self._owner = f"{os.getpid()}:{id(self)}"
+        return self._owner
+
+    def _try_acquire(self, key):
+        """Take the lease if it is free or expired; returns True when we lead"""
+        now = time.time()
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT expires_at FROM single_flight_leases WHERE key = ?', (key,)
+            ).fetchone()
+            if row is not None and row[0] > now:
+                return False
+            conn.execute(
+                'INSERT OR REPLACE INTO single_flight_leases (key, owner, expires_at) VALUES (?, ?, ?)',
+                (key, self._owner_id(), now + self.lease_seconds)
+            )
+            return True
+        finally:
+            conn.execute('COMMIT')
+
+    def _fetch_result(self, key, since):
+        row = self._conn().execute(
+            'SELECT result FROM single_flight_results WHERE key = ? AND finished_at >= ?',
+            (key, since)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _publish(self, key, result):
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            'INSERT OR REPLACE INTO single_flight_results (key, result, finished_at) VALUES (?, ?, ?)',
+            (key, result, now)
+        )
+        conn.execute('DELETE FROM single_flight_results WHERE finished_at < ?', (now - self.result_ttl,))
+
+    def _release(self, key):
+        self._conn().execute(
+            'DELETE FROM single_flight_leases WHERE key = ? AND owner = ?', (key, self._owner_id())
+        )
+
+    def _remote_step(self, key, since):
+        """
+        One coordination step for a process-local leader
+
+        Returns:
+            tuple: (lead: bool, result or None)
+        """
+        # Check for a published result first: the leader releases right after publishing
+        result = self._fetch_result(key, since)
+        if result is not None:
+            return False, result
+        return self._try_acquire(key), None
+
+    def _finish(self, key, result, error):
+        if not self.cross_process:
+            return
+        try:
+            if error is None:
+                self._publish(key, result)
+            self._release(key)
+        except sqlite3.Error as e:
+            logger.warning('Single-flight release failed: %s', e)
+            self._count('errors')
+
+    # Sync API
+
+    def do(self, key, fn):
+        """
+        Run fn() once for all concurrent callers with the same key
+
+        Args:
+            key: Identity of the call (e.g. the response cache key)
+            fn: Zero-argument callable returning a string
+
+        Returns:
+            str: fn's result, possibly produced by another caller or worker
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            self._count('coalesced_local')
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._lead(key, fn)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _lead(self, key, fn):
+        if self.cross_process:
+            since = time.time()
+            deadline = since + self.lease_seconds
+            try:
+                while True:
+                    lead, result = self._remote_step(key, since)
+                    if lead:
+                        break
+                    if result is not None:
+                        self._count('coalesced_remote')
+                        return result
+                    if time.time() >= deadline:
+                        break
+                    time.sleep(self.poll_interval)
+            except sqlite3.Error as e:
+                logger.warning('Single-flight coordination failed: %s', e)
+                self._count('errors')
+
+        self._count('upstream_calls')
+        result = None
+        error = None
+        try:
+            result = fn()
+            return result
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._finish(key, result, error)
+
+    # Async API (ASGI serving path, one event loop per worker)
+
+    async def ado(self, key, coro_fn):
+        """
+        Async twin of do()
+
+        Args:
+            key: Identity of the call
+            coro_fn: Zero-argument callable returning an awaitable string
+        """
+        future = self._async_calls.get(key)
+        if future is not None:
+            self._count('coalesced_local')
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._async_calls[key] = future
+        try:
+            result = await self._alead(key, coro_fn)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark as retrieved so a leader without followers doesn't log a warning
+            future.exception()
+            raise
+        finally:
+            self._async_calls.pop(key, None)
+
+    async def _alead(self, key, coro_fn):
+        if self.cross_process:
+            since = time.time()
+            deadline = since + self.lease_seconds
+            try:
+                while True:
+                    # SQLite lease work runs on a thread, off the event loop
+                    lead, result = await asyncio.to_thread(self._remote_step, key, since)
+                    if lead:
+                        break
+                    if result is not None:
+                        self._count('coalesced_remote')
+                        return result
+                    if time.time() >= deadline:
+                        break
+                    await asyncio.sleep(self.poll_interval)
+            except sqlite3.Error as e:
+                logger.warning('Single-flight coordination failed: %s', e)
+                self._count('errors')
+
+        self._count('upstream_calls')
+        result = None
+        error = None
+        try:
+            result = await coro_fn()
+            return result
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if self.cross_process:
+                await asyncio.to_thread(self._finish, key, result, error)
+
+
+def enabled_for(blueprint_name):
+    """Whether generations from this blueprint should be coalesced"""
+    return blueprint_name in Config.SINGLE_FLIGHT_BLUEPRINTS
+
+
+single_flight = SingleFlight(
+    cross_process=Config.SINGLE_FLIGHT_CROSS_PROCESS,
+    lease_seconds=Config.SINGLE_FLIGHT_LEASE_SECONDS,
+    poll_interval=Config.SINGLE_FLIGHT_POLL_INTERVAL
+)
@@ -0,0 +1,143 @@
+"""
+Cold-start support
+Times how long the app takes to import and to warm up, and warms each worker
+before it takes traffic: compiles the prompt templates, builds the OpenAI
+client (the slowest import in the service), opens the first upstream
+connection and starts the background job workers.
+
+gunicorn runs warm_up() from post_worker_init (see gunicorn.conf.py), the
+ASGI app runs awarm_up() during lifespan startup, and `python app.py` runs
+warm_up() before app.run. Keep this module's own imports light: app.py
+imports it first so the import timing covers everything else.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from config import Config
+
+logger = logging.getLogger('startup')
+if not logger.handlers:
+    # gunicorn doesn't configure the root logger, so give startup lines their own handler
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+class StartupTimer:
+    """Seconds spent in each startup phase of this process"""
+
+    def __init__(self):
+        # time.monotonic is system-wide on Linux, so workers forked from a
+        # preloaded master can measure from the master's start
+        self.started = time.monotonic()
+        self.import_pid = os.getpid()
+        self._phases = {}
+        self._ready_after = None
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            self._phases[name] = round(seconds, 4)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(name, time.monotonic() - start)
+
+    def mark_ready(self):
+        with self._lock:
+            self._ready_after = round(time.monotonic() - self.started, 4)
+        logger.info(json.dumps(dict(self.stats(), event='startup')))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'preloaded': os.getpid() != self.import_pid,
+                'phases': dict(self._phases),
+                'ready_after_seconds': self._ready_after
+            }
+
+
+startup_timer = StartupTimer()
+
+
+def preload_imports():
+    """Import openai in the gunicorn master so preloaded workers inherit it (no clients, no sockets)"""
+    with startup_timer.phase('preload_imports'):
+        import openai  # noqa: F401
+
+
+def _connected(error):
+    """An HTTP error status still means the connection was opened"""
+    import openai
+    return isinstance(error, openai.APIStatusError)
+
+
+def _prepare():
+    """Warm-up steps shared by the sync and async paths"""
+    from prompt_registry import prompt_registry
+    from jobs import job_queue
+    from metrics import registry
+
+    with startup_timer.phase('compile_prompts'):
+        prompt_registry.refresh()
+    with startup_timer.phase('start_workers'):
+        registry.ensure_flusher()
+        job_queue.ensure_started()
+
+
+def warm_up():
+    """Get this worker ready for its first request; failures are logged, never raised"""
+    if not Config.WARMUP_ENABLED:
+        startup_timer.mark_ready()
+        return
+    from upstream import clients
+
+    try:
+        _prepare()
+        with startup_timer.phase('build_client'):
+            client = clients.client()
+        if Config.WARMUP_CONNECT:
+            with startup_timer.phase('connect_upstream'):
+                try:
+                    # Any answer leaves a kept-alive TLS connection in the pool
+                    client.with_options(timeout=Config.UPSTREAM_CONNECT_TIMEOUT * 2).models.list()
+                except Exception as e:
+                    if not _connected(e):
+                        logger.warning('Warm-up could not reach the AI service: %s', e)
+    except Exception as e:
+        logger.warning('Warm-up failed: %s', e)
+    startup_timer.mark_ready()
+
+
+async def awarm_up():
+    """warm_up for the ASGI serving path; warms the async client on the server's event loop"""
+    if not Config.WARMUP_ENABLED:
+        startup_timer.mark_ready()
+        return
+    from upstream import clients
+
+    try:
+        _prepare()
+        with startup_timer.phase('build_client'):
+            async_client = clients.async_client()
+        if Config.WARMUP_CONNECT:
+            with startup_timer.phase('connect_upstream'):
+                try:
+                    await async_client.with_options(timeout=Config.UPSTREAM_CONNECT_TIMEOUT * 2).models.list()
+                except Exception as e:
+                    if not _connected(e):
+                        logger.warning('Warm-up could not reach the AI service: %s', e)
+    except Exception as e:
+        logger.warning('Warm-up failed: %s', e)
+    startup_timer.mark_ready()
@@ -0,0 +1,69 @@
+"""
+Server-Sent Events helpers for streaming generation endpoints
+"""
+import fast_json
+from flask import Response, stream_with_context
+
+
+def wants_stream(request):
+    """
+    Check whether the client opted into streaming
+    Either ?stream=1 (or true) or an Accept: text/event-stream header
+    """
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+
+def sse_event(event, data):
+    """Format a single SSE event with a JSON data field"""
+    return f"event: {event}\ndata: {fast_json.dumps(data)}\n\n"
+
+
+def sse_response(chunks, build_payload, error_message, on_chunk=None):
+    """
+    Stream generated text to the client as Server-Sent Events
+
+    Events:
+        token: {"text": "..."} for every delta from the model
+        done:  the same JSON payload the non-streaming endpoint returns
+        error: {"success": false, "error": "...", "message": "..."}
+
+    Args:
+        chunks: Iterable of text deltas (e.g. utils.stream_ai_content(...))
+        build_payload: Callable taking the full text and returning (payload, status)
+        error_message: Message used when generation fails mid-stream
+        on_chunk: Optional callable taking each delta and returning extra
+            (event, data) pairs to emit right after its token event
+
+    Returns:
+        Flask Response with mimetype text/event-stream
+    """
+    def generate():
+        # Flush something immediately so proxies and the browser see the first byte
+        yield ': stream open\n\n'
+        parts = []
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                yield sse_event('token', {'text': chunk})
+                if on_chunk:
+                    for event, data in on_chunk(chunk):
+                        yield sse_event(event, data)
+            payload, status = build_payload(''.join(parts).strip())
+            yield sse_event('done' if status < 400 else 'error', payload)
+        except Exception as e:
+            yield sse_event('error', {
+                'success': False,
+                'error': str(e),
+                'message': error_message
+            })
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
@@ -0,0 +1,380 @@
+"""
+Upstream layer for OpenAI calls
+Tuned keep-alive connection pools and timeouts for the shared clients,
+jittered exponential retries for retryable errors only, and a circuit
+breaker that fails fast while OpenAI is degraded instead of letting slow
+calls pile up until gunicorn kills the workers
+
+openai (and httpx under it) is the slowest import in the service, so it is
+only imported when the first client is built; see startup.py
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from flask import jsonify
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class UpstreamUnavailable(Exception):
+    """Raised without calling OpenAI while the circuit breaker is open"""
+
+    def __init__(self, retry_after):
+        self.retry_after = max(1, int(round(retry_after)))
+        super().__init__(f"Upstream AI service is temporarily unavailable, retry in {self.retry_after}s")
+
+
+def _timeout(limit=None):
+    """Client timeouts, each capped at limit seconds when given"""
+    import httpx
+    read, connect = Config.UPSTREAM_READ_TIMEOUT, Config.UPSTREAM_CONNECT_TIMEOUT
+    if limit is not None:
+        read, connect = min(read, limit), min(connect, limit)
+    return httpx.Timeout(read, connect=connect, pool=connect)
+
+
+def _limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=Config.UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections=Config.UPSTREAM_MAX_KEEPALIVE,
+        keepalive_expiry=Config.UPSTREAM_KEEPALIVE_EXPIRY
+    )
+
+
+def build_client():
+    """Sync client; retries are handled by Upstream, not the SDK"""
+    import openai
+    return openai.OpenAI(
+        api_key=Config.OPENAI_API_KEY,
+        base_url=Config.OPENAI_BASE_URL,
+        max_retries=0,
+        timeout=_timeout(),
+        http_client=openai.DefaultHttpxClient(limits=_limits(), timeout=_timeout())
+    )
+
+
+def build_async_client():
+    """Async client for the ASGI serving path"""
+    import openai
+    return openai.AsyncOpenAI(
+        api_key=Config.OPENAI_API_KEY,
+        base_url=Config.OPENAI_BASE_URL,
+        max_retries=0,
+        timeout=_timeout(),
+        http_client=openai.DefaultAsyncHttpxClient(limits=_limits(), timeout=_timeout())
+    )
+
+
+class SharedClients:
+    """
+    This process's OpenAI clients, built on first use
+    Rebuilt after a fork, so workers forked from a preloaded master never share
+    the master's connection pool
+    """
+
+    def __init__(self):
+        self._pid = None
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+
+    def _reset_after_fork(self):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._client = None
+            self._async_client = None
+
+    def client(self):
+        with self._lock:
+            self._reset_after_fork()
+            if self._client is None:
+                self._client = build_client()
+            return self._client
+
+    def async_client(self):
+        with self._lock:
+            self._reset_after_fork()
+            if self._async_client is None:
+                self._async_client = build_async_client()
+            return self._async_client
+
+    async def aclose(self):
+        """Close the async client if this process built one"""
+        with self._lock:
+            async_client = self._async_client if self._pid == os.getpid() else None
+            self._async_client = None
+        if async_client is not None:
+            await async_client.close()
+
+
+def is_retryable(error):
+    """Connection problems, timeouts, 429s and 5xx are worth another attempt"""
+    import openai
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in (408, 409)
+
+
+def _retry_after_header(error):
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Per-worker circuit breaker over a rolling window of upstream attempts
+
+    Closed: calls go through. Opens when at least min_requests attempts in the
+    window failed at error_threshold or more. Open: calls fail immediately for
+    cooldown_seconds. Half-open: one trial call decides between closing again
+    and another cooldown.
+
+    Args:
+        window_seconds: Length of the rolling outcome window
+        min_requests: Attempts needed in the window before the breaker can open
+        error_threshold: Failure fraction (0-1) that opens the breaker
+        cooldown_seconds: How long to fail fast before a trial call
+    """
+
+    def __init__(self, enabled=True, window_seconds=30, min_requests=10, error_threshold=0.5, cooldown_seconds=30):
+        self.enabled = enabled
+        self.window_seconds = window_seconds
+        self.min_requests = min_requests
+        self.error_threshold = error_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._outcomes = deque()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self._stats = {'opened': 0, 'rejected': 0}
+
+    def _trim(self, now):
+        while self._outcomes and self._outcomes[0][0] < now - self.window_seconds:
+            self._outcomes.popleft()
+
+    def before_call(self):
+        """Raise UpstreamUnavailable if the call must not go upstream"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._state == CLOSED:
+                return
+            remaining = self._opened_at + self.cooldown_seconds - time.time()
+            if self._state == OPEN and remaining <= 0:
+                self._state = HALF_OPEN
+            if self._state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            self._stats['rejected'] += 1
+        raise UpstreamUnavailable(max(remaining, 1))
+
+    def record(self, success):
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._trial_in_flight = False
+                if success:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open(now)
+                return
+            self._outcomes.append((now, success))
+            self._trim(now)
+            if self._state == CLOSED and len(self._outcomes) >= self.min_requests:
+                failures = sum(1 for _, ok in self._outcomes if not ok)
+                if failures / len(self._outcomes) >= self.error_threshold:
+                    self._open(now)
+
+    def abandon(self):
+        """A call was cancelled (e.g. a losing hedge) before its outcome was known"""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._trial_in_flight = False
+
+    def _open(self, now):
+        self._state = OPEN
+        self._opened_at = now
+        self._stats['opened'] += 1
+        logger.warning('Upstream circuit breaker opened for %ss', self.cooldown_seconds)
+
+    def snapshot(self):
+        """State and rolling-window counters for this worker"""
+        now = time.time()
+        with self._lock:
+            self._trim(now)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            total = len(self._outcomes)
+            snapshot = {
+                'enabled': self.enabled,
+                'state': self._state,
+                'window_requests': total,
+                'window_error_rate': round(failures / total, 4) if total else 0.0,
+                'times_opened': self._stats['opened'],
+                'rejected': self._stats['rejected']
+            }
+            if self._state != CLOSED:
+                snapshot['retry_after_seconds'] = max(0, round(self._opened_at + self.cooldown_seconds - now, 1))
+        return snapshot
+
+
+class Upstream:
+    """
+    Runs one OpenAI call with retries and the circuit breaker
+
+    Args:
+        breaker: CircuitBreaker consulted before and updated after each attempt
+        max_retries: Extra attempts after the first for retryable errors
+        backoff_base: Seconds for the first backoff (doubles each retry, full jitter)
+        backoff_max: Upper bound for a single backoff
+        budget_seconds: Total time for all attempts, so a request finishes before
+            gunicorn's worker timeout: each attempt's timeouts are capped at the
+            time left, and no retry is started once it has run out
+    """
+
+    def __init__(self, breaker, max_retries=2, backoff_base=0.5, backoff_max=8.0, budget_seconds=100.0):
+        self.breaker = breaker
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.budget_seconds = budget_seconds
+        self._lock = threading.Lock()
+        self._stats = {'attempts': 0, 'retries': 0, 'failures': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _backoff(self, attempt, error):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        retry_after = _retry_after_header(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def _attempt_timeout(self, started):
+        """Timeouts for the next attempt, capped at what is left of the budget"""
+        return _timeout(max(0.1, self.budget_seconds - (time.monotonic() - started)))
+
+    def _next_delay(self, attempt, error, started):
+        """Backoff before the next attempt, or None when the error should be raised"""
+        if not is_retryable(error) or attempt >= self.max_retries:
+            return None
+        delay = self._backoff(attempt, error)
+        if time.monotonic() - started + delay >= self.budget_seconds:
+            return None
+        return delay
+
+    def _attempt_finished(self, error):
+        # Non-retryable errors (bad request, auth) mean OpenAI itself is up
+        self.breaker.record(success=error is None or not is_retryable(error))
+        if error is not None:
+            self._count('failures')
+
+    def call(self, fn):
+        """
+        Call fn(timeout) (one chat.completions.create) with retries; timeout
+        must be passed on to the request
+
+        Raises:
+            UpstreamUnavailable: While the breaker is open
+            openai.OpenAIError: The last error once retries are exhausted
+        """
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            self._count('attempts')
+            try:
+                result = fn(self._attempt_timeout(started))
+            except Exception as e:
+                self._attempt_finished(e)
+                delay = self._next_delay(attempt, e, started)
+                if delay is None:
+                    raise
+                logger.info('Retrying upstream call in %.2fs after %s', delay, type(e).__name__)
+                self._count('retries')
+                attempt += 1
+                time.sleep(delay)
+                continue
+            self._attempt_finished(None)
+            return result
+
+    async def acall(self, coro_fn):
+        """Async variant of call; coro_fn(timeout) returns a fresh awaitable per attempt"""
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            self._count('attempts')
+            try:
+                result = await coro_fn(self._attempt_timeout(started))
+            except asyncio.CancelledError:
+                self.breaker.abandon()
+                raise
+            except Exception as e:
+                self._attempt_finished(e)
+                delay = self._next_delay(attempt, e, started)
+                if delay is None:
+                    raise
+                logger.info('Retrying upstream call in %.2fs after %s', delay, type(e).__name__)
+                self._count('retries')
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            self._attempt_finished(None)
+            return result
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['breaker'] = self.breaker.snapshot()
+        return stats
+
+
+def unavailable_response(error):
+    """503 + Retry-After for a request rejected by the open breaker"""
+    response = jsonify({
+        'success': False,
+        'error': str(error),
+        'message': 'The AI service is temporarily unavailable. Please try again shortly.'
+    })
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+
+breaker = CircuitBreaker(
+    enabled=Config.BREAKER_ENABLED,
+    window_seconds=Config.BREAKER_WINDOW_SECONDS,
+    min_requests=Config.BREAKER_MIN_REQUESTS,
+    error_threshold=Config.BREAKER_ERROR_THRESHOLD,
+    cooldown_seconds=Config.BREAKER_COOLDOWN_SECONDS
+)
+
+upstream = Upstream(
+    breaker,
+    max_retries=Config.UPSTREAM_MAX_RETRIES,
+    backoff_base=Config.UPSTREAM_BACKOFF_BASE,
+    backoff_max=Config.UPSTREAM_BACKOFF_MAX,
+    budget_seconds=Config.UPSTREAM_BUDGET_SECONDS
+)
+
+clients = SharedClients()
@@ -0,0 +1,268 @@
+"""
+Token usage ledger
+Records every completion's prompt, cached and completion tokens, latency,
+model and estimated cost, attributed to the endpoint, communication pillar
+and access code (hashed, as for jobs) that asked for it.
+
+Calls are summed in memory into hourly rows and upserted into SQLite under
+Config.DATA_DIR every few seconds, so the ledger stays one row per
+(hour, endpoint, pillar, owner, model) however busy the service is, and
+every worker on the instance shares it. summary() answers the aggregate
+queries; spend_today() feeds the budget check in model_routing.py.
+"""
+import atexit
+import logging
+import sqlite3
+import threading
+import time
+from config import Config
+from local_store import get_connection
+from jobs import current_owner
+from metrics import registry, record_usage, current_endpoint, current_pillar
+
+logger = logging.getLogger(__name__)
+
+LEDGER_DB = 'usage.db'
+
+# USD per 1M tokens: (prompt, cached prompt, completion); matched by longest prefix
+MODEL_PRICES = {
+    'gpt-4o-mini': (0.15, 0.075, 0.60),
+    'gpt-4o': (2.50, 1.25, 10.00),
+    'gpt-4.1-nano': (0.10, 0.025, 0.40),
+    'gpt-4.1-mini': (0.40, 0.10, 1.60),
+    'gpt-4.1': (2.00, 0.50, 8.00),
+}
+
+GROUP_COLUMNS = {
+    'endpoint': 'endpoint',
+    'pillar': 'pillar',
+    'owner': 'owner',
+    'model': 'model',
+    'day': "date(hour * 3600, 'unixepoch')",
+    'hour': 'hour * 3600',
+}
+
+UPSTREAM_COST = registry.counter(
+    'rockma_upstream_cost_usd_total', 'Estimated OpenAI spend from reported token usage', ('endpoint', 'model')
+)
+
+_FIELDS = ('calls', 'prompt_tokens', 'cached_tokens', 'completion_tokens', 'latency_ms', 'cost_usd')
+
+
+def price_for(model):
+    """(prompt, cached, completion) USD per 1M tokens, or None for an unknown model"""
+    matches = [name for name in MODEL_PRICES if model == name or model.startswith(name + '-')]
+    return MODEL_PRICES[max(matches, key=len)] if matches else None
+
+
+def estimate_cost(model, prompt_tokens, cached_tokens, completion_tokens):
+    prices = price_for(model)
+    if prices is None:
+        return 0.0
+    prompt_price, cached_price, completion_price = prices
+    return (
+        (prompt_tokens - cached_tokens) * prompt_price
+        + cached_tokens * cached_price
+        + completion_tokens * completion_price
+    ) / 1_000_000
+
+
+def _day_start(now):
+    """Start of the current UTC day, as an epoch hour"""
+    return int(now // 86400) * 24
+
+
+class UsageLedger:
+    """
+    Args:
+        enabled: When False only the Prometheus counters are updated
+        flush_interval: Seconds between writes of the in-memory rows
+        retention_days: Hourly rows older than this are deleted
+    """
+
+    def __init__(self, enabled=True, flush_interval=5.0, retention_days=90):
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.time()
+        self._last_prune = 0.0
+        self._spend_cache = (0.0, None, 0.0)
+        self._schema_ready = False
+        atexit.register(self.flush)
+
+    def _conn(self):
+        conn = get_connection(LEDGER_DB)
+        if not self._schema_ready:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS usage_hourly ('
+                'hour INTEGER NOT NULL, endpoint TEXT NOT NULL, pillar TEXT NOT NULL, '
+                'owner TEXT NOT NULL, model TEXT NOT NULL, calls INTEGER NOT NULL, '
+                'prompt_tokens INTEGER NOT NULL, cached_tokens INTEGER NOT NULL, '
+                'completion_tokens INTEGER NOT NULL, latency_ms INTEGER NOT NULL, cost_usd REAL NOT NULL, '
+                'PRIMARY KEY (hour, endpoint, pillar, owner, model)) WITHOUT ROWID'
+            )
+            self._schema_ready = True
+        return conn
+
+    def record(self, model, usage, seconds):
+        """
+        Account one completion (response.usage, or a stream's final usage chunk)
+
+        Args:
+            model: Model the request was sent to
+            usage: OpenAI usage object, or None when the API didn't report it
+            seconds: Upstream latency of the call
+        """
+        if usage is None:
+            return
+        endpoint = current_endpoint()
+        record_usage(model, usage, endpoint=endpoint)
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached_tokens = (getattr(details, 'cached_tokens', 0) or 0) if details is not None else 0
+        cost = estimate_cost(model, prompt_tokens, cached_tokens, completion_tokens)
+        registry.inc(UPSTREAM_COST, {'endpoint': endpoint, 'model': model}, cost)
+        if not self.enabled:
+            return
+
+        now = time.time()
+        key = (int(now // 3600), endpoint, current_pillar() or '', current_owner() or '', model)
+        with self._lock:
+            row = self._pending.get(key)
+            if row is None:
+                row = self._pending[key] = [0, 0, 0, 0, 0, 0.0]
+            for index, amount in enumerate((1, prompt_tokens, cached_tokens, completion_tokens, int(seconds * 1000), cost)):
+                row[index] += amount
+        if now - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Upsert the in-memory rows; they are kept for the next flush if SQLite is unavailable"""
+        if not self.enabled:
+            return
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._last_flush = time.time()
+            if not pending:
+                return
+            try:
+                conn = self._conn()
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    conn.executemany(
+                        f'INSERT INTO usage_hourly (hour, endpoint, pillar, owner, model, {", ".join(_FIELDS)}) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (hour, endpoint, pillar, owner, model) '
+                        f'DO UPDATE SET {", ".join(f"{field} = {field} + excluded.{field}" for field in _FIELDS)}',
+                        [key + tuple(row) for key, row in pending.items()]
+                    )
+                    if time.time() - self._last_prune >= 3600:
+                        self._last_prune = time.time()
+                        conn.execute(
+                            'DELETE FROM usage_hourly WHERE hour < ?',
+                            (int(time.time() // 3600) - self.retention_days * 24,)
+                        )
+                    conn.execute('COMMIT')
+                    # Re-read the shared spend next time instead of trusting the cached total
+                    self._spend_cache = (0.0, None, 0.0)
+                except sqlite3.Error:
+                    conn.execute('ROLLBACK')
+                    raise
+            except sqlite3.Error as e:
+                logger.warning('Usage ledger flush failed: %s', e)
+                with self._lock:
+                    for key, row in pending.items():
+                        merged = self._pending.setdefault(key, [0, 0, 0, 0, 0, 0.0])
+                        for index, amount in enumerate(row):
+                            merged[index] += amount
+
+    def spend_today(self, max_age=None):
+        """
+        Estimated USD spent since midnight UTC by every worker on the instance:
+        the shared ledger (re-read at most every max_age seconds) plus this
+        worker's unflushed calls
+        """
+        max_age = self.flush_interval if max_age is None else max_age
+        now = time.time()
+        day = _day_start(now)
+        read_at, cached_day, stored = self._spend_cache
+        if cached_day != day or now - read_at >= max_age:
+            try:
+                stored = self._conn().execute(
+                    'SELECT COALESCE(SUM(cost_usd), 0) FROM usage_hourly WHERE hour >= ?', (day,)
+                ).fetchone()[0]
+            except sqlite3.Error:
+                stored = 0.0 if cached_day != day else stored
+            self._spend_cache = (now, day, stored)
+        with self._lock:
+            pending = sum(row[5] for key, row in self._pending.items() if key[0] >= day)
+        return stored + pending
+
+    def summary(self, group_by=('endpoint',), since=None, until=None, owner=None):
+        """
+        Aggregate usage
+
+        Args:
+            group_by: Names from GROUP_COLUMNS
+            since: Epoch seconds (inclusive, rounded down to the hour)
+            until: Epoch seconds (exclusive)
+            owner: Only this owner's usage
+
+        Returns:
+            list: One dict per group with calls, token totals, avgLatencyMs and costUsd
+        """
+        self.flush()
+        clauses, params = [], []
+        if since is not None:
+            clauses.append('hour >= ?')
+            params.append(int(since // 3600))
+        if until is not None:
+            clauses.append('hour < ?')
+            params.append(int(until // 3600))
+        if owner is not None:
+            clauses.append('owner = ?')
+            params.append(owner)
+        where = f'WHERE {" AND ".join(clauses)}' if clauses else ''
+        columns = [GROUP_COLUMNS[name] for name in group_by]
+        select = ', '.join([f'{column} AS {name}' for name, column in zip(group_by, columns)] + [
+            f'SUM({field})' for field in _FIELDS
+        ])
+        group = f'GROUP BY {", ".join(columns)}' if columns else ''
+        # Time series read in order, everything else biggest spender first
+        order = ', '.join(columns) if {'day', 'hour'} & set(group_by) else 'SUM(cost_usd) DESC'
+        rows = self._conn().execute(
+            f'SELECT {select} FROM usage_hourly {where} {group} ORDER BY {order}', params
+        ).fetchall()
+
+        results = []
+        for row in rows:
+            keys, (calls, prompt_tokens, cached_tokens, completion_tokens, latency_ms, cost) = row[:len(group_by)], row[len(group_by):]
+            if not calls:
+                continue
+            entry = {name: (value if value != '' else None) for name, value in zip(group_by, keys)}
+            entry.update({
+                'calls': calls,
+                'promptTokens': prompt_tokens,
+                'cachedTokens': cached_tokens,
+                'completionTokens': completion_tokens,
+                'avgLatencyMs': round(latency_ms / calls),
+                'costUsd': round(cost, 6)
+            })
+            results.append(entry)
+        return results
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {'enabled': self.enabled, 'pending_rows': pending, 'spend_today_usd': round(self.spend_today(), 6)}
+
+
+usage_ledger = UsageLedger(
+    enabled=Config.USAGE_LEDGER_ENABLED,
+    flush_interval=Config.USAGE_FLUSH_SECONDS,
+    retention_days=Config.USAGE_RETENTION_DAYS
+)
@@ -1,42 +1,285 @@
 """
 Shared utility functions for AI operations
 """
-from openai import OpenAI
+import asyncio
 from config import Config
-from ai_persona import get_base_system_prompt
+from prompt_registry import prompt_registry
+from response_cache import response_cache, make_cache_key
+from single_flight import single_flight
+from metrics import time_upstream
+from model_routing import model_router
+from usage_ledger import usage_ledger
+from server_timing import phase
+from upstream import upstream, clients, UpstreamUnavailable
+from hedging import hedger
 
-# Initialize OpenAI client
-client = OpenAI(api_key=Config.OPENAI_API_KEY)
+# OpenAI clients (the async one is used by the ASGI serving path) are built per
+# process on first use; pool limits, timeouts and retries are configured in upstream.py
 
-def generate_ai_content(user_prompt, system_prompt_override=None, model="gpt-4o-mini", temperature=0.7):
+def _lookup_cache(system_prompt, user_prompt, model, temperature, use_cache, response_format=None):
+    """
+    Check the response cache before calling OpenAI
+    
+    Returns:
+        tuple: (cache_key or None, cached content or None)
+    """
+    if not (use_cache and response_cache.enabled):
+        return None, None
+    cache_key = make_cache_key(system_prompt, user_prompt, model, temperature, response_format)
+    return cache_key, response_cache.get(cache_key)
+
+def _chat_request(system_prompt, user_prompt, model, temperature, response_format=None, stream=False):
+    """Keyword arguments for chat.completions.create"""
+    request = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        "temperature": temperature
+    }
+    if response_format:
+        request["response_format"] = response_format
+    if stream:
+        request["stream"] = True
+        # The final chunk then carries usage, including cached prompt tokens
+        request["stream_options"] = {"include_usage": True}
+    return request
+
+def _has_content(chunk):
+    return bool(chunk.choices and chunk.choices[0].delta.content)
+
+async def _next_chunk(chunks):
+    """Next chunk of an async stream, or None at the end"""
+    try:
+        return await chunks.__anext__()
+    except StopAsyncIteration:
+        return None
+
+def _record_lost_hedges(model, lost, usage, seconds):
+    """
+    Account the hedge calls that lost the race (see hedging.Hedger.run). A call
+    cancelled in flight reports no usage, so it is charged like the winner:
+    an upper bound, so daily spend and the budget fallback never undercount
+    """
+    for result in lost:
+        usage_ledger.record(model, getattr(result, 'usage', None) or usage, seconds)
+
+def _hedged_stream(request, model, lost):
+    """
+    Open a completion stream, hedging on time to first token, then relay its
+    chunks from the hedger's background loop; streams that lost the race are
+    appended to lost
+    """
+    async def open_stream(api):
+        stream = await upstream.acall(lambda timeout: api.chat.completions.create(**request, timeout=timeout))
+        chunks = stream.__aiter__()
+        buffered = []
+        try:
+            # The first chunk usually only carries the role; wait for real content
+            while not (buffered and _has_content(buffered[-1])):
+                chunk = await _next_chunk(chunks)
+                if chunk is None:
+                    break
+                buffered.append(chunk)
+        except BaseException:
+            await stream.close()
+            raise
+        return stream, chunks, buffered
+    
+    async def close(opened):
+        await opened[0].close()
+    
+    stream, chunks, buffered = hedger.run_sync(f"{model}:ttft", open_stream, discard=close, on_lost=lost.append)
+    try:
+        yield from buffered
+        while True:
+            chunk = hedger.call_sync(_next_chunk(chunks))
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        hedger.call_sync(stream.close())
+
+def generate_ai_content(user_prompt, system_prompt_override=None, model=None, temperature=0.7, use_cache=True, coalesce=False,
+                        response_format=None, hedge=False):
     """
     Generic function to generate AI content using OpenAI
     
     Args:
         user_prompt: The user's prompt/request
-        system_prompt_override: Optional custom system prompt (defaults to RockMa persona)
-        model: OpenAI model to use (default: gpt-4o-mini for cost efficiency)
+        system_prompt_override: Optional static system prompt (defaults to the shared
+            persona prefix, see prompt_registry); keep per-request
+            values in user_prompt so OpenAI's prompt-prefix cache can hit
+        model: OpenAI model to use (default: the route's model from model_routing,
+            or its cheaper fallback under budget or load pressure)
         temperature: Creativity level (0-1, default: 0.7)
+        use_cache: Serve/store identical generations from the response cache
+            (disable for routes that need a fresh answer every time)
+        coalesce: Share one upstream call between identical in-flight requests
+        response_format: Optional OpenAI response_format for JSON / schema output
+        hedge: Fire a second identical call if the first is slower than recent
+            latencies, and use whichever answers first (see hedging.py)
     
     Returns:
         str: Generated content from AI
     """
-    system_prompt = system_prompt_override if system_prompt_override else get_base_system_prompt()
+    with phase('prompt'):
+        system_prompt = system_prompt_override if system_prompt_override else prompt_registry.system_prompt()
+        model = model or model_router.choose()
     
-    try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=temperature
+    with phase('cache'):
+        cache_key, cached = _lookup_cache(system_prompt, user_prompt, model, temperature, use_cache, response_format)
+    if cached is not None:
+        return cached
+    
+    def produce():
+        try:
+            request = _chat_request(system_prompt, user_prompt, model, temperature, response_format)
+            lost = []
+            with time_upstream(model), model_router.track(model) as call:
+                if hedge:
+                    response = hedger.run_sync(
+                        model, lambda api: upstream.acall(lambda timeout: api.chat.completions.create(**request, timeout=timeout)),
+                        on_lost=lost.append
+                    )
+                else:
+                    client = clients.client()
+                    response = upstream.call(lambda timeout: client.chat.completions.create(**request, timeout=timeout))
+            
+            usage_ledger.record(model, response.usage, call.elapsed())
+            _record_lost_hedges(model, lost, response.usage, call.elapsed())
+            content = response.choices[0].message.content.strip()
+        
+        except UpstreamUnavailable:
+            raise
+        except Exception as e:
+            raise Exception(f"AI generation failed: {str(e)}")
+        
+        if cache_key:
+            response_cache.set(cache_key, content)
+        
+        return content
+    
+    # Includes time spent waiting on a coalesced leader
+    with phase('upstream'):
+        if coalesce:
+            flight_key = cache_key or make_cache_key(system_prompt, user_prompt, model, temperature, response_format)
+            return single_flight.do(flight_key, produce)
+        return produce()
+
+async def agenerate_ai_content(user_prompt, system_prompt_override=None, model=None, temperature=0.7, use_cache=True, coalesce=False,
+                               response_format=None, hedge=False):
+    """
+    Async variant of generate_ai_content for the ASGI serving path
+    Awaits the AsyncOpenAI client so the event loop can serve other requests
+    
+    Args:
+        Same as generate_ai_content
+    
+    Returns:
+        str: Generated content from AI
+    """
+    with phase('prompt'):
+        system_prompt = system_prompt_override if system_prompt_override else prompt_registry.system_prompt()
+        model = model or model_router.choose()
+    
+    # The response cache and usage ledger are SQLite-backed; their calls run on a thread
+    with phase('cache'):
+        cache_key, cached = await asyncio.to_thread(
+            _lookup_cache, system_prompt, user_prompt, model, temperature, use_cache, response_format
         )
+    if cached is not None:
+        return cached
+    
+    async def produce():
+        try:
+            request = _chat_request(system_prompt, user_prompt, model, temperature, response_format)
+            
+            async_client = clients.async_client()
+            
+            def create():
+                return upstream.acall(lambda timeout: async_client.chat.completions.create(**request, timeout=timeout))
+            
+            lost = []
+            with time_upstream(model), model_router.track(model) as call:
+                response = await (hedger.run(model, create, on_lost=lost.append) if hedge else create())
+            
+            seconds = call.elapsed()
+            await asyncio.to_thread(usage_ledger.record, model, response.usage, seconds)
+            await asyncio.to_thread(_record_lost_hedges, model, lost, response.usage, seconds)
+            content = response.choices[0].message.content.strip()
+        
+        except UpstreamUnavailable:
+            raise
+        except Exception as e:
+            raise Exception(f"AI generation failed: {str(e)}")
+        
+        if cache_key:
+            await asyncio.to_thread(response_cache.set, cache_key, content)
         
-        return response.choices[0].message.content.strip()
+        return content
     
+    with phase('upstream'):
+        if coalesce:
+            flight_key = cache_key or make_cache_key(system_prompt, user_prompt, model, temperature, response_format)
+            return await single_flight.ado(flight_key, produce)
+        return await produce()
+
+def stream_ai_content(user_prompt, system_prompt_override=None, model=None, temperature=0.7, use_cache=True,
+                      response_format=None, hedge=False):
+    """
+    Streaming variant of generate_ai_content
+    
+    Yields text deltas as they arrive from OpenAI. A cache hit is yielded as a
+    single chunk, and a completed stream is written back to the cache.
+    
+    Args:
+        Same as generate_ai_content
+    
+    Yields:
+        str: Pieces of generated content in order
+    """
+    with phase('prompt'):
+        system_prompt = system_prompt_override if system_prompt_override else prompt_registry.system_prompt()
+        model = model or model_router.choose()
+    
+    with phase('cache'):
+        cache_key, cached = _lookup_cache(system_prompt, user_prompt, model, temperature, use_cache, response_format)
+    if cached is not None:
+        yield cached
+        return
+    
+    parts = []
+    try:
+        request = _chat_request(system_prompt, user_prompt, model, temperature, response_format, stream=True)
+        lost = []
+        with time_upstream(model), model_router.track(model) as call:
+            # Only opening the stream is retried/hedged; a stream that fails midway can't be replayed
+            if hedge:
+                stream = _hedged_stream(request, model, lost)
+            else:
+                client = clients.client()
+                stream = upstream.call(lambda timeout: client.chat.completions.create(**request, timeout=timeout))
+            
+            for chunk in stream:
+                if chunk.usage:
+                    usage_ledger.record(model, chunk.usage, call.elapsed())
+                    _record_lost_hedges(model, lost, chunk.usage, call.elapsed())
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+    
+    except UpstreamUnavailable:
+        raise
     except Exception as e:
         raise Exception(f"AI generation failed: {str(e)}")
+    
+    if cache_key:
+        response_cache.set(cache_key, ''.join(parts).strip())
 
 def validate_request_data(data, required_fields):
     """